@@ -0,0 +1,373 @@
+"""
+Async counterparts of the functions in `backend.database`.
+
+Each function runs its sync counterpart through `AsyncSession.run_sync`,
+so the queries are the same but are awaited on an async driver
+(aiosqlite or asyncpg) instead of holding a threadpool worker. Functions
+that stream results have no sync counterpart.
+"""
+
+import os
+from datetime import date
+from typing import Collection, Sequence
+
+from sqlalchemy import Row, select
+from sqlalchemy.sql import Select
+from sqlalchemy.ext.asyncio import AsyncResult, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import database as db
+from backend.pool import get_pool_options
+from backend.entities import (
+    AnimalFacets,
+    AnimalInDB,
+    AnimalCreate,
+    AnimalSearch,
+    AnimalUpdate,
+    FosterInDB,
+    StatsResponse,
+    UserInDB,
+    UserUpdate,
+    Foster,
+)
+
+
+def get_db_url(db_url: str | None = None):
+    """
+    Get the URL of a database for its async driver.
+
+    :param db_url: sync URL of the database, defaults to the application's
+    :return: the URL with the asyncpg or aiosqlite driver
+    """
+
+    db_url = db_url or db.get_db_url()
+    if db_url.startswith("postgresql://"):
+        return db_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+    return db_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+
+def get_engine():
+    echo = os.environ.get("DB_DEBUG", default="False").lower() in ("true", "1", "t")
+    connect_args = {}
+    statement_timeout = os.environ.get("DB_STATEMENT_TIMEOUT")  # milliseconds
+    if os.environ.get("DB_LOCATION") == "rds" and statement_timeout:
+        connect_args["server_settings"] = {"statement_timeout": str(int(statement_timeout))}
+
+    return create_async_engine(
+        get_db_url(),
+        echo=echo,
+        connect_args=connect_args,
+        **get_pool_options(is_async=True),
+    )
+
+
+engine = get_engine()
+
+
+async def get_session():
+    # objects are serialized after the endpoint commits, which must not
+    # trigger a lazy reload outside of the session's greenlet
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+
+
+#   -------- table versions --------   #
+
+
+async def get_table_versions(session: AsyncSession, *table_names: str) -> dict[str, int]:
+    """Async version of `database.get_table_versions`."""
+    return await session.run_sync(db.get_table_versions, *table_names)
+
+
+async def bump_table_versions(session: AsyncSession, *table_names: str):
+    """Async version of `database.bump_table_versions`."""
+    await session.run_sync(db.bump_table_versions, *table_names)
+
+
+#   -------- animals --------   #
+
+
+async def get_all_animals(session: AsyncSession) -> list[AnimalInDB]:
+    """Async version of `database.get_all_animals`."""
+    return await session.run_sync(db.get_all_animals)
+
+
+async def get_animals_page(
+    session: AsyncSession,
+    *,
+    sort: str = "name",
+    intake_after: date | None = None,
+    intake_before: date | None = None,
+    cursor: str | None = None,
+    limit: int = 100,
+) -> tuple[list[Row], str | None]:
+    """Async version of `database.get_animals_page`."""
+    return await session.run_sync(
+        db.get_animals_page,
+        sort=sort,
+        intake_after=intake_after,
+        intake_before=intake_before,
+        cursor=cursor,
+        limit=limit,
+    )
+
+
+async def count_animals(
+    session: AsyncSession,
+    *,
+    intake_after: date | None = None,
+    intake_before: date | None = None,
+) -> int:
+    """Async version of `database.count_animals`."""
+    return await session.run_sync(
+        db.count_animals,
+        intake_after=intake_after,
+        intake_before=intake_before,
+    )
+
+
+async def search_animals(
+    session: AsyncSession,
+    search: AnimalSearch,
+    *,
+    sort: str = "name",
+    cursor: str | None = None,
+    limit: int = 20,
+) -> tuple[list[Row], str | None, int, AnimalFacets]:
+    """Async version of `database.search_animals`."""
+    return await session.run_sync(
+        db.search_animals,
+        search,
+        sort=sort,
+        cursor=cursor,
+        limit=limit,
+    )
+
+
+async def create_animal(
+    session: AsyncSession,
+    animal_create: AnimalCreate,
+) -> AnimalInDB:
+    """Async version of `database.create_animal`."""
+    return await session.run_sync(db.create_animal, animal_create)
+
+
+async def insert_animals(
+    session: AsyncSession,
+    animal_creates: list[AnimalCreate],
+) -> int:
+    """Async version of `database.insert_animals`."""
+    return await session.run_sync(db.insert_animals, animal_creates)
+
+
+async def stream_animals(
+    session: AsyncSession,
+    statement: Select | None = None,
+    batch_size: int = 1000,
+) -> AsyncResult:
+    """
+    Stream animals from a server-side cursor.
+
+    Rows are plain column tuples fetched `batch_size` at a time, so the
+    full table is never held in memory.
+
+    :param statement: select of `database.ANIMAL_COLUMNS`, eg from
+        `database.select_animals`; defaults to every animal ordered by id
+    :param batch_size: number of rows fetched from the cursor at once
+    :return: async result to iterate over
+    """
+
+    if statement is None:
+        statement = select(*db.ANIMAL_COLUMNS).order_by(AnimalInDB.id)
+    return await session.stream(statement.execution_options(yield_per=batch_size))
+
+
+async def get_animals_by_ids(
+    session: AsyncSession,
+    animal_ids: Sequence[int],
+) -> tuple[list[Row], list[int]]:
+    """Async version of `database.get_animals_by_ids`."""
+    return await session.run_sync(db.get_animals_by_ids, animal_ids)
+
+
+async def get_animal_by_id(session: AsyncSession, animal_id: int) -> AnimalInDB:
+    """Async version of `database.get_animal_by_id`."""
+    return await session.run_sync(db.get_animal_by_id, animal_id)
+
+
+async def update_animal(
+    session: AsyncSession,
+    animal_id: int,
+    animal_update: AnimalUpdate,
+    *,
+    versions: Collection[int] | None = None,
+) -> AnimalInDB:
+    """Async version of `database.update_animal`."""
+    return await session.run_sync(
+        db.update_animal, animal_id, animal_update, versions=versions
+    )
+
+
+async def delete_animal(
+    session: AsyncSession,
+    animal_id: int,
+    *,
+    versions: Collection[int] | None = None,
+):
+    """Async version of `database.delete_animal`."""
+    await session.run_sync(db.delete_animal, animal_id, versions=versions)
+
+
+async def get_foster_count(session: AsyncSession, user_id: int) -> int:
+    """Async version of `database.get_foster_count`."""
+    return await session.run_sync(db.get_foster_count, user_id)
+
+
+async def get_user_pets(session: AsyncSession, user_id: int) -> list[Row]:
+    """Async version of `database.get_user_pets`."""
+    return await session.run_sync(db.get_user_pets, user_id)
+
+
+async def get_fosters(session: AsyncSession, user_id: int) -> list[Foster]:
+    """Async version of `database.get_fosters`."""
+    return await session.run_sync(db.get_fosters, user_id)
+
+
+async def stream_fosters(
+    session: AsyncSession,
+    user_id: int,
+    batch_size: int = 1000,
+) -> AsyncResult:
+    """
+    Stream the animals fostered by a user, with the foster period.
+
+    :param user_id: id of the fostering user
+    :param batch_size: number of rows fetched from the cursor at once
+    :return: async result of `database.ANIMAL_COLUMNS` followed by
+        `start_date` and `end_date`
+    """
+
+    statement = (
+        select(*db.ANIMAL_COLUMNS, FosterInDB.start_date, FosterInDB.end_date)
+        .join(FosterInDB, FosterInDB.animal_id == AnimalInDB.id)
+        .where(FosterInDB.user_id == user_id)
+        .order_by(FosterInDB.start_date, AnimalInDB.id)
+        .execution_options(yield_per=batch_size)
+    )
+    return await session.stream(statement)
+
+
+#   -------- users --------   #
+
+
+async def create_user(
+    session: AsyncSession,
+    *,
+    username: str,
+    email: str,
+    hashed_password: str,
+) -> UserInDB:
+    """Async version of `database.create_user`."""
+    return await session.run_sync(
+        db.create_user,
+        username=username,
+        email=email,
+        hashed_password=hashed_password,
+    )
+
+
+async def get_all_users(session: AsyncSession) -> list[Row]:
+    """Async version of `database.get_all_users`."""
+    return await session.run_sync(db.get_all_users)
+
+
+async def get_users_by_ids(
+    session: AsyncSession,
+    user_ids: Sequence[int],
+) -> tuple[list[Row], list[int]]:
+    """Async version of `database.get_users_by_ids`."""
+    return await session.run_sync(db.get_users_by_ids, user_ids)
+
+
+async def stream_users(session: AsyncSession, batch_size: int = 1000) -> AsyncResult:
+    """
+    Stream every user from a server-side cursor, ordered by id.
+
+    :param batch_size: number of rows fetched from the cursor at once
+    :return: async result of `database.USER_COLUMNS`
+    """
+
+    statement = (
+        select(*db.USER_COLUMNS)
+        .order_by(UserInDB.id)
+        .execution_options(yield_per=batch_size)
+    )
+    return await session.stream(statement)
+
+
+async def get_user_by_id(session: AsyncSession, user_id: int) -> UserInDB:
+    """Async version of `database.get_user_by_id`."""
+    return await session.run_sync(db.get_user_by_id, user_id)
+
+
+async def get_user_with_relations(
+    session: AsyncSession,
+    user_id: int,
+    include: set[str],
+) -> UserInDB:
+    """Async version of `database.get_user_with_relations`."""
+    return await session.run_sync(db.get_user_with_relations, user_id, include)
+
+
+async def update_user(
+    session: AsyncSession,
+    user_id: int,
+    user_update: UserUpdate,
+    *,
+    hashed_password: str | None = None,
+) -> UserInDB:
+    """Async version of `database.update_user`."""
+    return await session.run_sync(
+        db.update_user, user_id, user_update, hashed_password=hashed_password
+    )
+
+
+async def delete_user(session: AsyncSession, user_id: int):
+    """Async version of `database.delete_user`."""
+    await session.run_sync(db.delete_user, user_id)
+
+
+#   -------- refresh tokens --------   #
+
+
+async def create_refresh_token(
+    session: AsyncSession,
+    user_id: int,
+    token_hash: str,
+    *,
+    ttl: float,
+):
+    """Async version of `database.create_refresh_token`."""
+    await session.run_sync(db.create_refresh_token, user_id, token_hash, ttl=ttl)
+
+
+async def rotate_refresh_token(
+    session: AsyncSession,
+    token_hash: str,
+    new_token_hash: str,
+    *,
+    ttl: float,
+) -> int | None:
+    """Async version of `database.rotate_refresh_token`."""
+    return await session.run_sync(
+        db.rotate_refresh_token, token_hash, new_token_hash, ttl=ttl
+    )
+
+
+#   -------- stats --------   #
+
+
+async def get_stats(session: AsyncSession, *, user_limit: int = 100) -> StatsResponse:
+    """Async version of `database.get_stats`."""
+    return await session.run_sync(db.get_stats, user_limit=user_limit)
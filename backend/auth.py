@@ -1,22 +1,36 @@
+import asyncio
+import functools
+import hashlib
+import multiprocessing
 import os
+import secrets
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Form, HTTPException
 from fastapi.security import (
     OAuth2PasswordBearer,
     OAuth2PasswordRequestForm,
 )
-from jose import ExpiredSignatureError, JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel, ValidationError
-from sqlmodel import Session, SQLModel, select
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from backend import async_database as adb
 from backend import database as db
 from backend.entities import User, UserInDB
+from backend.metrics import PASSWORD_HASH_DURATION
+from backend.ratelimit import limit_client, limit_login
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+bcrypt_rounds = int(os.environ.get("BCRYPT_ROUNDS", default="12"))
+password_workers = int(
+    os.environ.get("PASSWORD_WORKERS", default=str(min(4, os.cpu_count() or 1)))
+)
 access_token_duration = 3600  # seconds
+refresh_token_duration = 30 * 24 * 3600  # seconds, from the last refresh
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 jwt_key = os.environ.get("JWT_KEY", default="insecure-jwt-key-for-dev")
 jwt_alg = "HS256"
@@ -38,6 +52,7 @@ class AccessToken(BaseModel):
     access_token: str
     token_type: str
     expires_in: int
+    refresh_token: str
 
 
 class Claims(BaseModel):
@@ -82,6 +97,14 @@ class ExpiredToken(AuthException):
         )
 
 
+class InvalidRefreshToken(AuthException):
+    def __init__(self):
+        super().__init__(
+            error="invalid_grant",
+            description="invalid or expired refresh token",
+        )
+
+
 class DuplicateValueException(HTTPException):
     def __init__(self, field: str, value: str):
         super().__init__(
@@ -95,114 +118,283 @@ class DuplicateValueException(HTTPException):
         )
 
 
-def get_current_user(
-    session: Session = Depends(db.get_session),
+async def get_current_user(
+    session: AsyncSession = Depends(adb.get_session),
     token: str = Depends(oauth2_scheme),
 ) -> UserInDB:
     """FastAPI dependency to get current user from bearer token."""
-    user = _decode_access_token(session, token)
+    user = await _get_cached_user(session, token)
+    if user is None:
+        user = await _decode_access_token(session, token)
     return user
 
 
-@auth_router.post("/registration", response_model=User)
-def register_new_user(
+@auth_router.post(
+    "/registration",
+    response_model=User,
+    dependencies=[Depends(limit_client)],
+)
+async def register_new_user(
     registration: UserRegistration,
-    # session: Session = Depends(db.get_session),
-    session: Annotated[Session, Depends(db.get_session)],
+    session: Annotated[AsyncSession, Depends(adb.get_session)],
 ):
-    """Register new user."""
-
-    for field in ["username", "email"]:
-        if (
-            session.exec(
-                select(UserInDB.id).where(
-                    getattr(UserInDB, field) == getattr(registration, field)
-                )
-            ).first()
-        ):
-            raise DuplicateValueException(
-                field=field,
-                value=getattr(registration, field),
-            )
+    """
+    Register new user.
 
-    hashed_password = _hash_password(registration.password)
-    user = UserInDB(
-        **registration.model_dump(),
-        hashed_password=hashed_password,
-    )
-    session.add(user)
-    session.commit()
-    session.refresh(user)
-    return user
+    The password is hashed before a database connection is taken, and
+    the user is added with one `INSERT`. A taken username or email is
+    rejected by the database's unique indexes.
+    """
+
+    hashed_password = await hash_password(registration.password)
+    try:
+        return await adb.create_user(
+            session,
+            username=registration.username,
+            email=registration.email,
+            hashed_password=hashed_password,
+        )
+    except db.UniqueViolationException as exception:
+        raise DuplicateValueException(field=exception.field, value=exception.value)
 
 
-@auth_router.post("/token", response_model=AccessToken)
-def get_access_token(
+@auth_router.post(
+    "/token",
+    response_model=AccessToken,
+    dependencies=[Depends(limit_login)],
+)
+async def get_access_token(
     form: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(db.get_session),
+    session: AsyncSession = Depends(adb.get_session),
 ):
-    """Get access token for user."""
+    """Get access and refresh tokens for user."""
+
+    user = await _get_authenticated_user(session, form)
+    refresh_token = _new_refresh_token()
+    await adb.create_refresh_token(
+        session,
+        user.id,
+        _hash_refresh_token(refresh_token),
+        ttl=refresh_token_duration,
+    )
+    return _build_access_token(user.id, refresh_token)
+
+
+@auth_router.post("/refresh", response_model=AccessToken)
+async def refresh_access_token(
+    refresh_token: Annotated[str, Form()],
+    session: Annotated[AsyncSession, Depends(adb.get_session)],
+):
+    """
+    Get new access and refresh tokens for a refresh token.
+
+    The refresh token is checked against its hash in one `UPDATE`, which
+    also replaces it by the one returned, so no password is verified.
+    Refresh tokens are revoked when their user is deleted or changes
+    password, and when one is used twice.
+    """
+
+    new_refresh_token = _new_refresh_token()
+    user_id = await adb.rotate_refresh_token(
+        session,
+        _hash_refresh_token(refresh_token),
+        _hash_refresh_token(new_refresh_token),
+        ttl=refresh_token_duration,
+    )
+    if user_id is None:
+        raise InvalidRefreshToken()
+
+    return _build_access_token(user_id, new_refresh_token)
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password in the password worker pool."""
+    hashed_password, seconds = await _run_password_work(_timed, _hash_password, password)
+    PASSWORD_HASH_DURATION.labels("hash").observe(seconds)
+    return hashed_password
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    """Verify a password in the password worker pool."""
+    verified, seconds = await _run_password_work(
+        _timed, _verify_password, password, hashed_password
+    )
+    PASSWORD_HASH_DURATION.labels("verify").observe(seconds)
+    return verified
+
+
+@functools.cache
+def get_pwd_context():
+    """The password hashing context, built on first use."""
+    # passlib and jose are imported where they are used, as they add to
+    # the cold start of every Lambda container, whether it handles auth or not
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+    )
+
+
+def __getattr__(name: str):
+    if name == "pwd_context":
+        return get_pwd_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    user = _get_authenticated_user(session, form)
-    return _build_access_token(user)
 
+def warm_up():
+    """Load the bcrypt backend, the JWT library and the password worker pool."""
+    from jose import jwt  # noqa: F401
 
-def _get_authenticated_user(
-    session: Session,
+    get_pwd_context().handler().get_backend()
+    _get_password_executor()
+
+
+def shutdown_password_executor():
+    """Stop the password worker pool, if it was started."""
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(cancel_futures=True)
+        _password_executor = None
+
+
+_password_executor: Executor | None = None
+
+
+def _get_password_executor() -> Executor:
+    # bcrypt is CPU bound, so it gets its own processes rather than the
+    # threadpool that serves sync endpoints; environments without
+    # multiprocessing support (eg AWS Lambda) fall back to threads.
+    # Workers are spawned rather than forked, as a fork of the server would
+    # copy its threads' locks, possibly held, and its open connections
+    global _password_executor
+    if _password_executor is None:
+        try:
+            _password_executor = ProcessPoolExecutor(
+                max_workers=password_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        except OSError:
+            _password_executor = ThreadPoolExecutor(
+                max_workers=password_workers,
+                thread_name_prefix="password",
+            )
+    return _password_executor
+
+
+async def _run_password_work(function, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_password_executor(), function, *args)
+
+
+async def _get_authenticated_user(
+    session: AsyncSession,
     form: OAuth2PasswordRequestForm,
 ) -> UserInDB:
-    user = session.exec(
-        select(UserInDB).where(UserInDB.username == form.username)
+    user = (
+        await session.exec(
+            select(UserInDB).where(UserInDB.username == form.username)
+        )
     ).first()
 
-    if user is None or not _verify_password(form.password, user.hashed_password):
+    if user is None or not await verify_password(form.password, user.hashed_password):
         raise InvalidCredentials()
 
+    if get_pwd_context().needs_update(user.hashed_password):
+        # hashed with outdated settings, eg fewer `BCRYPT_ROUNDS`
+        user.hashed_password = await hash_password(form.password)
+        session.add(user)
+        await session.commit()
+        await session.refresh(user)
+
     return user
 
 
-def _build_access_token(user: UserInDB) -> AccessToken:
+def _build_access_token(user_id: int, refresh_token: str) -> AccessToken:
+    from jose import jwt
+
     expiration = int(datetime.now(timezone.utc).timestamp()) + access_token_duration
-    claims = Claims(sub=str(user.id), exp=expiration)
+    claims = Claims(sub=str(user_id), exp=expiration)
     access_token = jwt.encode(claims.model_dump(), key=jwt_key, algorithm=jwt_alg)
 
     return AccessToken(
         access_token=access_token,
         token_type="Bearer",
         expires_in=access_token_duration,
+        refresh_token=refresh_token,
     )
 
 
-def _decode_access_token(session: Session, token: str) -> UserInDB:
+def _new_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def _hash_refresh_token(refresh_token: str) -> str:
+    # 256 random bits cannot be guessed, unlike passwords, so a fast hash
+    # is enough to keep the stored hashes from being used as tokens
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+async def _decode_access_token(session: AsyncSession, token: str) -> UserInDB:
+    from jose import ExpiredSignatureError, JWTError, jwt
+
     try:
         claims_dict = jwt.decode(token, key=jwt_key, algorithms=[jwt_alg])
         claims = Claims(**claims_dict)
-        user_id = claims.sub
-        user = session.get(UserInDB, user_id)
+        user_id = int(claims.sub)
+        user = await session.get(UserInDB, user_id)
 
         if user is None:
             raise InvalidToken()
 
+        _cache_user(token, user, claims.exp)
         return user
     except ExpiredSignatureError:
         raise ExpiredToken()
     except JWTError:
         raise InvalidToken()
-    except ValidationError():
+    except (ValidationError, ValueError):
         raise InvalidToken()
 
 
+def _cache_user(token: str, user: UserInDB, expiration: int):
+    # store column values rather than the instance, which is bound to `session`
+    seconds_left = expiration - datetime.now(timezone.utc).timestamp()
+    db.user_cache.set(
+        token,
+        user.model_dump(),
+        ttl=seconds_left,
+        tags=[db.user_cache_tag(user.id)],
+    )
+
+
+async def _get_cached_user(session: AsyncSession, token: str) -> UserInDB | None:
+    user_data = db.user_cache.get(token)
+    if user_data is None:
+        return None
+
+    # attach to `session` without a round trip to the database
+    user = UserInDB(**user_data)
+    make_transient_to_detached(user)
+    return await session.merge(user, load=False)
+
+
+def _timed(function, *args):
+    # runs in the worker, so the time excludes waiting for a free worker
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
 def _hash_password(password: str) -> str:
-    try:
-        return pwd_context.hash(password)
-    except Exception as e:
-        print(f"hashing error: {e}")
-        raise InvalidToken()
+    # errors propagate to the caller, and from the endpoint as a 500
+    return get_pwd_context().hash(password)
 
 
 def _verify_password(password: str, hashed_password: str) -> bool:
     try:
-        return pwd_context.verify(password, hashed_password)
+        return get_pwd_context().verify(password, hashed_password)
     except Exception as e:
         print(f"verification error: {e}")
         return False
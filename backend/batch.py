@@ -0,0 +1,35 @@
+from fastapi import HTTPException, Query
+
+MAX_BATCH_IDS = 1000
+# digits of an id at most, so that every id fits a 64-bit integer column
+MAX_ID_DIGITS = 18
+
+
+def batch_ids(
+    ids: str = Query(
+        default=None,
+        pattern=rf"^\d{{1,{MAX_ID_DIGITS}}}(,\d{{1,{MAX_ID_DIGITS}}})*$",
+        description="comma separated ids to get in one request, eg `1,2,3`",
+    ),
+) -> list[int] | None:
+    """
+    Parse the `ids` query parameter of a batch request.
+
+    :param ids: comma separated ids, if sent
+    :return: distinct ids in request order, or `None` without `ids`
+    :raises HTTPException: if more than `MAX_BATCH_IDS` ids are requested
+    """
+
+    if ids is None:
+        return None
+
+    parsed = list(dict.fromkeys(int(value) for value in ids.split(",")))
+    if len(parsed) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "type": "too_many_ids",
+                "limit": MAX_BATCH_IDS,
+            },
+        )
+    return parsed
@@ -0,0 +1,171 @@
+import importlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Protocol
+
+
+class CacheBackend(Protocol):
+    """
+    Interface of the caches in this package.
+
+    `TTLCache` keeps entries in the memory of one process; a store shared
+    by several processes can implement the same methods. Keys and tags
+    are strings, and values are plain data, so that they can be
+    serialized by such a store.
+    """
+
+    hits: int
+    misses: int
+
+    def get(self, key: str, default: Any = None) -> Any:
+        ...
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        *,
+        ttl: float | None = None,
+        tags: Iterable[str] = (),
+    ):
+        ...
+
+    def delete(self, key: str):
+        ...
+
+    def invalidate_tag(self, tag: str):
+        ...
+
+    def clear(self):
+        ...
+
+
+def load_cache_backend(path: str | None, *, maxsize: int, ttl: float) -> CacheBackend:
+    """
+    Build a cache from a factory given as `"package.module:factory"`.
+
+    :param path: import path of the factory, `TTLCache` if not given
+    :param maxsize: maximum number of entries, passed to the factory
+    :param ttl: seconds until entries expire, passed to the factory
+    :return: the cache
+    """
+
+    if not path:
+        return TTLCache(maxsize=maxsize, ttl=ttl)
+
+    module_name, _, factory_name = path.partition(":")
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    return factory(maxsize=maxsize, ttl=ttl)
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded cache whose entries expire after a TTL.
+
+    Entries are evicted least-recently-used first once `maxsize` is
+    reached. An entry can be tagged so that every entry derived from the
+    same record can be invalidated at once with `invalidate_tag`.
+    """
+
+    def __init__(self, *, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any, tuple]] = OrderedDict()
+        self._tags: dict[Hashable, set[Hashable]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Retrieve a value from the cache.
+
+        :param key: key of the entry
+        :param default: value to return if the key is missing or expired
+        :return: the cached value or `default`
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value, _tags = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        *,
+        ttl: float | None = None,
+        tags: Iterable[Hashable] = (),
+    ):
+        """
+        Store a value in the cache.
+
+        :param key: key of the entry
+        :param value: value to store
+        :param ttl: seconds until the entry expires, capped at the cache ttl
+        :param tags: tags to invalidate the entry by
+        """
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key: Hashable):
+        """Remove a single entry from the cache, if present."""
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_tag(self, tag: Hashable):
+        """Remove every entry stored with the given tag."""
+
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        """Remove every entry from the cache and reset its counters."""
+
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _remove(self, key: Hashable):
+        _expires_at, _value, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
@@ -0,0 +1,22 @@
+import json
+
+from backend.database import create_missing_indexes
+
+
+def lambda_handler(event, context):
+    try:
+        created = create_missing_indexes()
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"created_indexes": created}),
+        }
+    except Exception as e:
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+        }
+
+
+if __name__ == "__main__":
+    for name in create_missing_indexes():
+        print(f"created index {name}")
@@ -1,18 +1,68 @@
+import base64
+import hashlib
+import json
 import os
+import re
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Collection, Sequence
 
-from sqlalchemy import func
+from sqlalchemy import (
+    Column,
+    MetaData,
+    Row,
+    String,
+    Table,
+    and_,
+    column,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    literal_column,
+    or_,
+    table,
+    text,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql import Select
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
 from sqlmodel import Session, SQLModel, create_engine, select
 
+from backend.cache import CacheBackend, TTLCache, load_cache_backend
+from backend.pool import get_pool_options
+from backend.serialization import row_columns
 from backend.entities import (
+    Animal,
+    AnimalFacetCount,
+    AnimalFacets,
     AnimalInDB,
     AnimalCreate,
+    AnimalSearch,
+    AnimalStats,
     AnimalUpdate,
     FosterInDB,
+    KindStats,
+    KindStatsInDB,
+    RefreshTokenInDB,
+    StatsResponse,
+    TableVersion,
+    User,
+    UserActivityInDB,
     UserInDB,
+    UserStats,
     UserUpdate,
     Foster,
 )
 
+# columns of the `Animal` and `User` response models, see `backend.serialization`
+ANIMAL_COLUMNS = row_columns(Animal, AnimalInDB)
+USER_COLUMNS = row_columns(User, UserInDB)
+
 
 def get_db_url():
     loc = os.environ.get("DB_LOCATION")
@@ -33,17 +83,463 @@ def get_engine():
     echo = os.environ.get("DB_DEBUG", default="False").lower() in ("true", "1", "t")
     if os.environ.get("DB_LOCATION") == "rds":
         connect_args = {}
+        statement_timeout = os.environ.get("DB_STATEMENT_TIMEOUT")  # milliseconds
+        if statement_timeout:
+            connect_args["options"] = f"-c statement_timeout={int(statement_timeout)}"
     else:
         connect_args = {"check_same_thread": False}
 
-    return create_engine(db_url, echo=echo, connect_args=connect_args)
+    return create_engine(
+        db_url,
+        echo=echo,
+        connect_args=connect_args,
+        **get_pool_options(),
+    )
 
 
 engine = get_engine()
 
+# users resolved from bearer tokens, see `auth.get_current_user`; the
+# cache is per process, so `update_user` and `delete_user` only invalidate
+# it in their own. Other processes, eg other Lambda containers, keep
+# accepting the token of a deleted user, or its old email or name, for up
+# to `USER_CACHE_TTL` seconds
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_SIZE", default="1024")),
+    ttl=float(os.environ.get("USER_CACHE_TTL", default="30")),
+)
+
+
+def user_cache_tag(user_id: int) -> str:
+    """Tag of the `user_cache` entries of one user."""
+    return f"user:{user_id}"
+
+
+# serialized `GET /animals` pages, searches and `GET /stats`, tagged
+# "animals"; `ANIMAL_CACHE_BACKEND` can name a factory for a cache shared
+# between worker processes
+animal_cache: CacheBackend = load_cache_backend(
+    os.environ.get("ANIMAL_CACHE_BACKEND"),
+    maxsize=int(os.environ.get("ANIMAL_CACHE_SIZE", default="256")),
+    ttl=float(os.environ.get("ANIMAL_CACHE_TTL", default="60")),
+)
+
+
+# kept out of `SQLModel.metadata`, so it is not part of its own fingerprint
+schema_version_table = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", String(64), nullable=False),
+)
+
+
+# Objects derived from the tables and kept up to date by the database
+# itself on every write, including bulk inserts and cascades:
+# - full-text search of animal names, an FTS5 table kept in sync by
+#   triggers on SQLite, and an expression index on Postgres
+# - summary tables, whose rows are counters updated by triggers on the
+#   tables they summarize, see `SUMMARIES`
+# - cascades, triggers that clear the rows depending on a deleted row,
+#   see `CASCADES`
+ANIMAL_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE TRIGGER IF NOT EXISTS animals_fts_insert AFTER INSERT ON animals BEGIN"
+        " INSERT INTO animals_fts(rowid, name) VALUES (new.id, new.name);"
+        " END",
+        "CREATE TRIGGER IF NOT EXISTS animals_fts_delete AFTER DELETE ON animals BEGIN"
+        " INSERT INTO animals_fts(animals_fts, rowid, name) VALUES ('delete', old.id, old.name);"
+        " END",
+        "CREATE TRIGGER IF NOT EXISTS animals_fts_update AFTER UPDATE OF name ON animals BEGIN"
+        " INSERT INTO animals_fts(animals_fts, rowid, name) VALUES ('delete', old.id, old.name);"
+        " INSERT INTO animals_fts(rowid, name) VALUES (new.id, new.name);"
+        " END",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS animals_fts"
+        " USING fts5(name, content='animals', content_rowid='id', prefix='2 3')",
+    ],
+    "postgresql": [
+        "CREATE INDEX IF NOT EXISTS ix_animals_name_search"
+        " ON animals USING gin (to_tsvector('simple', name))",
+    ],
+}
+ANIMAL_SEARCH_INDEX = {"sqlite": "animals_fts", "postgresql": "ix_animals_name_search"}
+animals_fts = table("animals_fts", column("rowid"), column("animals_fts"))
+
+# summary table -> triggers that maintain it, each with the table it is
+# on, the condition for a row to count, the key of the summary row of a
+# table row, and the counters a table row adds to it; `{row}` stands for
+# the row, and `{stay}` for the days an adopted animal was in care
+SUMMARIES = {
+    "animal_facet_counts": [
+        {
+            "trigger": "animal_facet_counts",
+            "table": "animals",
+            "condition": "true",
+            "key": {
+                "kind": "{row}.kind",
+                "fixed": "{row}.fixed",
+                "vaccinated": "{row}.vaccinated",
+                "adopted": "{row}.adopter_id IS NOT NULL",
+                "age": "{row}.age",
+            },
+            "counters": {"count": "1"},
+        },
+    ],
+    "kind_stats": [
+        {
+            "trigger": "kind_stats",
+            "table": "animals",
+            "condition": "true",
+            "key": {"kind": "{row}.kind"},
+            "counters": {
+                "animals": "1",
+                "adopted": "CASE WHEN {row}.adopter_id IS NOT NULL THEN 1 ELSE 0 END",
+                "stays": "CASE WHEN {stay} IS NOT NULL THEN 1 ELSE 0 END",
+                "stay_days": "COALESCE({stay}, 0)",
+            },
+        },
+    ],
+    "user_activity": [
+        {
+            "trigger": "user_activity_fosters",
+            "table": "fosters",
+            "condition": "true",
+            "key": {"user_id": "{row}.user_id"},
+            "counters": {"fosters": "1", "adoptions": "0"},
+        },
+        {
+            "trigger": "user_activity_adoptions",
+            "table": "animals",
+            "condition": "{row}.adopter_id IS NOT NULL",
+            "key": {"user_id": "{row}.adopter_id"},
+            "counters": {"fosters": "0", "adoptions": "1"},
+        },
+    ],
+}
+
+
+def _expand(dialect: str, expression: str, row: str) -> str:
+    if dialect == "sqlite":
+        days = "CAST(julianday({row}.adoption_date) - julianday({row}.intake_date) AS INTEGER)"
+    else:
+        days = "{row}.adoption_date - {row}.intake_date"
+    stay = f"CASE WHEN {{row}}.adopter_id IS NOT NULL THEN {days} END"
+    return expression.replace("{stay}", stay).replace("{row}", row)
+
+
+def _add_to_summary(dialect: str, summary: str, trigger: dict, row: str, sign: str) -> str:
+    # upserts the counters of `row` into its summary row, with `sign`;
+    # a WHERE clause is required before ON CONFLICT by SQLite's parser
+    key, counters = trigger["key"], trigger["counters"]
+    values = [
+        *(_expand(dialect, value, row) for value in key.values()),
+        *(f"{sign}({_expand(dialect, value, row)})" for value in counters.values()),
+    ]
+    return (
+        f"INSERT INTO {summary} ({', '.join([*key, *counters])})"
+        f" SELECT {', '.join(values)} WHERE {_expand(dialect, trigger['condition'], row)}"
+        f" ON CONFLICT ({', '.join(key)}) DO UPDATE SET "
+        + ", ".join(f"{name} = {summary}.{name} + excluded.{name}" for name in counters)
+        + ";"
+    )
+
+
+def _summary_ddl(dialect: str, summary: str) -> list[str]:
+    statements = []
+    for trigger in SUMMARIES[summary]:
+        name, table_name = trigger["trigger"], trigger["table"]
+        expressions = " ".join([*trigger["key"].values(), *trigger["counters"].values()])
+        columns = sorted(set(re.findall(r"\{row\}\.(\w+)", _expand(dialect, expressions, "{row}"))))
+        decrement = _add_to_summary(dialect, summary, trigger, "old", "-")
+        increment = _add_to_summary(dialect, summary, trigger, "new", "")
+
+        if dialect == "sqlite":
+            statements += [
+                f"CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table_name}"
+                f" BEGIN {increment} END",
+                f"CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table_name}"
+                f" BEGIN {decrement} END",
+                f"CREATE TRIGGER IF NOT EXISTS {name}_update"
+                f" AFTER UPDATE OF {', '.join(columns)} ON {table_name}"
+                f" BEGIN {decrement} {increment} END",
+            ]
+        else:
+            statements += [
+                f"CREATE OR REPLACE FUNCTION {name}_update() RETURNS trigger AS $$ BEGIN"
+                f" IF TG_OP IN ('UPDATE', 'DELETE') THEN {decrement} END IF;"
+                f" IF TG_OP IN ('INSERT', 'UPDATE') THEN {increment} END IF;"
+                " RETURN NULL;"
+                " END $$ LANGUAGE plpgsql",
+                f"DROP TRIGGER IF EXISTS {name}_update ON {table_name}",
+                f"CREATE TRIGGER {name}_update"
+                f" AFTER INSERT OR DELETE OR UPDATE OF {', '.join(columns)} ON {table_name}"
+                f" FOR EACH ROW EXECUTE FUNCTION {name}_update()",
+            ]
+    return statements
+
+
+def _summary_fill(dialect: str, summary: str) -> list[str]:
+    statements = [f"DELETE FROM {summary}"]
+    for trigger in SUMMARIES[summary]:
+        table_name = trigger["table"]
+        key = [_expand(dialect, value, table_name) for value in trigger["key"].values()]
+        counters = [
+            f"sum({_expand(dialect, value, table_name)})"
+            for value in trigger["counters"].values()
+        ]
+        statements.append(
+            f"INSERT INTO {summary} ({', '.join([*trigger['key'], *trigger['counters']])})"
+            f" SELECT {', '.join([*key, *counters])} FROM {table_name}"
+            f" WHERE {_expand(dialect, trigger['condition'], table_name)}"
+            f" GROUP BY {', '.join(key)}"
+            f" ON CONFLICT ({', '.join(trigger['key'])}) DO UPDATE SET "
+            + ", ".join(
+                f"{name} = {summary}.{name} + excluded.{name}" for name in trigger["counters"]
+            )
+        )
+    return statements
+
+
+# table -> statements clearing the rows that depend on a deleted row of
+# it, `old`; they run in the database, in the deleting statement, so a
+# delete costs one round trip whatever the history of the row
+CASCADES = {
+    "users": [
+        "DELETE FROM fosters WHERE user_id = old.id;",
+        "DELETE FROM refresh_tokens WHERE user_id = old.id;",
+        # their pets stay, without an adopter
+        "UPDATE animals SET adopter_id = NULL, version = version + 1"
+        " WHERE adopter_id = old.id;",
+    ],
+    "animals": [
+        "DELETE FROM fosters WHERE animal_id = old.id;",
+    ],
+}
+
+# rows left dangling by deletes made before `CASCADES` existed
+CASCADES_FILL = [
+    "DELETE FROM fosters WHERE user_id NOT IN (SELECT id FROM users)"
+    " OR animal_id NOT IN (SELECT id FROM animals)",
+    "DELETE FROM refresh_tokens WHERE user_id NOT IN (SELECT id FROM users)",
+    "UPDATE animals SET adopter_id = NULL, version = version + 1"
+    " WHERE adopter_id NOT IN (SELECT id FROM users)",
+]
+
+
+def _cascades_ddl(dialect: str) -> list[str]:
+    statements = []
+    for table_name, cascade in CASCADES.items():
+        body = " ".join(cascade)
+        if dialect == "sqlite":
+            # replaced rather than kept, so databases get the current `CASCADES`
+            statements += [
+                f"DROP TRIGGER IF EXISTS {table_name}_cascade",
+                f"CREATE TRIGGER {table_name}_cascade"
+                f" BEFORE DELETE ON {table_name} BEGIN {body} END",
+            ]
+        else:
+            statements += [
+                f"CREATE OR REPLACE FUNCTION {table_name}_cascade() RETURNS trigger AS $$ BEGIN"
+                f" {body} RETURN old;"
+                " END $$ LANGUAGE plpgsql",
+                f"DROP TRIGGER IF EXISTS {table_name}_cascade ON {table_name}",
+                f"CREATE TRIGGER {table_name}_cascade BEFORE DELETE ON {table_name}"
+                f" FOR EACH ROW EXECUTE FUNCTION {table_name}_cascade()",
+            ]
+    return statements
+
+
+# groups of derived objects: the name of the object created last, whose
+# existence means the group exists, the DDL, and the statements that fill
+# a new group from existing rows
+DERIVED_OBJECTS = {
+    dialect: [
+        (
+            ANIMAL_SEARCH_INDEX[dialect],
+            ANIMAL_SEARCH_DDL[dialect],
+            ["INSERT INTO animals_fts(animals_fts) VALUES ('rebuild')"] if dialect == "sqlite" else [],
+        ),
+        *(
+            (
+                f"{SUMMARIES[summary][-1]['trigger']}_update",
+                _summary_ddl(dialect, summary),
+                _summary_fill(dialect, summary),
+            )
+            for summary in SUMMARIES
+        ),
+        (f"{list(CASCADES)[-1]}_cascade", _cascades_ddl(dialect), CASCADES_FILL),
+    ]
+    for dialect in ("sqlite", "postgresql")
+}
+
+
+def get_schema_version(dialect) -> str:
+    """
+    Fingerprint the tables and indexes declared in `SQLModel.metadata`.
+
+    :param dialect: dialect the DDL is compiled for, eg `engine.dialect`
+    :return: hex digest of the DDL
+    """
+
+    ddl = []
+    for table in SQLModel.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            ddl.append(str(CreateIndex(index).compile(dialect=dialect)))
+    for _name, statements, _fill in DERIVED_OBJECTS.get(dialect.name, []):
+        ddl.extend(statements)
+
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()
+
+
+def create_db_and_tables(bind=None) -> bool:
+    """
+    Create missing tables and indexes, unless the schema is already current.
+
+    The fingerprint of the declared schema is stored in `schema_version`
+    after the DDL runs, so later startups only read one row instead of
+    inspecting every table.
+
+    :param bind: engine to use, defaults to the application engine
+    :return: whether the DDL was run
+    """
+
+    bind = bind or engine
+    version = get_schema_version(bind.dialect)
+    with bind.connect() as connection:
+        if inspect(connection).has_table(schema_version_table.name):
+            current = connection.scalar(select(schema_version_table.c.version))
+            if current == version:
+                return False
+
+    SQLModel.metadata.create_all(bind)
+    create_missing_columns(bind)
+    create_missing_indexes(bind)
+    with bind.begin() as connection:
+        schema_version_table.create(connection, checkfirst=True)
+        connection.execute(delete(schema_version_table))
+        connection.execute(insert(schema_version_table).values(version=version))
+
+    return True
+
+
+def create_missing_columns(bind=None) -> list[str]:
+    """
+    Add any declared column that is missing from an existing table.
+
+    Like indexes, columns declared after a table was first created are
+    never added by `create_all`. They need a server default to be added
+    to a table that already has rows.
+
+    :param bind: engine to use, defaults to the application engine
+    :return: names of the columns that were created, as `table.column`
+    """
+
+    with (bind or engine).begin() as connection:
+        return _create_missing_columns(connection)
+
+
+def _create_missing_columns(connection) -> list[str]:
+    created = []
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                created.append(f"{table.name}.{column.name}")
+
+    return created
+
+
+def create_missing_indexes(bind=None) -> list[str]:
+    """
+    Add any declared index that is missing from an existing database.
+
+    `create_all` skips tables that already exist, so indexes declared
+    after a table was first created are never built by it. Indexes that
+    were declared unique since are rebuilt, which fails if the table
+    already holds duplicates.
+
+    :param bind: engine to use, defaults to the application engine
+    :return: names of the indexes that were created
+    """
+
+    created = []
+    with (bind or engine).begin() as connection:
+        inspector = inspect(connection)
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {
+                index["name"]: bool(index["unique"])
+                for index in inspector.get_indexes(table.name)
+            }
+            for index in table.indexes:
+                if existing.get(index.name) == bool(index.unique):
+                    continue
+                if index.name in existing:
+                    index.drop(connection)
+                index.create(connection)
+                created.append(index.name)
+
+        if all(inspector.has_table(table.name) for table in SQLModel.metadata.sorted_tables):
+            created += create_derived_objects(connection)
+
+    return created
+
+
+def create_derived_objects(connection) -> list[str]:
+    """
+    Create the search index, summary tables and cascades triggers, if missing.
+
+    New ones are filled from the existing rows.
+
+    :param connection: connection to the database, in a transaction
+    :return: names of the groups of objects that were created
+    """
+
+    created = []
+    for name, statements, fill in DERIVED_OBJECTS.get(connection.dialect.name, []):
+        exists = _schema_object_exists(connection, name)
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+        if not exists:
+            for statement in fill:
+                connection.exec_driver_sql(statement)
+            created.append(name)
+
+    return created
+
+
+def _schema_object_exists(connection, name: str) -> bool:
+    if connection.dialect.name == "sqlite":
+        statement = text("SELECT 1 FROM sqlite_master WHERE name = :name")
+    else:
+        statement = text(
+            "SELECT 1 FROM pg_class WHERE relname = :name"
+            " UNION ALL SELECT 1 FROM pg_trigger WHERE tgname = :name"
+        )
+    return connection.execute(statement, {"name": name}).first() is not None
+
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+# after every table exists, as triggers on `fosters` update `user_activity`,
+# and has every column, as `create_all` also runs on existing databases
+@event.listens_for(SQLModel.metadata, "after_create")
+def _create_derived_objects(target, connection, **kwargs):
+    _create_missing_columns(connection)
+    create_derived_objects(connection)
+
+
+@event.listens_for(SQLModel.metadata, "before_drop")
+def _drop_derived_objects(target, connection, **kwargs):
+    # indexes and triggers go with their tables
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("DROP TABLE IF EXISTS animals_fts")
 
 
 def get_session():
@@ -57,6 +553,69 @@ class EntityNotFoundException(Exception):
         self.entity_id = entity_id
 
 
+class VersionMismatchException(Exception):
+    def __init__(self, *, entity_name: str, entity_id: int):
+        self.entity_name = entity_name
+        self.entity_id = entity_id
+
+
+class UniqueViolationException(Exception):
+    def __init__(self, *, entity_name: str, field: str, value):
+        self.entity_name = entity_name
+        self.field = field
+        self.value = value
+
+
+class InvalidCursorException(Exception):
+    def __init__(self, *, cursor: str):
+        self.cursor = cursor
+
+
+#   -------- table versions --------   #
+
+
+def get_table_versions(session: Session, *table_names: str) -> dict[str, int]:
+    """
+    Retrieve the change counters of tables.
+
+    :param table_names: names of the tables
+    :return: version of each table, 0 if it was never changed
+    """
+
+    statement = select(TableVersion.name, TableVersion.version).where(
+        TableVersion.name.in_(table_names)
+    )
+    versions = dict.fromkeys(table_names, 0)
+    versions.update(session.exec(statement).all())
+    return versions
+
+
+def bump_table_versions(session: Session, *table_names: str):
+    """
+    Increment the change counters of tables written to in this transaction.
+
+    Call it before committing the write, so both are committed together.
+    The counter rows stay locked until then, which serializes concurrent
+    writes to the same table.
+
+    :param table_names: names of the tables
+    """
+
+    upsert = {
+        "postgresql": postgresql.insert,
+        "sqlite": sqlite.insert,
+    }[session.get_bind().dialect.name]
+    statement = upsert(TableVersion).values(
+        [{"name": table_name, "version": 1} for table_name in sorted(table_names)]
+    )
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[TableVersion.name],
+            set_={"version": TableVersion.version + 1},
+        )
+    )
+
+
 #   -------- animals --------   #
 
 
@@ -69,6 +628,266 @@ def get_all_animals(session: Session) -> list[AnimalInDB]:
     return session.exec(select(AnimalInDB)).all()
 
 
+ANIMAL_SORT_KEYS = ("age", "name", "intake_date")
+# sort key -> type of its value in a cursor, as JSON decodes it
+_CURSOR_VALUE_TYPES = {"age": int, "name": str, "intake_date": str}
+
+
+def _animal_filters(
+    intake_after: date | None = None,
+    intake_before: date | None = None,
+) -> list:
+    filters = []
+    if intake_after is not None:
+        filters.append(AnimalInDB.intake_date >= intake_after)
+    if intake_before is not None:
+        filters.append(AnimalInDB.intake_date <= intake_before)
+    return filters
+
+
+def _encode_cursor(sort: str, animal: Row) -> str:
+    value = getattr(animal, sort)
+    if isinstance(value, date):
+        value = value.isoformat()
+    payload = json.dumps([value, animal.id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_cursor(sort: str, cursor: str) -> tuple:
+    try:
+        value, animal_id = json.loads(base64.urlsafe_b64decode(cursor))
+        # exact types, as bools are ints and anything else fails in the query
+        if type(value) is not _CURSOR_VALUE_TYPES[sort] or type(animal_id) is not int:
+            raise TypeError("unexpected cursor value types")
+        if sort == "intake_date":
+            value = date.fromisoformat(value)
+        return value, animal_id
+    except (ValueError, TypeError):
+        raise InvalidCursorException(cursor=cursor)
+
+
+def select_animals(
+    *,
+    sort: str = "name",
+    intake_after: date | None = None,
+    intake_before: date | None = None,
+    cursor: str | None = None,
+    filters: Sequence = (),
+) -> Select:
+    """
+    Build the query for animals after `cursor`, ordered by `(sort, id)`.
+
+    :param sort: attribute to sort by, one of `ANIMAL_SORT_KEYS`
+    :param intake_after: only include animals with intake on or after date
+    :param intake_before: only include animals with intake on or before date
+    :param cursor: opaque cursor returned with the previous page
+    :param filters: further conditions, eg from `search_filters`
+    :return: select of `ANIMAL_COLUMNS`
+    :raises InvalidCursorException: if the cursor cannot be decoded
+    """
+
+    sort_column = getattr(AnimalInDB, sort)
+    statement = select(*ANIMAL_COLUMNS).where(
+        *_animal_filters(intake_after, intake_before),
+        *filters,
+    )
+
+    if cursor is not None:
+        value, animal_id = _decode_cursor(sort, cursor)
+        statement = statement.where(
+            or_(
+                sort_column > value,
+                and_(sort_column == value, AnimalInDB.id > animal_id),
+            )
+        )
+
+    return statement.order_by(sort_column, AnimalInDB.id)
+
+
+def get_animals_page(
+    session: Session,
+    *,
+    sort: str = "name",
+    intake_after: date | None = None,
+    intake_before: date | None = None,
+    cursor: str | None = None,
+    limit: int = 100,
+    filters: Sequence = (),
+) -> tuple[list[Row], str | None]:
+    """
+    Retrieve one page of animals, filtered and sorted by the database.
+
+    Pages are keyed on `(sort, id)` so that following `next_cursor`
+    seeks directly to the next row instead of scanning an offset.
+    Animals are returned as rows of `ANIMAL_COLUMNS`, not ORM instances.
+
+    :param sort: attribute to sort by, one of `ANIMAL_SORT_KEYS`
+    :param intake_after: only include animals with intake on or after date
+    :param intake_before: only include animals with intake on or before date
+    :param cursor: opaque cursor returned with the previous page
+    :param limit: maximum number of animals to return
+    :param filters: further conditions, eg from `search_filters`
+    :return: the page of animals and the cursor for the next page, if any
+    :raises InvalidCursorException: if the cursor cannot be decoded
+    """
+
+    statement = select_animals(
+        sort=sort,
+        intake_after=intake_after,
+        intake_before=intake_before,
+        cursor=cursor,
+        filters=filters,
+    )
+    # fetch one extra row to know whether there is a next page
+    animals = session.exec(statement.limit(limit + 1)).all()
+
+    if len(animals) > limit:
+        animals = animals[:limit]
+        return animals, _encode_cursor(sort, animals[-1])
+
+    return animals, None
+
+
+def count_animals(
+    session: Session,
+    *,
+    intake_after: date | None = None,
+    intake_before: date | None = None,
+) -> int:
+    """
+    Count animals matching the given intake date range.
+
+    :param intake_after: only count animals with intake on or after date
+    :param intake_before: only count animals with intake on or before date
+    :return: number of matching animals
+    """
+
+    statement = select(func.count()).select_from(AnimalInDB).where(
+        *_animal_filters(intake_after, intake_before)
+    )
+    return session.exec(statement).one()
+
+
+def _match_names(dialect: str, query: str | None):
+    # every word of the query must prefix a word of the name; words are
+    # reduced to letters and digits, so they cannot inject query syntax
+    words = re.findall(r"\w+", (query or "").lower())
+    if not words:
+        return None
+
+    if dialect == "sqlite":
+        match = " ".join(f'"{word}"*' for word in words)
+        return AnimalInDB.id.in_(
+            select(animals_fts.c.rowid).where(animals_fts.c.animals_fts.op("MATCH")(match))
+        )
+
+    tsquery = " & ".join(f"{word}:*" for word in words)
+    # must match the indexed expression in `ANIMAL_SEARCH_DDL`
+    config = literal_column("'simple'")
+    return func.to_tsvector(config, AnimalInDB.name).op("@@")(func.to_tsquery(config, tsquery))
+
+
+def _attribute_filters(model, adopted, search: AnimalSearch) -> list:
+    # shared by `animals` and `animal_facet_counts`, which have the same
+    # attribute columns; `adopted` is the adoption status of a row
+    filters = []
+    if search.kind is not None:
+        filters.append(model.kind == search.kind)
+    if search.fixed is not None:
+        filters.append(model.fixed == search.fixed)
+    if search.vaccinated is not None:
+        filters.append(model.vaccinated == search.vaccinated)
+    if search.min_age is not None:
+        filters.append(model.age >= search.min_age)
+    if search.max_age is not None:
+        filters.append(model.age <= search.max_age)
+    if search.adopted is not None:
+        filters.append(adopted if search.adopted else ~adopted)
+    return filters
+
+
+def search_filters(session: Session, search: AnimalSearch) -> list:
+    """
+    Build the conditions for the animals matching a search.
+
+    :param search: words to match in the name and attributes to filter by
+    :return: conditions for `select_animals`
+    """
+
+    filters = _attribute_filters(AnimalInDB, AnimalInDB.adopter_id.is_not(None), search)
+    match = _match_names(session.get_bind().dialect.name, search.q)
+    if match is not None:
+        filters.append(match)
+    return filters
+
+
+def search_animals(
+    session: Session,
+    search: AnimalSearch,
+    *,
+    sort: str = "name",
+    cursor: str | None = None,
+    limit: int = 20,
+) -> tuple[list[Row], str | None, int, AnimalFacets]:
+    """
+    Retrieve one page of the animals matching a search, with facet counts.
+
+    :param search: words to match in the name and attributes to filter by
+    :param sort: attribute to sort by, one of `ANIMAL_SORT_KEYS`
+    :param cursor: opaque cursor returned with the previous page
+    :param limit: maximum number of animals to return
+    :return: the page of animals, the cursor for the next page, if any,
+        the number of matching animals and their facet counts
+    :raises InvalidCursorException: if the cursor cannot be decoded
+    """
+
+    animals, next_cursor = get_animals_page(
+        session,
+        sort=sort,
+        cursor=cursor,
+        limit=limit,
+        filters=search_filters(session, search),
+    )
+    count, facets = get_animal_facets(session, search)
+    return animals, next_cursor, count, facets
+
+
+def get_animal_facets(session: Session, search: AnimalSearch) -> tuple[int, AnimalFacets]:
+    """
+    Count the animals matching a search, by facet value.
+
+    Without words to match, the counts are summed from the few rows of
+    `animal_facet_counts`, however many animals there are. Otherwise the
+    matching animals are counted, in one grouped query for every facet.
+
+    :param search: words to match in the name and attributes to filter by
+    :return: the number of matching animals and their facet counts
+    """
+
+    if _match_names(session.get_bind().dialect.name, search.q) is None:
+        model, adopted = AnimalFacetCount, AnimalFacetCount.adopted
+        total = func.sum(AnimalFacetCount.count)
+        filters = _attribute_filters(model, adopted, search)
+    else:
+        model, adopted = AnimalInDB, AnimalInDB.adopter_id.is_not(None)
+        total = func.count()
+        filters = search_filters(session, search)
+
+    groups = (model.kind, model.fixed, model.vaccinated, adopted)
+    statement = select(*groups, total).where(*filters).group_by(*groups).having(total > 0)
+
+    facets = {name: defaultdict(int) for name in AnimalFacets.model_fields}
+    count = 0
+    for kind, fixed, vaccinated, is_adopted, group_count in session.exec(statement):
+        facets["kind"][kind] += group_count
+        facets["fixed"][fixed] += group_count
+        facets["vaccinated"][vaccinated] += group_count
+        facets["adopted"][bool(is_adopted)] += group_count
+        count += group_count
+
+    return count, AnimalFacets(**facets)
+
+
 def create_animal(session: Session, animal_create: AnimalCreate) -> AnimalInDB:
     """
     Create a new animal in the database.
@@ -79,11 +898,71 @@ def create_animal(session: Session, animal_create: AnimalCreate) -> AnimalInDB:
 
     animal = AnimalInDB(**animal_create.model_dump())
     session.add(animal)
+    bump_table_versions(session, "animals")
     session.commit()
+    animal_cache.invalidate_tag("animals")
     session.refresh(animal)
     return animal
 
 
+def insert_animals(session: Session, animal_creates: list[AnimalCreate]) -> int:
+    """
+    Insert a batch of animals with a single multi-row statement.
+
+    Unlike `create_animal` this does not commit, so that several batches
+    can share one transaction, and does not load the inserted rows back.
+    Nor does it bump the `animals` table version or invalidate the cache:
+    the caller does that once, around its commit.
+
+    :param animal_creates: attributes of the animals to be created, with
+        an intake date of today unless given, see `AnimalImport`
+    :return: the number of animals inserted
+    """
+
+    if not animal_creates:
+        return 0
+
+    today = date.today()
+    rows = []
+    for animal_create in animal_creates:
+        row = animal_create.model_dump()
+        if row.get("intake_date") is None:
+            row["intake_date"] = today
+        rows.append(row)
+    session.execute(insert(AnimalInDB), rows)
+    return len(rows)
+
+
+def _get_rows_by_ids(
+    session: Session,
+    columns: list,
+    ids: Sequence[int],
+) -> tuple[list[Row], list[int]]:
+    # one `IN` query for the whole batch, put back in the requested order
+    id_column = next(column for column in columns if column.key == "id")
+    rows = session.exec(select(*columns).where(id_column.in_(ids))).all()
+    by_id = {row.id: row for row in rows}
+    return (
+        [by_id[id_] for id_ in ids if id_ in by_id],
+        [id_ for id_ in ids if id_ not in by_id],
+    )
+
+
+def get_animals_by_ids(
+    session: Session,
+    animal_ids: Sequence[int],
+) -> tuple[list[Row], list[int]]:
+    """
+    Retrieve a batch of animals in a single query.
+
+    :param animal_ids: ids of the animals to be retrieved
+    :return: rows of `ANIMAL_COLUMNS` in the order of `animal_ids`,
+        and the ids that do not exist
+    """
+
+    return _get_rows_by_ids(session, ANIMAL_COLUMNS, animal_ids)
+
+
 def get_animal_by_id(session: Session, animal_id: int) -> AnimalInDB:
     """
     Retrieve an animal from the database.
@@ -103,47 +982,118 @@ def update_animal(
     session: Session,
     animal_id: int,
     animal_update: AnimalUpdate,
+    *,
+    versions: Collection[int] | None = None,
 ) -> AnimalInDB:
     """
-    Update an animal in the database.
+    Update an animal in the database with a single `UPDATE ... RETURNING`.
 
     :param animal_id: id of the animal to be updated
     :param animal_update: attributes to be updated on the animal
+    :param versions: versions the animal may be at, eg from `If-Match`,
+        `None` for any version
     :return: the updated animal
     :raises EntityNotFoundException: if no such animal id exists
+    :raises VersionMismatchException: if the animal is at none of `versions`
     """
 
-    animal = get_animal_by_id(session, animal_id)
-    for attr, value in animal_update.model_dump(exclude_unset=True).items():
-        setattr(animal, attr, value)
+    statement = update(AnimalInDB).where(AnimalInDB.id == animal_id).values(
+        **animal_update.model_dump(exclude_unset=True),
+        version=AnimalInDB.version + 1,
+    )
+    if versions is not None:
+        statement = statement.where(AnimalInDB.version.in_(versions))
 
-    session.add(animal)
+    animal = session.scalars(
+        statement.returning(AnimalInDB),
+        execution_options={"populate_existing": True},
+    ).one_or_none()
+    if animal is None:
+        raise _write_failed(session, AnimalInDB, animal_id, versions)
+
+    bump_table_versions(session, "animals")
     session.commit()
-    session.refresh(animal)
+    animal_cache.invalidate_tag("animals")
 
     return animal
 
 
-def delete_animal(session: Session, animal_id: int):
+def delete_animal(
+    session: Session,
+    animal_id: int,
+    *,
+    versions: Collection[int] | None = None,
+):
     """
-    Delete an animal from the database.
+    Delete an animal from the database with a single `DELETE ... RETURNING`.
+
+    Its foster periods are deleted by the database, see `CASCADES`.
 
     :param animal_id: the id of the animal to be deleted
+    :param versions: versions the animal may be at, eg from `If-Match`,
+        `None` for any version
     :raises EntityNotFoundException: if no such animal exists
+    :raises VersionMismatchException: if the animal is at none of `versions`
     """
 
-    animal = get_animal_by_id(session, animal_id)
-    session.delete(animal)
+    statement = delete(AnimalInDB).where(AnimalInDB.id == animal_id)
+    if versions is not None:
+        statement = statement.where(AnimalInDB.version.in_(versions))
+
+    if session.scalar(statement.returning(AnimalInDB.id)) is None:
+        raise _write_failed(session, AnimalInDB, animal_id, versions)
+
+    bump_table_versions(session, "animals", "fosters")
     session.commit()
+    animal_cache.invalidate_tag("animals")
+
+
+def _write_failed(
+    session: Session,
+    model: type[SQLModel],
+    entity_id: int,
+    versions: Collection[int] | None,
+) -> Exception:
+    # a write matched no row; only then is it worth telling apart
+    # a missing row from one at another version
+    session.rollback()
+    entity_name = model.__name__.removesuffix("InDB")
+    if versions is not None:
+        exists = session.scalar(select(model.id).where(model.id == entity_id))
+        if exists is not None:
+            return VersionMismatchException(entity_name=entity_name, entity_id=entity_id)
+
+    return EntityNotFoundException(entity_name=entity_name, entity_id=entity_id)
 
 
 def get_foster_count(session: Session, user_id: int) -> int:
-    statement = select(
-        func(count(FosterInDB.id))
-    ).where(FosterInDB.user_id == user_id)
+    """
+    Count the animals a user has fostered.
+
+    :param user_id: id of the fostering user
+    :return: number of foster periods of the user
+    """
+
+    statement = select(func.count()).select_from(FosterInDB).where(
+        FosterInDB.user_id == user_id
+    )
     return session.scalar(statement)
 
 
+def get_user_pets(session: Session, user_id: int) -> list[Row]:
+    """
+    Retrieve the animals adopted by a user.
+
+    :param user_id: id of the adopting user
+    :return: rows of `ANIMAL_COLUMNS`
+    :raises EntityNotFoundException: if no such user id exists
+    """
+
+    get_user_by_id(session, user_id)
+    statement = select(*ANIMAL_COLUMNS).where(AnimalInDB.adopter_id == user_id)
+    return session.exec(statement).all()
+
+
 def get_fosters(session: Session, user_id: int) -> list[Foster]:
     user = get_user_by_id(session, user_id)
     statement = select(
@@ -170,14 +1120,67 @@ def get_fosters(session: Session, user_id: int) -> list[Foster]:
 #   -------- users --------   #
 
 
-def get_all_users(session: Session) -> list[UserInDB]:
+def create_user(
+    session: Session,
+    *,
+    username: str,
+    email: str,
+    hashed_password: str,
+) -> UserInDB:
+    """
+    Create a new user in the database with a single `INSERT ... RETURNING`.
+
+    Usernames and emails are kept unique by the database, so concurrent
+    registrations cannot both take the same one.
+
+    :param username: unique name of the user
+    :param email: unique email of the user
+    :param hashed_password: password hash of the user
+    :return: the newly created user
+    :raises UniqueViolationException: if the username or email is taken
+    """
+
+    user = UserInDB(username=username, email=email, hashed_password=hashed_password)
+    statement = insert(UserInDB).values(**user.model_dump(exclude={"id"}))
+    try:
+        user = session.scalars(statement.returning(UserInDB)).one()
+    except IntegrityError:
+        # only a failed insert pays for finding the taken value
+        session.rollback()
+        for field, value in [("username", username), ("email", email)]:
+            column = getattr(UserInDB, field)
+            if session.scalar(select(UserInDB.id).where(column == value)) is not None:
+                raise UniqueViolationException(entity_name="User", field=field, value=value)
+        raise
+
+    bump_table_versions(session, "users")
+    session.commit()
+    return user
+
+
+def get_all_users(session: Session) -> list[Row]:
     """
     Retrieve all users from the database.
 
-    :return: list of users
+    :return: rows of `USER_COLUMNS`
+    """
+
+    return session.exec(select(*USER_COLUMNS)).all()
+
+
+def get_users_by_ids(
+    session: Session,
+    user_ids: Sequence[int],
+) -> tuple[list[Row], list[int]]:
+    """
+    Retrieve a batch of users in a single query.
+
+    :param user_ids: ids of the users to be retrieved
+    :return: rows of `USER_COLUMNS` in the order of `user_ids`,
+        and the ids that do not exist
     """
 
-    return session.exec(select(UserInDB)).all()
+    return _get_rows_by_ids(session, USER_COLUMNS, user_ids)
 
 
 def get_user_by_id(session: Session, user_id: int) -> UserInDB:
@@ -195,32 +1198,255 @@ def get_user_by_id(session: Session, user_id: int) -> UserInDB:
     raise EntityNotFoundException(entity_name="User", entity_id=user_id)
 
 
-def update_user(session: Session, user_id: int, user_update: UserUpdate) -> UserInDB:
+def get_user_with_relations(
+    session: Session,
+    user_id: int,
+    include: set[str],
+) -> UserInDB:
+    """
+    Retrieve a user with related animals loaded up front.
+
+    Each included relationship costs one extra query however many animals
+    it holds, rather than one query per lazily loaded collection.
+
+    :param user_id: id of the user to be retrieved
+    :param include: relationships to load, any of "pets" and "fosters"
+    :return: the retrieved user
+    :raises EntityNotFoundException: if no such user id exists
     """
-    Update a user in the database.
+
+    options = []
+    if "pets" in include:
+        options.append(selectinload(UserInDB.pets))
+    if "fosters" in include:
+        options.append(selectinload(UserInDB.foster_animals))
+
+    statement = select(UserInDB).where(UserInDB.id == user_id).options(*options)
+    user = session.exec(statement).first()
+    if user:
+        return user
+
+    raise EntityNotFoundException(entity_name="User", entity_id=user_id)
+
+
+def update_user(
+    session: Session,
+    user_id: int,
+    user_update: UserUpdate,
+    *,
+    hashed_password: str | None = None,
+) -> UserInDB:
+    """
+    Update a user in the database with a single `UPDATE ... RETURNING`.
+
+    `user_update.password` is never stored; hash it with
+    `auth.hash_password` and pass the hash as `hashed_password`.
 
     :param user_id: id of the user to be updated
     :param user_update: attributes to be updated on the user
+    :param hashed_password: new password hash of the user, if any; the
+        refresh tokens of the user are revoked along with the old password
     :return: the updated user
+    :raises EntityNotFoundException: if no such user id exists
     """
 
-    user = get_user_by_id(session, user_id)
-    for key, value in user_update.update_attributes().items():
-        setattr(user, key, value)
-    session.add(user)
+    values = user_update.model_dump(exclude_unset=True, exclude={"password"})
+    if hashed_password is not None:
+        values["hashed_password"] = hashed_password
+    if not values:
+        return get_user_by_id(session, user_id)
+
+    statement = update(UserInDB).where(UserInDB.id == user_id).values(**values)
+    user = session.scalars(
+        statement.returning(UserInDB),
+        execution_options={"populate_existing": True},
+    ).one_or_none()
+    if user is None:
+        raise _write_failed(session, UserInDB, user_id, None)
+    if hashed_password is not None:
+        session.execute(delete(RefreshTokenInDB).where(RefreshTokenInDB.user_id == user_id))
+
+    bump_table_versions(session, "users")
     session.commit()
-    session.refresh(user)
+    user_cache.invalidate_tag(user_cache_tag(user_id))
     return user
 
 
 def delete_user(session: Session, user_id: int):
     """
-    Delete a user from the database.
+    Delete a user from the database with a single `DELETE ... RETURNING`.
+
+    Their foster periods and refresh tokens are deleted and their pets
+    kept without an adopter by the database, see `CASCADES`.
 
     :param user_id: the id of the user to be deleted
+    :raises EntityNotFoundException: if no such user exists
     """
 
-    user = get_user_by_id(session, user_id)
-    session.delete(user)
+    statement = delete(UserInDB).where(UserInDB.id == user_id)
+    if session.scalar(statement.returning(UserInDB.id)) is None:
+        raise _write_failed(session, UserInDB, user_id, None)
+
+    bump_table_versions(session, "users", "animals", "fosters")
+    session.commit()
+    user_cache.invalidate_tag(user_cache_tag(user_id))
+    animal_cache.invalidate_tag("animals")
+
+
+#   -------- refresh tokens --------   #
+
+
+def create_refresh_token(session: Session, user_id: int, token_hash: str, *, ttl: float):
+    """
+    Start a login session of a user, with its first refresh token.
+
+    The expired sessions of the user are deleted in the same transaction,
+    so the table holds about one row per live session.
+
+    :param user_id: id of the user who logged in
+    :param token_hash: hash of the refresh token
+    :param ttl: seconds until the session expires, unless refreshed
+    """
+
+    now = _utcnow()
+    session.execute(
+        delete(RefreshTokenInDB).where(
+            RefreshTokenInDB.user_id == user_id,
+            RefreshTokenInDB.expires_at <= now,
+        )
+    )
+    session.execute(
+        insert(RefreshTokenInDB).values(
+            user_id=user_id,
+            token_hash=token_hash,
+            expires_at=now + timedelta(seconds=ttl),
+        )
+    )
+    session.commit()
+
+
+def rotate_refresh_token(
+    session: Session,
+    token_hash: str,
+    new_token_hash: str,
+    *,
+    ttl: float,
+) -> int | None:
+    """
+    Replace the refresh token of a session with a single `UPDATE ... RETURNING`.
+
+    A refresh token is used once. One that was already replaced was copied
+    from the client it was issued to, so its session is revoked, and the
+    holder of the current token has to log in again too.
+
+    :param token_hash: hash of the refresh token to be replaced
+    :param new_token_hash: hash of the refresh token replacing it
+    :param ttl: seconds until the session expires, unless refreshed again
+    :return: id of the user of the session, or None if the token is
+        unknown, expired or already replaced
+    """
+
+    now = _utcnow()
+    statement = (
+        update(RefreshTokenInDB)
+        .where(
+            RefreshTokenInDB.token_hash == token_hash,
+            RefreshTokenInDB.expires_at > now,
+        )
+        .values(
+            token_hash=new_token_hash,
+            previous_hash=token_hash,
+            expires_at=now + timedelta(seconds=ttl),
+        )
+        .returning(RefreshTokenInDB.user_id)
+    )
+    user_id = session.scalar(statement)
+    if user_id is None:
+        session.execute(
+            delete(RefreshTokenInDB).where(RefreshTokenInDB.previous_hash == token_hash)
+        )
+
     session.commit()
+    return user_id
+
 
+def _utcnow() -> datetime:
+    # naive, as `expires_at` is stored without a time zone
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+#   -------- stats --------   #
+
+
+def get_kind_stats(session: Session) -> AnimalStats:
+    """
+    Count the animals in care and adopted, and their average stay, by kind.
+
+    The counters are read from `kind_stats`, one row per kind.
+
+    :return: statistics of every kind and of all animals
+    """
+
+    statement = select(KindStatsInDB).where(KindStatsInDB.animals > 0).order_by(
+        KindStatsInDB.kind
+    )
+    rows = session.exec(statement).all()
+    stays = sum(row.stays for row in rows)
+
+    return AnimalStats(
+        in_care=sum(row.animals - row.adopted for row in rows),
+        adopted=sum(row.adopted for row in rows),
+        average_stay_days=sum(row.stay_days for row in rows) / stays if stays else None,
+        kinds=[
+            KindStats(
+                kind=row.kind,
+                in_care=row.animals - row.adopted,
+                adopted=row.adopted,
+                average_stay_days=row.stay_days / row.stays if row.stays else None,
+            )
+            for row in rows
+        ],
+    )
+
+
+def get_user_stats(session: Session, limit: int = 100) -> list[UserStats]:
+    """
+    Count the fosters and adoptions of the most active users.
+
+    The counters are read from `user_activity`, one row per user.
+
+    :param limit: maximum number of users to return
+    :return: users ordered by fosters and adoptions, most first
+    """
+
+    activity = UserActivityInDB.fosters + UserActivityInDB.adoptions
+    statement = (
+        select(
+            UserInDB.id,
+            UserInDB.username,
+            UserActivityInDB.fosters,
+            UserActivityInDB.adoptions,
+        )
+        .join(UserActivityInDB, UserActivityInDB.user_id == UserInDB.id)
+        .where(activity > 0)
+        .order_by(activity.desc(), UserInDB.id)
+        .limit(limit)
+    )
+    return [
+        UserStats(user_id=user_id, username=username, fosters=fosters, adoptions=adoptions)
+        for user_id, username, fosters, adoptions in session.exec(statement)
+    ]
+
+
+def get_stats(session: Session, *, user_limit: int = 100) -> StatsResponse:
+    """
+    Compute the shelter statistics from the summary tables.
+
+    :param user_limit: maximum number of users to return
+    :return: statistics of animals by kind and of the most active users
+    """
+
+    return StatsResponse(
+        animals=get_kind_stats(session),
+        users=get_user_stats(session, user_limit),
+    )
@@ -2,7 +2,8 @@ from datetime import date, datetime
 from typing import Optional
 
 from pydantic import BaseModel
-from sqlmodel import Field, Relationship, SQLModel
+from sqlalchemy import text
+from sqlmodel import Field, Index, Relationship, SQLModel
 
 
 # ------------------------------------- #
@@ -13,7 +14,7 @@ class FosterInDB(SQLModel, table=True):
     __tablename__ = "fosters"
 
     user_id: int = Field(primary_key=True, foreign_key="users.id")
-    animal_id: int = Field(primary_key=True, foreign_key="animals.id")
+    animal_id: int = Field(primary_key=True, foreign_key="animals.id", index=True)
     start_date: date
     end_date: date
 
@@ -22,6 +23,17 @@ class AnimalInDB(SQLModel, table=True):
     """Database model for animal."""
 
     __tablename__ = "animals"
+    __table_args__ = (
+        # keyset pagination of `GET /animals` orders by (sort key, id)
+        Index("ix_animals_name_id", "name", "id"),
+        Index("ix_animals_age_id", "age", "id"),
+        Index("ix_animals_intake_date_id", "intake_date", "id"),
+        # searches filtered by kind, sorted by name
+        Index("ix_animals_kind_name_id", "kind", "name", "id"),
+        # ids of deleted animals are never given out again, so the ETag of
+        # a deleted animal cannot match a new one, see `etag.row_etag`
+        {"sqlite_autoincrement": True},
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
@@ -30,11 +42,18 @@ class AnimalInDB(SQLModel, table=True):
     fixed: bool
     vaccinated: bool
     intake_date: Optional[date] = Field(default_factory=date.today)
-    adopter_id: Optional[int] = Field(default=None, foreign_key="users.id")
+    adopter_id: Optional[int] = Field(default=None, foreign_key="users.id", index=True)
     adoption_date: Optional[date] = Field(default=None)
+    # incremented by every update, the ETag of a single animal
+    version: int = Field(default=1, sa_column_kwargs={"server_default": text("1")})
 
     adopter: Optional["UserInDB"] = Relationship(back_populates="pets")
-    foster_users: list["UserInDB"] = Relationship(back_populates="foster_animals", link_model=FosterInDB)
+    # fosters are deleted by the database, see `database.CASCADES`
+    foster_users: list["UserInDB"] = Relationship(
+        back_populates="foster_animals",
+        link_model=FosterInDB,
+        sa_relationship_kwargs={"passive_deletes": True},
+    )
 
 
 class UserInDB(SQLModel, table=True):
@@ -44,12 +63,81 @@ class UserInDB(SQLModel, table=True):
 
     id: int = Field(default=None, primary_key=True)
     username: str = Field(unique=True, index=True)
-    email: str
+    email: str = Field(unique=True, index=True)
     hashed_password: str
     created_at: Optional[datetime] = Field(default_factory=datetime.now)
 
-    pets: list[AnimalInDB] = Relationship(back_populates="adopter")
-    foster_animals: list[AnimalInDB] = Relationship(back_populates="foster_users" ,link_model=FosterInDB)
+    # pets and fosters are cleared by the database, see `database.CASCADES`,
+    # so deleting a user never loads them
+    pets: list[AnimalInDB] = Relationship(
+        back_populates="adopter",
+        sa_relationship_kwargs={"passive_deletes": True},
+    )
+    foster_animals: list[AnimalInDB] = Relationship(
+        back_populates="foster_users",
+        link_model=FosterInDB,
+        sa_relationship_kwargs={"passive_deletes": True},
+    )
+
+
+class RefreshTokenInDB(SQLModel, table=True):
+    """Database model for the refresh token of a login session."""
+
+    __tablename__ = "refresh_tokens"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # deleted with the user by the database, see `database.CASCADES`
+    user_id: int = Field(foreign_key="users.id", index=True)
+    # sha256 of the current token of the session, and of the one it replaced;
+    # the tokens themselves are never stored
+    token_hash: str = Field(unique=True, index=True)
+    previous_hash: Optional[str] = Field(default=None, index=True)
+    expires_at: datetime
+
+
+class AnimalFacetCount(SQLModel, table=True):
+    """Database model for the number of animals with the same attributes."""
+
+    __tablename__ = "animal_facet_counts"
+
+    kind: str = Field(primary_key=True)
+    fixed: bool = Field(primary_key=True)
+    vaccinated: bool = Field(primary_key=True)
+    adopted: bool = Field(primary_key=True)
+    age: int = Field(primary_key=True)
+    count: int = Field(default=0)
+
+
+class KindStatsInDB(SQLModel, table=True):
+    """Database model for the counters of the animals of one kind."""
+
+    __tablename__ = "kind_stats"
+
+    kind: str = Field(primary_key=True)
+    animals: int = Field(default=0)
+    adopted: int = Field(default=0)
+    stays: int = Field(default=0)
+    stay_days: int = Field(default=0)
+
+
+class UserActivityInDB(SQLModel, table=True):
+    """Database model for the foster and adoption counters of one user."""
+
+    __tablename__ = "user_activity"
+
+    # no foreign key, so deleting a user never waits on its counters
+    user_id: int = Field(primary_key=True)
+    fosters: int = Field(default=0)
+    adoptions: int = Field(default=0)
+
+
+class TableVersion(SQLModel, table=True):
+    """Database model for the change counter of a table."""
+
+    __tablename__ = "table_versions"
+
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
 
 
 # ------------------------------------- #
@@ -66,6 +154,13 @@ class AnimalCreate(SQLModel):
     vaccinated: bool = Field(default=False)
 
 
+class AnimalImport(AnimalCreate):
+    """Request model for a row of a bulk import of animals."""
+
+    # eg from an export; today if not given, as for a new animal
+    intake_date: Optional[date] = None
+
+
 class AnimalUpdate(SQLModel):
     """Request model for updating animal in the system."""
 
@@ -78,6 +173,18 @@ class AnimalUpdate(SQLModel):
     adoption_date: Optional[date] = None
 
 
+class AnimalSearch(SQLModel):
+    """Request model for searching animals."""
+
+    q: Optional[str] = None
+    kind: Optional[str] = None
+    fixed: Optional[bool] = None
+    vaccinated: Optional[bool] = None
+    min_age: Optional[int] = None
+    max_age: Optional[int] = None
+    adopted: Optional[bool] = None
+
+
 class UserUpdate(SQLModel):
     """Request model for updating user in the system."""
 
@@ -96,6 +203,19 @@ class Metadata(BaseModel):
     count: int
 
 
+class BatchMetadata(Metadata):
+    """Represents metadata for a collection requested by id."""
+
+    missing: list[int]
+
+
+class PageMetadata(Metadata):
+    """Represents metadata for a paginated collection."""
+
+    limit: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
 class Animal(SQLModel):
     """Data model for animal."""
 
@@ -119,10 +239,55 @@ class AnimalResponse(BaseModel):
 class AnimalCollection(BaseModel):
     """API response for a collection of animals."""
 
-    meta: Metadata
+    meta: PageMetadata
+    animals: list[Animal]
+
+
+class AnimalBatch(BaseModel):
+    """API response for animals requested by id."""
+
+    meta: BatchMetadata
+    animals: list[Animal]
+
+
+class AnimalFacets(BaseModel):
+    """Counts of the animals matching a search, by attribute value."""
+
+    kind: dict[str, int]
+    fixed: dict[bool, int]
+    vaccinated: dict[bool, int]
+    adopted: dict[bool, int]
+
+
+class AnimalSearchResponse(BaseModel):
+    """API response for a search of animals."""
+
+    meta: PageMetadata
+    facets: AnimalFacets
     animals: list[Animal]
 
 
+class BulkImportMetadata(BaseModel):
+    """Represents the outcome of a bulk import."""
+
+    inserted: int
+    failed: int
+
+
+class BulkImportError(BaseModel):
+    """Validation errors for a single row of a bulk import."""
+
+    line: int
+    errors: list[dict]
+
+
+class BulkImportResponse(BaseModel):
+    """API response for a bulk import of animals."""
+
+    meta: BulkImportMetadata
+    errors: list[BulkImportError]
+
+
 class User(SQLModel):
     """Data model for user."""
 
@@ -141,8 +306,8 @@ class UserResponse(BaseModel):
 class EnhancedUserResponse(UserResponse):
     """API response for user with additional optional fields."""
 
-    pets: Optional[list[AnimalInDB]] = None
-    fosters: Optional[list[AnimalInDB]] = None
+    pets: Optional[list[Animal]] = None
+    fosters: Optional[list[Animal]] = None
 
 
 class UserCollection(BaseModel):
@@ -152,6 +317,13 @@ class UserCollection(BaseModel):
     users: list[User]
 
 
+class UserBatch(BaseModel):
+    """API response for users requested by id."""
+
+    meta: BatchMetadata
+    users: list[User]
+
+
 class Foster(BaseModel):
     animal: Animal
     user: User
@@ -163,3 +335,36 @@ class FosterCollection(BaseModel):
     meta: Metadata
     fosters: list[Foster]
 
+
+class KindStats(BaseModel):
+    """Statistics of the animals of one kind."""
+
+    kind: str
+    in_care: int
+    adopted: int
+    average_stay_days: Optional[float]
+
+
+class AnimalStats(BaseModel):
+    """Statistics of all animals."""
+
+    in_care: int
+    adopted: int
+    average_stay_days: Optional[float]
+    kinds: list[KindStats]
+
+
+class UserStats(BaseModel):
+    """Foster and adoption counts of one user."""
+
+    user_id: int
+    username: str
+    fosters: int
+    adoptions: int
+
+
+class StatsResponse(BaseModel):
+    """API response for the shelter statistics."""
+
+    animals: AnimalStats
+    users: list[UserStats]
@@ -0,0 +1,82 @@
+import hashlib
+import json
+
+from fastapi import Response
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong ETag from everything a representation depends on.
+
+    :param parts: JSON serializable values, eg table versions and query parameters
+    :return: quoted ETag
+    """
+
+    digest = hashlib.sha256(
+        json.dumps(parts, default=str, separators=(",", ":")).encode()
+    ).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Whether an `If-None-Match` header matches an ETag.
+
+    Uses the weak comparison that RFC 9110 prescribes for `If-None-Match`.
+
+    :param if_none_match: value of the header, if sent
+    :param etag: current ETag of the representation
+    """
+
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    return etag in (
+        candidate.strip().removeprefix("W/")
+        for candidate in if_none_match.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def row_etag(row_id: int, version: int) -> str:
+    """
+    Build the ETag of a single row from its id and version column.
+
+    The id is part of the ETag, so that one row's ETag never matches
+    another's; ids are never reused, see `AnimalInDB`.
+
+    :param row_id: id of the row
+    :param version: version of the row, eg `AnimalInDB.version`
+    :return: quoted ETag
+    """
+
+    return f'"{row_id}-{version}"'
+
+
+def if_match_versions(if_match: str | None, row_id: int) -> list[int] | None:
+    """
+    Row versions listed in an `If-Match` header, as built by `row_etag`.
+
+    Uses the strong comparison that RFC 9110 prescribes for `If-Match`,
+    so weak ETags never match, nor do ETags of other rows.
+
+    :param if_match: value of the header, if sent
+    :param row_id: id of the row to be written
+    :return: versions a write may apply to, `None` for any version
+    """
+
+    if not if_match or if_match.strip() == "*":
+        return None
+
+    versions = []
+    for candidate in if_match.split(","):
+        tag = candidate.strip().removeprefix('"').removesuffix('"')
+        _row_id, _, version = tag.partition("-")
+        if version.isdigit() and row_etag(row_id, int(version)) == candidate.strip():
+            versions.append(int(version))
+    return versions
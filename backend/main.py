@@ -1,16 +1,35 @@
+import asyncio
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 from mangum import Mangum
-
-from backend.auth import auth_router
+from sqlalchemy.pool import NullPool
+
+from backend import async_database as adb
+from backend import database as db
+from backend import auth
+from backend.auth import AuthException, auth_router, shutdown_password_executor
+from backend.metrics import (
+    AUTH_FAILURES,
+    MetricsMiddleware,
+    register_caches,
+    register_pools,
+    render_metrics,
+)
+from backend.pool import get_pool_status
+from backend.timing import TimingMiddleware
 from backend.routers.animals import animals_router
+from backend.routers.stats import stats_router
 from backend.routers.users import users_router
 from backend.database import (
     create_db_and_tables,
     EntityNotFoundException,
+    InvalidCursorException,
+    VersionMismatchException,
 )
 
 
@@ -18,6 +37,8 @@ from backend.database import (
 async def lifespan(app: FastAPI):
     create_db_and_tables()
     yield
+    shutdown_password_executor()
+    await adb.engine.dispose()
 
 
 app = FastAPI(
@@ -30,6 +51,16 @@ app = FastAPI(
 app.include_router(auth_router)
 app.include_router(animals_router)
 app.include_router(users_router)
+app.include_router(stats_router)
+
+app.add_middleware(MetricsMiddleware)
+
+app.add_middleware(
+    TimingMiddleware,
+    server_timing=os.environ.get("SERVER_TIMING", default="False").lower() in ("true", "1", "t"),
+    profile_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", default="0")),
+    profile_dir=os.environ.get("PROFILE_DIR", default="/tmp/profiles"),
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,6 +74,25 @@ app.add_middleware(
 )
 
 
+register_pools({
+    "sync": lambda: db.engine.pool,
+    "async": lambda: adb.engine.pool,
+})
+register_caches({
+    "user": lambda: db.user_cache,
+    "animals": lambda: db.animal_cache,
+})
+
+
+@app.exception_handler(AuthException)
+async def handle_auth_exception(
+    request: Request,
+    exception: AuthException,
+) -> JSONResponse:
+    AUTH_FAILURES.labels(type(exception).__name__).inc()
+    return await http_exception_handler(request, exception)
+
+
 @app.exception_handler(EntityNotFoundException)
 def handle_entity_not_found(
     _request: Request,
@@ -60,6 +110,39 @@ def handle_entity_not_found(
     )
 
 
+@app.exception_handler(InvalidCursorException)
+def handle_invalid_cursor(
+    _request: Request,
+    exception: InvalidCursorException,
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=422,
+        content={
+            "detail": {
+                "type": "invalid_cursor",
+                "cursor": exception.cursor,
+            },
+        },
+    )
+
+
+@app.exception_handler(VersionMismatchException)
+def handle_version_mismatch(
+    _request: Request,
+    exception: VersionMismatchException,
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=412,
+        content={
+            "detail": {
+                "type": "version_mismatch",
+                "entity_name": exception.entity_name,
+                "entity_id": exception.entity_id,
+            },
+        },
+    )
+
+
 @app.get("/", include_in_schema=False)
 def default() -> str:
     return HTMLResponse(
@@ -79,6 +162,25 @@ def default() -> str:
     )
 
 
+@app.get("/health", include_in_schema=False)
+def health():
+    """Report database connection pool status."""
+    return {
+        "status": "ok",
+        "pools": {
+            "sync": get_pool_status(db.engine.pool),
+            "async": get_pool_status(adb.engine.pool),
+        },
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Expose request, auth and database pool metrics to Prometheus."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @app.get("/greet")
 def greet():
     """Greet a collection of people."""
@@ -86,5 +188,35 @@ def greet():
     return {"greeting": greeting}
 
 
-lambda_handler = Mangum(app)
+def warm_up():
+    """
+    Load the password hasher and open a connection on both engines.
+
+    With `DB_POOL=null` a connection is closed as soon as it is returned,
+    so nothing of it would outlast the warm-up, and the engines are left
+    to connect on the first request.
+    """
+    auth.warm_up()
+    if isinstance(db.engine.pool, NullPool):
+        return
+    with db.engine.connect():
+        pass
+    # Mangum runs every invocation on this same event loop
+    asyncio.get_event_loop().run_until_complete(_connect_async_engine())
+
+
+async def _connect_async_engine():
+    async with adb.engine.connect():
+        pass
+
+
+# Mangum runs the lifespan around every invocation, which would check the
+# schema and dispose the pools each time, so it is off; a container instead
+# starts up once, while Lambda initializes it, before the first request
+lambda_handler = Mangum(app, lifespan="off")
+
+if "AWS_LAMBDA_FUNCTION_NAME" in os.environ:
+    create_db_and_tables()
+    if os.environ.get("STARTUP_PREWARM", default="True").lower() in ("true", "1", "t"):
+        warm_up()
 
@@ -0,0 +1,213 @@
+"""
+Prometheus metrics for the API.
+
+Metrics live in the `prometheus_client` default registry. When several
+worker processes serve the app (eg `uvicorn --workers`), point
+`PROMETHEUS_MULTIPROC_DIR` at an empty directory shared by the workers;
+each process then writes its samples to memory-mapped files there and
+`/metrics` aggregates all of them, whichever worker answers the scrape.
+"""
+
+import os
+import time
+from typing import Callable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy.pool import Pool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.cache import CacheBackend
+from backend.pool import get_pool_status
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests handled, by route template and status code.",
+    ["method", "route", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response.",
+    ["method", "route"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being handled.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+AUTH_FAILURES = Counter(
+    "auth_failures_total",
+    "Rejected authentication attempts, by exception class.",
+    ["exception"],
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total",
+    "Requests rejected with a 429, by rate limit.",
+    ["limit"],
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Time spent in bcrypt by a password worker, by operation.",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+# requests that match no route share one label value, so that scanning
+# for random urls cannot create unbounded label values
+UNMATCHED_ROUTE = "unmatched"
+
+
+class PoolCollector(Collector):
+    """Reports `get_pool_status` of connection pools at scrape time."""
+
+    def __init__(self, pools: dict[str, Callable[[], Pool]]):
+        # callables rather than pools, as `engine.dispose()` replaces the pool
+        self.pools = pools
+
+    def collect(self):
+        gauges = {
+            "size": GaugeMetricFamily(
+                "db_pool_size", "Connections kept open by the pool.", labels=["engine"]
+            ),
+            "checked_out": GaugeMetricFamily(
+                "db_pool_checked_out", "Connections in use.", labels=["engine"]
+            ),
+            "overflow": GaugeMetricFamily(
+                "db_pool_overflow", "Connections open beyond the pool size.", labels=["engine"]
+            ),
+            "wait_seconds_max": GaugeMetricFamily(
+                "db_pool_wait_seconds_max",
+                "Longest wait for a connection.",
+                labels=["engine"],
+            ),
+        }
+        counters = {
+            "checkouts": CounterMetricFamily(
+                "db_pool_checkouts", "Connections handed out.", labels=["engine"]
+            ),
+            "exhausted": CounterMetricFamily(
+                "db_pool_exhausted",
+                "Checkouts that timed out waiting for a connection.",
+                labels=["engine"],
+            ),
+            "wait_seconds_total": CounterMetricFamily(
+                "db_pool_wait_seconds",
+                "Time spent waiting for connections.",
+                labels=["engine"],
+            ),
+        }
+
+        for name, get_pool in self.pools.items():
+            status = get_pool_status(get_pool())
+            for key, family in {**gauges, **counters}.items():
+                if key in status:
+                    family.add_metric([name], status[key])
+
+        yield from gauges.values()
+        yield from counters.values()
+
+
+class CacheCollector(Collector):
+    """Reports the hit and miss counters of caches at scrape time."""
+
+    def __init__(self, caches: dict[str, Callable[[], CacheBackend]]):
+        self.caches = caches
+
+    def collect(self):
+        hits = CounterMetricFamily(
+            "cache_hits", "Cache lookups that found an entry.", labels=["cache"]
+        )
+        misses = CounterMetricFamily(
+            "cache_misses", "Cache lookups that found no entry.", labels=["cache"]
+        )
+        for name, get_cache in self.caches.items():
+            cache = get_cache()
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+
+        yield hits
+        yield misses
+
+
+class MetricsMiddleware:
+    """ASGI middleware that counts and times every HTTP request."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.labels(method).inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.labels(method).dec()
+            route = scope.get("route")
+            route = route.path if route is not None else UNMATCHED_ROUTE
+            REQUESTS.labels(method, route, status).inc()
+            REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+
+
+def register_pools(pools: dict[str, Callable[[], Pool]]):
+    """Report the status of `pools` alongside the other metrics."""
+    _register_process_collector(PoolCollector(pools))
+
+
+def register_caches(caches: dict[str, Callable[[], CacheBackend]]):
+    """Report the counters of `caches` alongside the other metrics."""
+    _register_process_collector(CacheCollector(caches))
+
+
+def _register_process_collector(collector: Collector):
+    # replaces a collector of the same type, eg when the app module is reloaded
+    for registered in list(_process_collectors):
+        if type(registered) is type(collector):
+            REGISTRY.unregister(registered)
+            _process_collectors.remove(registered)
+    REGISTRY.register(collector)
+    _process_collectors.append(collector)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Render every metric in the Prometheus text format.
+
+    :return: response body and content type
+    """
+
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    # pool and cache status is per process and is not written to the shared files
+    for collector in _process_collectors:
+        registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+_process_collectors: list[Collector] = []
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool, QueuePool
+
+
+class PoolStats:
+    """Counters for connection checkouts from a pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.exhausted = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait_seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def record_exhausted(self):
+        with self._lock:
+            self.exhausted += 1
+
+
+class _InstrumentedPool:
+    """Mixin that times every checkout and counts checkout timeouts."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        # `engine.dispose()` swaps in a new pool; keep counting into the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_exhausted()
+            raise
+
+        self.stats.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class InstrumentedNullPool(_InstrumentedPool, NullPool):
+    pass
+
+
+def _env_flag(name: str, default: str = "False") -> bool:
+    return os.environ.get(name, default=default).lower() in ("true", "1", "t")
+
+
+def get_pool_options(*, is_async: bool = False) -> dict:
+    """
+    Build `create_engine` pool arguments from the environment.
+
+    `DB_POOL=null` opens a new connection per checkout, which suits Lambda
+    behind RDS Proxy, where the proxy does the pooling. Otherwise a queue
+    pool is sized by `DB_POOL_SIZE` and `DB_MAX_OVERFLOW`, waits up to
+    `DB_POOL_TIMEOUT` seconds for a connection, replaces connections older
+    than `DB_POOL_RECYCLE` seconds and, with `DB_POOL_PRE_PING`, tests each
+    connection before handing it out.
+
+    :param is_async: whether the options are for an async engine
+    :return: keyword arguments for `create_engine`
+    """
+
+    if os.environ.get("DB_POOL", default="queue") == "null":
+        return {"poolclass": InstrumentedNullPool}
+
+    is_rds = os.environ.get("DB_LOCATION") == "rds"
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", default="5")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", default="10")),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", default="30")),
+        "pool_recycle": int(
+            os.environ.get("DB_POOL_RECYCLE", default="1800" if is_rds else "-1")
+        ),
+        "pool_pre_ping": _env_flag("DB_POOL_PRE_PING", default=str(is_rds)),
+    }
+
+
+def get_pool_status(pool: Pool) -> dict:
+    """
+    Summarize the current state and checkout counters of a pool.
+
+    :param pool: the pool of an engine, eg `engine.pool`
+    :return: pool status
+    """
+
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(
+            checkouts=stats.checkouts,
+            exhausted=stats.exhausted,
+            wait_seconds_total=stats.wait_seconds_total,
+            wait_seconds_max=stats.wait_seconds_max,
+        )
+
+    return status
@@ -0,0 +1,186 @@
+"""
+Token-bucket rate limits for the endpoints that run bcrypt.
+
+Every check of a password costs a bcrypt hash, so `/auth/token` and
+`/auth/registration` are limited per client IP, and `/auth/token` also
+per username, by FastAPI dependencies that run before the endpoint, and
+so before any hashing. A rejected request gets a `429` with the seconds
+until it may be retried in `Retry-After`.
+"""
+
+import importlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Protocol
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordRequestForm
+
+from backend.metrics import RATE_LIMITED
+
+
+class RateLimitBackend(Protocol):
+    """
+    Interface of the stores of token buckets.
+
+    `TokenBuckets` keeps the buckets in the memory of one process; a store
+    shared by several processes can implement the same methods, eg with
+    the refill and take of `TokenBuckets.take` in a Redis script.
+    """
+
+    def take(self, key: str, *, rate: float, burst: int) -> float:
+        ...
+
+    def clear(self):
+        ...
+
+
+def load_rate_limit_backend(path: str | None, *, maxsize: int) -> RateLimitBackend:
+    """
+    Build a bucket store from a factory given as `"package.module:factory"`.
+
+    :param path: import path of the factory, `TokenBuckets` if not given
+    :param maxsize: maximum number of buckets, passed to the factory
+    :return: the bucket store
+    """
+
+    if not path:
+        return TokenBuckets(maxsize=maxsize)
+
+    module_name, _, factory_name = path.partition(":")
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    return factory(maxsize=maxsize)
+
+
+class TokenBuckets:
+    """
+    Thread-safe, size-bounded store of token buckets.
+
+    A bucket holds up to `burst` tokens and refills at `rate` tokens per
+    second, and every allowed request takes one. Least recently used
+    buckets are dropped once `maxsize` is reached, and come back full, so
+    a flood of distinct keys bounds memory rather than growing it.
+    """
+
+    def __init__(self, *, maxsize: int):
+        self.maxsize = maxsize
+        # key -> (tokens, monotonic time of the last refill)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, *, rate: float, burst: int) -> float:
+        """
+        Take a token from a bucket, if it has one.
+
+        :param key: key of the bucket
+        :param rate: tokens added to the bucket per second
+        :param burst: tokens the bucket holds at most, and starts with
+        :return: 0 if a token was taken, otherwise the seconds until one is
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, refilled_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - refilled_at) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+    def clear(self):
+        """Remove every bucket, so that every key starts full again."""
+
+        with self._lock:
+            self._buckets.clear()
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, limit: str, retry_after: float):
+        seconds = math.ceil(retry_after)
+        super().__init__(
+            status_code=429,
+            detail={
+                "type": "rate_limit_exceeded",
+                "limit": limit,
+                "retry_after": seconds,
+            },
+            headers={"Retry-After": str(seconds)},
+        )
+
+
+class RateLimit:
+    """A limit of `per_minute` requests per key, in bursts of up to `burst`."""
+
+    def __init__(self, name: str, *, per_minute: float, burst: int):
+        self.name = name
+        self.per_minute = per_minute
+        self.burst = burst
+
+    def check(self, key: str):
+        """
+        Count a request against the limit.
+
+        :param key: what the request is limited by, eg the client IP
+        :raises RateLimitExceeded: if the limit is exhausted for `key`
+        """
+
+        wait = rate_limits.take(
+            f"{self.name}:{key}",
+            rate=self.per_minute / 60,
+            burst=self.burst,
+        )
+        if wait > 0:
+            RATE_LIMITED.labels(self.name).inc()
+            raise RateLimitExceeded(self.name, wait)
+
+
+# buckets of every limit; `RATE_LIMIT_BACKEND` can name a factory for a
+# store shared between worker processes, see `RateLimitBackend`
+rate_limits: RateLimitBackend = load_rate_limit_backend(
+    os.environ.get("RATE_LIMIT_BACKEND"),
+    maxsize=int(os.environ.get("RATE_LIMIT_SIZE", default="65536")),
+)
+
+ip_limit = RateLimit(
+    "ip",
+    per_minute=float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", default="30")),
+    burst=int(os.environ.get("RATE_LIMIT_IP_BURST", default="10")),
+)
+username_limit = RateLimit(
+    "username",
+    per_minute=float(os.environ.get("RATE_LIMIT_USERNAME_PER_MINUTE", default="5")),
+    burst=int(os.environ.get("RATE_LIMIT_USERNAME_BURST", default="5")),
+)
+
+
+def client_ip(request: Request) -> str:
+    """The IP of the client, as seen by the ASGI server or Mangum."""
+    return request.client.host if request.client else "unknown"
+
+
+async def limit_client(request: Request):
+    """FastAPI dependency to limit the requests of a client IP."""
+    ip_limit.check(client_ip(request))
+
+
+async def limit_login(
+    request: Request,
+    form: OAuth2PasswordRequestForm = Depends(),
+):
+    """FastAPI dependency to limit login attempts per client IP and per username."""
+    # the IP first, so requests rejected for their IP leave the username's bucket alone
+    ip_limit.check(client_ip(request))
+    username_limit.check(form.username.lower())
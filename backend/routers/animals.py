@@ -1,81 +1,465 @@
+import csv
+import io
+import json
 from datetime import date
-from typing import Literal
+from typing import AsyncIterator, Literal
 
-from fastapi import APIRouter, Depends
-from sqlmodel import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from backend.entities import (
+    Animal,
+    AnimalBatch,
     AnimalCollection,
+    BatchMetadata,
+    PageMetadata,
     AnimalCreate,
+    AnimalImport,
     AnimalUpdate,
     AnimalResponse,
+    AnimalSearch,
+    AnimalSearchResponse,
+    BulkImportResponse,
 )
+from backend import async_database as adb
 from backend import database as db
+from backend.batch import batch_ids
+from backend.etag import (
+    etag_matches,
+    if_match_versions,
+    make_etag,
+    not_modified,
+    row_etag,
+)
+from backend.serialization import (
+    NDJSON_MEDIA_TYPE,
+    accepts_ndjson,
+    dump_collection,
+    stream_ndjson,
+)
 
 animals_router = APIRouter(prefix="/animals", tags=["Animals"])
 
+CSV_MEDIA_TYPE = "text/csv"
+BULK_CHUNK_SIZE = 500
+# the body streams, so neither a long line nor many bad rows may pile up
+MAX_LINE_BYTES = 64 * 1024
+MAX_REPORTED_ERRORS = 100
 
-@animals_router.get("", response_model=AnimalCollection)
-def get_animals(
+
+@animals_router.get("", response_model=AnimalCollection | AnimalBatch)
+async def get_animals(
+    ids: list[int] | None = Depends(batch_ids),
     sort: Literal["age", "name", "intake_date"] = "name",
     intake_after: date = None,
     intake_before: date = None,
-    session: Session = Depends(db.get_session)
+    cursor: str = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    accept: str = Header(default=None),
+    if_none_match: str = Header(default=None),
+    session: AsyncSession = Depends(adb.get_session)
 ):
-    """Get a collection of animals."""
+    """
+    Get a page of animals.
+
+    At most `limit` animals are returned; pass `meta.next_cursor` as
+    `cursor` to get the next page, until it is null.
+
+    With `Accept: application/x-ndjson`, every matching animal after
+    `cursor` is streamed instead, one per line, regardless of `limit`.
+
+    With `ids`, just those animals are returned, in the requested order,
+    and the ids that do not exist are listed in `meta.missing`.
+    """
+
+    if ids is not None:
+        return await _get_animals_by_ids(session, ids, if_none_match)
 
-    # getattr(animal, "age") ~> animal.age
-    sort_key = lambda animal: getattr(animal, sort)
-    animals = db.get_all_animals(session)
+    if accepts_ndjson(accept):
+        # built before streaming starts, so an invalid cursor is still a 422
+        statement = db.select_animals(
+            sort=sort,
+            intake_after=intake_after,
+            intake_before=intake_before,
+            cursor=cursor,
+        )
+        return StreamingResponse(
+            stream_ndjson(
+                session,
+                lambda: adb.stream_animals(session, statement),
+                Animal,
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"Vary": "Accept"},
+        )
 
-    if intake_after is not None:
-        animals = [animal for animal in animals if animal.intake_date >= intake_after]
+    # versions are read before the page, so the page is never older than its ETag
+    versions = await adb.get_table_versions(session, "animals")
+    etag = make_etag(versions, sort, intake_after, intake_before, cursor, limit)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
 
-    if intake_before is not None:
-        animals = [animal for animal in animals if animal.intake_date <= intake_before]
+    # the ETag covers the table version and every parameter, so a cached
+    # page can never be stale, even if another process changed the table
+    content = db.animal_cache.get(etag)
+    if content is None:
+        animals, next_cursor = await adb.get_animals_page(
+            session,
+            sort=sort,
+            intake_after=intake_after,
+            intake_before=intake_before,
+            cursor=cursor,
+            limit=limit,
+        )
+        count = await adb.count_animals(
+            session,
+            intake_after=intake_after,
+            intake_before=intake_before,
+        )
+        content = dump_collection(
+            PageMetadata(count=count, limit=limit, next_cursor=next_cursor),
+            "animals",
+            Animal,
+            animals,
+        )
+        db.animal_cache.set(etag, content, tags=["animals"])
 
-    return AnimalCollection(
-        meta={"count": len(animals)},
-        animals=sorted(animals, key=sort_key),
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers={"ETag": etag, "Vary": "Accept"},
+    )
+
+
+async def _get_animals_by_ids(
+    session: AsyncSession,
+    animal_ids: list[int],
+    if_none_match: str | None,
+) -> Response:
+    versions = await adb.get_table_versions(session, "animals")
+    etag = make_etag(versions, "ids", animal_ids)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    animals, missing = await adb.get_animals_by_ids(session, animal_ids)
+    return Response(
+        content=dump_collection(
+            BatchMetadata(count=len(animals), missing=missing),
+            "animals",
+            Animal,
+            animals,
+        ),
+        media_type="application/json",
+        headers={"ETag": etag},
     )
 
 
 @animals_router.post("", response_model=AnimalResponse)
-def create_animal(
+async def create_animal(
     animal_create: AnimalCreate,
-    session: Session = Depends(db.get_session)
+    session: AsyncSession = Depends(adb.get_session)
 ):
     """Add a new animal."""
 
-    return AnimalResponse(animal=db.create_animal(session, animal_create))
+    return AnimalResponse(animal=await adb.create_animal(session, animal_create))
+
+
+@animals_router.post("/bulk", response_model=BulkImportResponse)
+async def import_animals(
+    request: Request,
+    session: AsyncSession = Depends(adb.get_session),
+):
+    """
+    Add animals from an NDJSON or CSV request body.
+
+    Rows are validated as the body streams in and inserted in batches
+    within one transaction. Invalid rows are skipped and counted, and the
+    first `MAX_REPORTED_ERRORS` of them are reported. A line longer than
+    `MAX_LINE_BYTES` fails the whole import with a `413`.
+
+    Rows may carry an `intake_date`, so an export can be imported again.
+    Their `id`, `adopter_id` and `adoption_date` are ignored, as the
+    animals are added as new ones, in care.
+    """
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == NDJSON_MEDIA_TYPE:
+        rows = _parse_ndjson(_iter_lines(request.stream()))
+    elif content_type == CSV_MEDIA_TYPE:
+        rows = _parse_csv(_iter_lines(request.stream()))
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail={
+                "type": "unsupported_media_type",
+                "supported": [NDJSON_MEDIA_TYPE, CSV_MEDIA_TYPE],
+            },
+        )
+
+    inserted = 0
+    failed = 0
+    errors = []
+    chunk = []
+    async for line_number, row, row_errors in rows:
+        if not row_errors:
+            try:
+                chunk.append(AnimalImport.model_validate(row))
+            except ValidationError as e:
+                row_errors = e.errors(include_url=False, include_context=False)
+
+        if row_errors:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": line_number, "errors": row_errors})
+
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            inserted += await adb.insert_animals(session, chunk)
+            chunk = []
+
+    inserted += await adb.insert_animals(session, chunk)
+    # once, just before the commit, so the version row is not locked while
+    # the body streams, and the cache is cleared only once the rows are seen
+    if inserted:
+        await adb.bump_table_versions(session, "animals")
+    await session.commit()
+    if inserted:
+        db.animal_cache.invalidate_tag("animals")
+
+    return BulkImportResponse(
+        meta={"inserted": inserted, "failed": failed},
+        errors=errors,
+    )
+
+
+@animals_router.get("/export")
+async def export_animals(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    session: AsyncSession = Depends(adb.get_session),
+):
+    """Stream every animal as NDJSON or CSV."""
+
+    if format == "csv":
+        content, media_type = _export_csv(session), CSV_MEDIA_TYPE
+    else:
+        content = stream_ndjson(session, lambda: adb.stream_animals(session), Animal)
+        media_type = NDJSON_MEDIA_TYPE
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="animals.{format}"'},
+    )
+
+
+@animals_router.get("/search", response_model=AnimalSearchResponse)
+async def search_animals(
+    q: str = None,
+    kind: str = None,
+    fixed: bool = None,
+    vaccinated: bool = None,
+    min_age: int = Query(default=None, ge=0),
+    max_age: int = Query(default=None, ge=0),
+    adopted: bool = None,
+    sort: Literal["age", "name", "intake_date"] = "name",
+    cursor: str = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    if_none_match: str = Header(default=None),
+    session: AsyncSession = Depends(adb.get_session),
+):
+    """
+    Search animals by name and attributes.
+
+    Every word of `q` matches names with a word starting with it, eg
+    "pick" matches "pickles". `facets` counts all matching animals, not
+    just this page, by kind, fixed, vaccinated and adoption status.
+    """
+
+    search = AnimalSearch(
+        q=q,
+        kind=kind,
+        fixed=fixed,
+        vaccinated=vaccinated,
+        min_age=min_age,
+        max_age=max_age,
+        adopted=adopted,
+    )
+    versions = await adb.get_table_versions(session, "animals")
+    etag = make_etag(versions, "search", search.model_dump(), sort, cursor, limit)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    content = db.animal_cache.get(etag)
+    if content is None:
+        animals, next_cursor, count, facets = await adb.search_animals(
+            session,
+            search,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+        )
+        content = dump_collection(
+            PageMetadata(count=count, limit=limit, next_cursor=next_cursor),
+            "animals",
+            Animal,
+            animals,
+            facets=facets,
+        )
+        db.animal_cache.set(etag, content, tags=["animals"])
+
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
 
 
 @animals_router.get("/{animal_id}", response_model=AnimalResponse)
-def get_animal(
+async def get_animal(
     animal_id: int,
-    session: Session = Depends(db.get_session)
+    if_none_match: str = Header(default=None),
+    response: Response = None,
+    session: AsyncSession = Depends(adb.get_session)
 ):
-    """Get an animal for a given id."""
+    """Get an animal for a given id, with its id and version as ETag."""
 
-    return AnimalResponse(animal=db.get_animal_by_id(session, animal_id))
+    animal = await adb.get_animal_by_id(session, animal_id)
+    etag = row_etag(animal.id, animal.version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
+    return AnimalResponse(animal=animal)
 
 
 @animals_router.put("/{animal_id}", response_model=AnimalResponse)
-def update_animal(
+async def update_animal(
     animal_id: int,
     animal_update: AnimalUpdate,
-    session: Session = Depends(db.get_session),
+    if_match: str = Header(default=None),
+    response: Response = None,
+    session: AsyncSession = Depends(adb.get_session),
 ):
-    """Update an animal for a given id."""
+    """
+    Update an animal for a given id.
+
+    With `If-Match`, the animal is only updated if it is still at one of
+    the listed ETags, and a `412` is returned otherwise.
+    """
 
-    return AnimalResponse(
-        animal=db.update_animal(session, animal_id, animal_update),
+    animal = await adb.update_animal(
+        session,
+        animal_id,
+        animal_update,
+        versions=if_match_versions(if_match, animal_id),
     )
+    response.headers["ETag"] = row_etag(animal.id, animal.version)
+    return AnimalResponse(animal=animal)
 
 
 @animals_router.delete("/{animal_id}", status_code=204, response_model=None)
-def delete_animal(
+async def delete_animal(
     animal_id: int,
-    session: Session = Depends(db.get_session),
+    if_match: str = Header(default=None),
+    session: AsyncSession = Depends(adb.get_session),
 ) -> None:
-    db.delete_animal(session, animal_id)
+    """Delete an animal for a given id, with `If-Match` like its update."""
+
+    await adb.delete_animal(session, animal_id, versions=if_match_versions(if_match, animal_id))
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # only the new chunk is split; the unfinished line is kept apart
+    pending = bytearray()
+    async for chunk in chunks:
+        *lines, rest = chunk.split(b"\n")
+        if lines:
+            lines[0] = bytes(pending) + lines[0]
+            pending.clear()
+        for line in lines:
+            _check_line_length(len(line))
+            yield line
+        pending += rest
+        _check_line_length(len(pending))
+    if pending:
+        yield bytes(pending)
+
+
+def _check_line_length(length: int) -> None:
+    if length > MAX_LINE_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail={"type": "line_too_long", "max_bytes": MAX_LINE_BYTES},
+        )
+
+
+def _decode_line(line: bytes) -> tuple[str | None, list[dict]]:
+    # `utf-8-sig` drops the byte order mark that eg Excel writes first
+    try:
+        return line.decode("utf-8-sig"), []
+    except UnicodeDecodeError as e:
+        return None, [{"type": "unicode_invalid", "msg": str(e)}]
+
+
+# parsers yield (line number, row, parse errors) for every non-blank line
+
+
+async def _parse_ndjson(lines: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    line_number = 0
+    async for raw_line in lines:
+        line_number += 1
+        if not raw_line.strip():
+            continue
+        line, errors = _decode_line(raw_line)
+        if errors:
+            yield line_number, None, errors
+            continue
+        try:
+            yield line_number, json.loads(line), []
+        except ValueError as e:
+            yield line_number, None, [{"type": "json_invalid", "msg": str(e)}]
+
+
+async def _parse_csv(lines: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    # one physical line per row, so quoted fields cannot contain newlines
+    header = None
+    line_number = 0
+    async for raw_line in lines:
+        line_number += 1
+        if not raw_line.strip():
+            continue
+        line, errors = _decode_line(raw_line)
+        if errors:
+            # without a header, no later row could be read either
+            yield line_number, None, errors
+            if header is None:
+                header = []
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        if len(values) != len(header):
+            message = f"expected {len(header)} columns, got {len(values)}"
+            yield line_number, None, [{"type": "csv_columns", "msg": message}]
+            continue
+        # empty cells fall back to the model defaults
+        row = {key: value for key, value in zip(header, values) if value != ""}
+        yield line_number, row, []
+
+
+async def _export_csv(session: AsyncSession) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(Animal.model_fields))
+    writer.writeheader()
+    yield buffer.getvalue()
+    try:
+        result = await adb.stream_animals(session)
+        async for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(row._mapping for row in rows)
+            yield buffer.getvalue()
+    finally:
+        await session.close()
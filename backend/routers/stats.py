@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Header, Query, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import async_database as adb
+from backend import database as db
+from backend.entities import StatsResponse
+from backend.etag import etag_matches, make_etag, not_modified
+
+stats_router = APIRouter(prefix="/stats", tags=["Stats"])
+
+
+@stats_router.get("", response_model=StatsResponse)
+async def get_stats(
+    user_limit: int = Query(default=100, ge=1, le=1000),
+    if_none_match: str = Header(default=None),
+    session: AsyncSession = Depends(adb.get_session),
+):
+    """
+    Get the shelter statistics.
+
+    Animals in care, adopted and their average stay in days, by kind, and
+    the foster and adoption counts of the `user_limit` most active users.
+    """
+
+    versions = await adb.get_table_versions(session, "users", "animals", "fosters")
+    etag = make_etag(versions, "stats", user_limit)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    # recomputed only after a write to one of the tables
+    content = db.animal_cache.get(etag)
+    if content is None:
+        stats = await adb.get_stats(session, user_limit=user_limit)
+        content = stats.model_dump_json().encode()
+        db.animal_cache.set(etag, content, tags=["animals"])
+
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
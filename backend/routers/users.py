@@ -1,63 +1,188 @@
-from fastapi import APIRouter, Depends, Query
-from sqlmodel import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from backend import database as db
+from backend import async_database as adb
 from backend.auth import get_current_user
+from backend.batch import batch_ids
+from backend.etag import etag_matches, make_etag, not_modified
+from backend.serialization import (
+    NDJSON_MEDIA_TYPE,
+    accepts_ndjson,
+    dump_collection,
+    stream_ndjson,
+)
 from backend.entities import (
+    Animal,
     AnimalCollection,
+    BatchMetadata,
+    Metadata,
+    PageMetadata,
+    User,
     UserInDB,
+    UserBatch,
     UserCollection,
     UserResponse,
     EnhancedUserResponse,
+    Foster,
     FosterCollection,
 )
 
 users_router = APIRouter(prefix="/users", tags=["Users"])
 
 
-@users_router.get("", response_model=UserCollection)
-def get_users(session: Session = Depends(db.get_session)):
-    users = db.get_all_users(session)
-    return UserCollection(
-        meta={"count": len(users)},
-        users=users,
+@users_router.get("", response_model=UserCollection | UserBatch)
+async def get_users(
+    ids: list[int] | None = Depends(batch_ids),
+    accept: str = Header(default=None),
+    if_none_match: str = Header(default=None),
+    session: AsyncSession = Depends(adb.get_session),
+):
+    """
+    Get every user, streamed one per line with `Accept: application/x-ndjson`.
+
+    With `ids`, just those users are returned, in the requested order,
+    and the ids that do not exist are listed in `meta.missing`.
+    """
+
+    if ids is not None:
+        return await _get_users_by_ids(session, ids, if_none_match)
+
+    if accepts_ndjson(accept):
+        return StreamingResponse(
+            stream_ndjson(session, lambda: adb.stream_users(session), User),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"Vary": "Accept"},
+        )
+
+    users = await adb.get_all_users(session)
+    return Response(
+        content=dump_collection(Metadata(count=len(users)), "users", User, users),
+        media_type="application/json",
+        headers={"Vary": "Accept"},
+    )
+
+
+async def _get_users_by_ids(
+    session: AsyncSession,
+    user_ids: list[int],
+    if_none_match: str | None,
+) -> Response:
+    versions = await adb.get_table_versions(session, "users")
+    etag = make_etag(versions, "ids", user_ids)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    users, missing = await adb.get_users_by_ids(session, user_ids)
+    return Response(
+        content=dump_collection(
+            BatchMetadata(count=len(users), missing=missing),
+            "users",
+            User,
+            users,
+        ),
+        media_type="application/json",
+        headers={"ETag": etag},
     )
 
 
 @users_router.get("/me", response_model=UserResponse)
-def get_self(user: UserInDB = Depends(get_current_user)):
+async def get_self(user: UserInDB = Depends(get_current_user)):
     """Get current user."""
     return UserResponse(user=user)
 
 
-@users_router.get("/{user_id}", response_model=UserResponse)
-def get_user(
+@users_router.get(
+    "/{user_id}",
+    response_model=EnhancedUserResponse,
+    response_model_exclude_unset=True,
+)
+async def get_user(
     user_id: int,
-    session: Session = Depends(db.get_session),
+    include: list[str] = Query(default=[]),
+    if_none_match: str = Header(default=None),
+    response: Response = None,
+    session: AsyncSession = Depends(adb.get_session),
 ):
-    user = db.get_user_by_id(session, user_id)
-    return UserResponse(user=user)
+    """Get a user, optionally with their pets and fosters."""
+
+    # accept both `?include=pets,fosters` and `?include=pets&include=fosters`
+    relations = {field for value in include for field in value.split(",") if field}
+    invalid = relations - {"pets", "fosters"}
+    if invalid:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "type": "invalid_include",
+                "include": sorted(invalid),
+            },
+        )
+
+    versions = await adb.get_table_versions(session, "users", "animals", "fosters")
+    etag = make_etag(versions, user_id, sorted(relations))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    user = await adb.get_user_with_relations(session, user_id, relations)
+    content = {"user": user}
+    if "pets" in relations:
+        content["pets"] = user.pets
+    if "fosters" in relations:
+        content["fosters"] = user.foster_animals
+
+    response.headers["ETag"] = etag
+    return EnhancedUserResponse(**content)
 
 
 @users_router.delete("/{user_id}", status_code=204)
-def delete_user(user_id: str, session: Session = Depends(db.get_session)):
-    db.delete_user(session, user_id)
+async def delete_user(user_id: int, session: AsyncSession = Depends(adb.get_session)):
+    await adb.delete_user(session, user_id)
 
 
 @users_router.get("/{user_id}/fosters", response_model=FosterCollection)
-def get_user_fosters(user_id: str, session: Session = Depends(db.get_session)):
-    fosters = db.get_fosters(session, user_id)
+async def get_user_fosters(
+    user_id: int,
+    accept: str = Header(default=None),
+    session: AsyncSession = Depends(adb.get_session),
+):
+    """Get a user's fosters, streamed one per line with `Accept: application/x-ndjson`."""
+
+    if accepts_ndjson(accept):
+        user = await adb.get_user_by_id(session, user_id)
+        user_data = {field: getattr(user, field) for field in User.model_fields}
+        animal_fields = list(Animal.model_fields)
+
+        def _to_foster(row) -> dict:
+            # the animal columns come first, followed by the foster period
+            return {
+                "animal": dict(zip(animal_fields, row)),
+                "user": user_data,
+                "start_date": row.start_date,
+                "end_date": row.end_date,
+            }
+
+        return StreamingResponse(
+            stream_ndjson(
+                session,
+                lambda: adb.stream_fosters(session, user_id),
+                Foster,
+                _to_foster,
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"Vary": "Accept"},
+        )
+
+    fosters = await adb.get_fosters(session, user_id)
     return FosterCollection(
         meta={"count": len(fosters)},
         fosters=fosters,
     )
 
 
-@users_router.get("/{user_id}/pets")
-def get_user_pets(user_id: str, session: Session = Depends(db.get_session)):
-    user = db.get_user_by_id(session, user_id)
-    pets = user.pets
-    return AnimalCollection(
-        meta={"count": len(pets)},
-        animals=pets,
+@users_router.get("/{user_id}/pets", response_model=AnimalCollection)
+async def get_user_pets(user_id: int, session: AsyncSession = Depends(adb.get_session)):
+    pets = await adb.get_user_pets(session, user_id)
+    return Response(
+        content=dump_collection(PageMetadata(count=len(pets)), "animals", Animal, pets),
+        media_type="application/json",
     )
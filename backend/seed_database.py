@@ -1,12 +1,24 @@
+import argparse
 import json
-from datetime import date, datetime
+import random
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator
 
+from sqlalchemy import func, insert, select, text
 from sqlmodel import Session
 
 from backend.auth import pwd_context
-from backend.database import engine, create_db_and_tables
+from backend.database import bump_table_versions, engine, create_db_and_tables
 from backend.entities import *
 
+ANIMAL_NAMES = [
+    "bagels", "biscuit", "chompers", "clover", "gizmo", "juniper", "mochi",
+    "nibbles", "noodle", "paperclip", "pickles", "pretzel", "sprocket",
+    "taco", "waffles", "ziggy",
+]
+ANIMAL_KINDS = ["cat", "dog", "rabbit", "turtle", "bird"]
+FIRST_DATE = date(2020, 1, 1)
+
 
 def seed_database():
     with open("backend/fake_db.json", "r") as f:
@@ -14,9 +26,12 @@ def seed_database():
 
     create_db_and_tables()
 
+    # every seeded user has the same password, so hash it once
+    hashed_password = pwd_context.hash("password")
+
     with Session(engine) as session:
-        animals = [
-            AnimalInDB(
+        animals = {
+            animal_id: AnimalInDB(
                 **{
                     **animal_data,
                     "id": None,
@@ -25,11 +40,11 @@ def seed_database():
                     ),
                 }
             )
-            for animal_data in DB["animals"].values()
-        ]
+            for animal_id, animal_data in DB["animals"].items()
+        }
 
-        users = [
-            UserInDB(
+        users = {
+            user_data["id"]: UserInDB(
                 **{
                     **user_data,
                     "id": None,
@@ -39,40 +54,31 @@ def seed_database():
                     ).replace(
                         microsecond=0
                     ),
-                    "hashed_password": pwd_context.hash("password"),
+                    "hashed_password": hashed_password,
                 }
             )
             for user_data in DB["users"].values()
-        ]
+        }
 
-        session.add_all(animals)
-        session.add_all(users)
-        session.commit()
+        session.add_all(animals.values())
+        session.add_all(users.values())
+        session.flush()
 
         for adoption in DB["adoptions"]:
-            animal_name = DB["animals"][adoption["animal_id"]]["name"]
-            user_name = adoption["user_id"]
-            animal = next(a for a in animals if a.name == animal_name)
-            user = next(u for u in users if u.username == user_name)
-            animal.adopter_id = user.id
+            animal = animals[adoption["animal_id"]]
+            animal.adopter_id = users[adoption["user_id"]].id
             animal.adoption_date = date.fromisoformat(adoption["adoption_date"])
 
-        session.add_all(animals)
-        session.commit()
-
-        for foster in DB["fosters"]:
-            animal_name = DB["animals"][foster["animal_id"]]["name"]
-            user_name = foster["user_id"]
-            animal = next(a for a in animals if a.name == animal_name)
-            user = next(u for u in users if u.username == user_name)
-            foster = FosterInDB(
-                user_id=user.id,
-                animal_id=animal.id,
+        session.add_all(
+            FosterInDB(
+                user_id=users[foster["user_id"]].id,
+                animal_id=animals[foster["animal_id"]].id,
                 start_date=date.fromisoformat(foster["start_date"]),
                 end_date=date.fromisoformat(foster["end_date"]),
             )
-            session.add(foster)
-
+            for foster in DB["fosters"]
+        )
+        bump_table_versions(session, "users", "animals", "fosters")
         session.commit()
 
         return {
@@ -80,9 +86,218 @@ def seed_database():
             "animal_count": len(animals),
         }
 
+
+def generate_users(
+    count: int,
+    *,
+    hashed_password: str,
+    seed: int = 0,
+    start_id: int = 1,
+) -> Iterator[dict]:
+    """
+    Generate rows for the `users` table.
+
+    :param count: number of users to generate
+    :param hashed_password: password hash shared by every user
+    :param seed: seed for the random number generator
+    :param start_id: id of the first user
+    :return: iterator of user rows
+    """
+
+    rng = random.Random(f"users-{seed}")
+    for user_id in range(start_id, start_id + count):
+        yield {
+            "id": user_id,
+            "username": f"user{user_id}",
+            "email": f"user{user_id}@cool.email",
+            "hashed_password": hashed_password,
+            "created_at": datetime(2020, 1, 1) + timedelta(seconds=rng.randrange(10**8)),
+        }
+
+
+def generate_animals(
+    count: int,
+    *,
+    user_ids: range,
+    seed: int = 0,
+    start_id: int = 1,
+    adoption_rate: float = 0.3,
+    foster_rate: float = 0.4,
+) -> Iterator[tuple[dict, list[dict]]]:
+    """
+    Generate rows for the `animals` table with their `fosters` rows.
+
+    Adoptions are set on the animal row directly, and every foster period
+    ends before the adoption, so no second pass over the rows is needed.
+
+    :param count: number of animals to generate
+    :param user_ids: ids of the users that adopt and foster
+    :param seed: seed for the random number generator
+    :param start_id: id of the first animal
+    :param adoption_rate: share of animals that are adopted
+    :param foster_rate: share of animals that are fostered
+    :return: iterator of animal rows, each with its foster rows
+    """
+
+    rng = random.Random(f"animals-{seed}")
+    for animal_id in range(start_id, start_id + count):
+        intake_date = FIRST_DATE + timedelta(days=rng.randrange(1500))
+        animal = {
+            "id": animal_id,
+            "name": rng.choice(ANIMAL_NAMES),
+            "age": rng.randrange(20),
+            "kind": rng.choice(ANIMAL_KINDS),
+            "fixed": rng.random() < 0.5,
+            "vaccinated": rng.random() < 0.5,
+            "intake_date": intake_date,
+            "adopter_id": None,
+            "adoption_date": None,
+        }
+
+        fosters = []
+        start_date = intake_date
+        if user_ids and rng.random() < foster_rate:
+            for user_id in rng.sample(user_ids, min(rng.randint(1, 3), len(user_ids))):
+                end_date = start_date + timedelta(days=rng.randint(7, 60))
+                fosters.append({
+                    "user_id": user_id,
+                    "animal_id": animal_id,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                })
+                start_date = end_date
+
+        if user_ids and rng.random() < adoption_rate:
+            animal["adopter_id"] = rng.choice(user_ids)
+            animal["adoption_date"] = start_date + timedelta(days=rng.randint(1, 30))
+
+        yield animal, fosters
+
+
+def seed_synthetic_database(
+    *,
+    users: int = 100,
+    animals: int = 1000,
+    seed: int = 0,
+    password: str = "password",
+    chunk_size: int = 10_000,
+    bind=None,
+) -> dict:
+    """
+    Add a deterministic synthetic dataset to the database.
+
+    Rows are generated lazily and inserted in `chunk_size` batches, so
+    memory stays flat for datasets of millions of rows. New ids continue
+    from the largest existing ones, and on Postgres the id sequences are
+    moved past them, so later inserts without an id keep working.
+
+    :param users: number of users to add
+    :param animals: number of animals to add
+    :param seed: seed that determines the generated data
+    :param password: password of every generated user
+    :param chunk_size: number of rows per insert statement
+    :param bind: engine to use, defaults to the application engine
+    :return: counts of the rows added
+    """
+
+    bind = bind or engine
+    hashed_password = pwd_context.hash(password)
+    foster_count = 0
+
+    with bind.begin() as connection:
+        first_user_id = connection.scalar(select(func.max(UserInDB.id))) or 0
+        first_animal_id = connection.scalar(select(func.max(AnimalInDB.id))) or 0
+        user_ids = range(first_user_id + 1, first_user_id + 1 + users)
+
+        _insert_in_chunks(
+            connection,
+            UserInDB,
+            generate_users(
+                users,
+                hashed_password=hashed_password,
+                seed=seed,
+                start_id=user_ids.start,
+            ),
+            chunk_size,
+        )
+
+        animal_rows, foster_rows = [], []
+        for animal, fosters in generate_animals(
+            animals,
+            user_ids=user_ids,
+            seed=seed,
+            start_id=first_animal_id + 1,
+        ):
+            animal_rows.append(animal)
+            foster_rows.extend(fosters)
+            if len(animal_rows) >= chunk_size:
+                connection.execute(insert(AnimalInDB), animal_rows)
+                foster_count += _insert_in_chunks(
+                    connection, FosterInDB, foster_rows, chunk_size
+                )
+                animal_rows, foster_rows = [], []
+
+        if animal_rows:
+            connection.execute(insert(AnimalInDB), animal_rows)
+        foster_count += _insert_in_chunks(connection, FosterInDB, foster_rows, chunk_size)
+        _advance_id_sequences(connection, UserInDB, AnimalInDB)
+
+    # after the rows are committed, so an ETag never claims rows not yet visible
+    with Session(bind) as session:
+        bump_table_versions(session, "users", "animals", "fosters")
+        session.commit()
+
+    return {
+        "user_count": users,
+        "animal_count": animals,
+        "foster_count": foster_count,
+    }
+
+
+def _insert_in_chunks(connection, model, rows: Iterable[dict], chunk_size: int) -> int:
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            connection.execute(insert(model), chunk)
+            count += len(chunk)
+            chunk = []
+
+    if chunk:
+        connection.execute(insert(model), chunk)
+        count += len(chunk)
+
+    return count
+
+
+def _advance_id_sequences(connection, *models) -> None:
+    # the rows above have explicit ids, which Postgres does not count against
+    # the SERIAL sequences, so the next insert without an id would reuse one
+    if connection.dialect.name != "postgresql":
+        return
+
+    for model in models:
+        table = model.__tablename__
+        connection.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+            )
+        )
+
+
 def lambda_handler(event, context):
     try:
-        result = seed_database()
+        if event and ("users" in event or "animals" in event):
+            create_db_and_tables()
+            result = seed_synthetic_database(
+                users=int(event.get("users", 0)),
+                animals=int(event.get("animals", 0)),
+                seed=int(event.get("seed", 0)),
+            )
+        else:
+            result = seed_database()
         return {
             "statusCode": 200,
             "body": json.dumps(result)
@@ -95,5 +310,20 @@ def lambda_handler(event, context):
 
 
 if __name__ == "__main__":
-    seed_database()
+    parser = argparse.ArgumentParser(description="Seed the buddy system database.")
+    parser.add_argument("--users", type=int, help="generate this many synthetic users")
+    parser.add_argument("--animals", type=int, help="generate this many synthetic animals")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
 
+    if args.users is None and args.animals is None:
+        print(seed_database())
+    else:
+        create_db_and_tables()
+        print(
+            seed_synthetic_database(
+                users=args.users or 0,
+                animals=args.animals or 0,
+                seed=args.seed,
+            )
+        )
@@ -0,0 +1,163 @@
+"""
+Serialize query rows straight to JSON bytes.
+
+Returning ORM instances from an endpoint builds them, validates them into
+the response model and then encodes that model again. For collections,
+`row_columns` selects just the columns of a response model as plain row
+tuples, and `dump_collection` dumps them with a pydantic-core serializer
+compiled once per model, with the same output as the model itself.
+`stream_ndjson` does the same for a streamed query, one line per row.
+"""
+
+import functools
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Sequence
+
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Column, Row
+from sqlalchemy.ext.asyncio import AsyncResult, AsyncSession
+from sqlmodel import SQLModel
+from typing_extensions import TypedDict
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def row_columns(model: type[BaseModel], table_model: type[SQLModel]) -> list[Column]:
+    """
+    Columns of `table_model` for the fields of `model`, in field order.
+
+    :param model: response model, eg `Animal`
+    :param table_model: database model with a column for each field
+    :return: columns to select
+    """
+
+    table = table_model.__table__
+    return [table.columns[name] for name in model.model_fields]
+
+
+@functools.cache
+def _row_type(model: type[BaseModel]) -> type:
+    # a TypedDict of the same fields serializes plain dicts without
+    # building or validating an instance of `model` for every row
+    fields = {}
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            annotation = _row_type(annotation)
+        fields[name] = annotation
+
+    return TypedDict(f"{model.__name__}Row", fields)
+
+
+@functools.cache
+def row_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[_row_type(model)])
+
+
+@functools.cache
+def item_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(_row_type(model))
+
+
+def dump_rows(model: type[BaseModel], rows: Sequence[Row]) -> bytes:
+    """
+    Serialize rows selected with `row_columns` to a JSON array.
+
+    :param model: response model the rows were selected for
+    :param rows: rows to serialize
+    :return: JSON bytes
+    """
+
+    # rows of one query share their fields; zipping is much cheaper than `Row._asdict`
+    fields = rows[0]._fields if rows else ()
+    return row_adapter(model).dump_json([dict(zip(fields, row)) for row in rows])
+
+
+def dump_ndjson(model: type[BaseModel], items: Iterable[dict]) -> bytes:
+    """
+    Serialize items to NDJSON, one line per item.
+
+    :param model: response model of the items, nested models as dicts
+    :param items: items to serialize
+    :return: NDJSON bytes
+    """
+
+    adapter = item_adapter(model)
+    return b"".join(adapter.dump_json(item) + b"\n" for item in items)
+
+
+def accepts_ndjson(accept: str | None) -> bool:
+    """Whether an `Accept` header lists the NDJSON media type."""
+
+    if not accept:
+        return False
+    return any(
+        media_range.split(";")[0].strip() == NDJSON_MEDIA_TYPE
+        for media_range in accept.split(",")
+    )
+
+
+async def stream_ndjson(
+    session: AsyncSession,
+    open_result: Callable[[], Awaitable[AsyncResult]],
+    model: type[BaseModel],
+    to_item: Callable[[Row], dict] | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream the rows of a query as NDJSON, one chunk per fetched batch.
+
+    FastAPI closes dependencies before a streamed body is sent, so the
+    query is only opened once streaming starts, and `session` is closed
+    when it ends.
+
+    :param session: session to run the query in
+    :param open_result: opens the streamed result, eg `adb.stream_animals`
+    :param model: response model the rows were selected for
+    :param to_item: builds the item of a row, a dict of its columns by default
+    :return: iterator of NDJSON chunks
+    """
+
+    try:
+        result = await open_result()
+        async for rows in result.partitions():
+            if to_item is None:
+                fields = rows[0]._fields
+                items = (dict(zip(fields, row)) for row in rows)
+            else:
+                items = (to_item(row) for row in rows)
+            yield dump_ndjson(model, items)
+    finally:
+        await session.close()
+
+
+def dump_collection(
+    meta: BaseModel,
+    name: str,
+    model: type[BaseModel],
+    rows: Sequence[Row],
+    **fields: BaseModel,
+) -> bytes:
+    """
+    Serialize a collection response, eg `AnimalCollection`, from rows.
+
+    :param meta: metadata of the collection
+    :param name: field that holds the rows, eg `"animals"`
+    :param model: response model the rows were selected for
+    :param rows: rows to serialize
+    :param fields: other fields of the response, in order between
+        `meta` and the rows, eg `facets` of `AnimalSearchResponse`
+    :return: JSON bytes
+    """
+
+    return b"".join([
+        b'{"meta":',
+        meta.model_dump_json().encode(),
+        *(
+            b',"%s":%s' % (field.encode(), value.model_dump_json().encode())
+            for field, value in fields.items()
+        ),
+        b',"',
+        name.encode(),
+        b'":',
+        dump_rows(model, rows),
+        b"}",
+    ])
@@ -0,0 +1,145 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class RequestTiming:
+    """SQL statement count and time of a single request."""
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+    def server_timing(self, total_seconds: float) -> str:
+        return ", ".join([
+            f"total;dur={total_seconds * 1000:.2f}",
+            f'db;dur={self.sql_seconds * 1000:.2f};desc="{self.statements} queries"',
+        ])
+
+
+_current_timing: ContextVar[RequestTiming | None] = ContextVar(
+    "current_timing",
+    default=None,
+)
+
+
+def current_timing() -> RequestTiming | None:
+    """Timing of the request being handled, if any."""
+    return _current_timing.get()
+
+
+# listening on `Engine` covers every engine, including the ones behind
+# async engines and the ones built by tests and benchmarks
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_timing.get() is not None:
+        context._timing_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _current_timing.get()
+    start = getattr(context, "_timing_start", None)
+    if timing is not None and start is not None:
+        timing.statements += 1
+        timing.sql_seconds += time.perf_counter() - start
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware that reports wall time, SQL statement count and SQL
+    time of every request in a `Server-Timing` response header, if
+    `server_timing` is set. The header tells every client about the
+    queries behind a response, so it is off unless asked for.
+
+    With `profile_rate` above zero, that share of requests is also run
+    under cProfile and the profile is written to `profile_dir`, one file
+    per request, named after the route. Only one request is profiled at
+    a time, since a profiler hooks the whole thread; for the same reason
+    a profile also shows other requests interleaved on the event loop.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        server_timing: bool = False,
+        profile_rate: float = 0.0,
+        profile_dir: str = "profiles",
+    ):
+        self.app = app
+        self.server_timing = server_timing
+        self.profile_rate = profile_rate
+        self.profile_dir = profile_dir
+        self._profile_lock = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiler = self._start_profiler()
+        try:
+            if self.server_timing:
+                await self._call_timed(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            if profiler is not None:
+                self._write_profile(profiler, scope)
+
+    async def _call_timed(self, scope: Scope, receive: Receive, send: Send):
+        timing = RequestTiming()
+        token = _current_timing.set(timing)
+        start = time.perf_counter()
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    timing.server_timing(time.perf_counter() - start),
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timing.reset(token)
+
+    def _start_profiler(self) -> cProfile.Profile | None:
+        if self.profile_rate <= 0 or random.random() >= self.profile_rate:
+            return None
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _write_profile(self, profiler: cProfile.Profile, scope: Scope):
+        try:
+            profiler.disable()
+            route = scope.get("route")
+            path = route.path if route is not None else scope["path"]
+            name = re.sub(r"[^A-Za-z0-9_-]+", "_", path).strip("_") or "root"
+            timestamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(
+                os.path.join(
+                    self.profile_dir,
+                    f"{timestamp}-{scope['method']}-{name}.prof",
+                )
+            )
+        finally:
+            self._profile_lock.release()
@@ -0,0 +1,267 @@
+"""
+Benchmark the API's hot endpoints at several dataset sizes.
+
+    python -m benchmarks.api --sizes 1000 10000 100000
+    python -m benchmarks.api --db-url postgresql://user:pw@localhost/bench
+    python -m benchmarks.api compare before.json after.json
+
+Each size seeds `size` animals and `size / 10` users with
+`seed_synthetic_database`, then drives the real app in process. The
+scenarios served from `database.animal_cache` are measured twice, once
+cached and once with the cache off, so a query regression is not hidden
+by cache hits. Results are written as JSON, by default to
+`benchmarks/results/<commit>.json`, and two result files can be compared
+to spot regressions.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import async_database as adb
+from backend import database as db
+from backend.cache import TTLCache
+from backend.entities import FosterInDB
+from backend.main import app
+from backend.ratelimit import limit_login
+from backend.seed_database import seed_synthetic_database
+from benchmarks.harness import asgi_client, measure
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+# scenarios whose responses are kept in `database.animal_cache`
+ANIMAL_CACHE_SCENARIOS = ("GET /animals", "GET /stats")
+
+
+def scenarios(user_id: int, token: str) -> list[tuple[str, str, str, dict]]:
+    """(name, method, url, request kwargs) for every measured request."""
+
+    animal_scenarios = [
+        (f"GET /animals?sort={sort}{label}", "GET", f"/animals?sort={sort}{query}", {})
+        for sort in ["name", "age", "intake_date"]
+        for label, query in [
+            ("", ""),
+            (" with dates", "&intake_after=2021-01-01&intake_before=2022-12-31"),
+        ]
+    ]
+    return [
+        *animal_scenarios,
+        ("GET /users/{id}/fosters", "GET", f"/users/{user_id}/fosters", {}),
+        ("GET /stats", "GET", "/stats", {}),
+        (
+            "GET /users/me",
+            "GET",
+            "/users/me",
+            {"headers": {"Authorization": f"Bearer {token}"}},
+        ),
+        (
+            "POST /auth/token",
+            "POST",
+            "/auth/token",
+            {"data": {"username": f"user{user_id}", "password": "password"}},
+        ),
+    ]
+
+
+def seed(db_url: str, size: int) -> int:
+    """Recreate the schema, seed it and return the id of the busiest fosterer."""
+
+    engine = create_engine(db_url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    seed_synthetic_database(users=max(1, size // 10), animals=size, bind=engine)
+    with engine.connect() as connection:
+        user_id = connection.scalar(
+            select(FosterInDB.user_id)
+            .group_by(FosterInDB.user_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        )
+    engine.dispose()
+    return user_id or 1
+
+
+async def _no_limit():
+    pass
+
+
+@contextmanager
+def _without_animal_cache():
+    # a cache that stores nothing, so every request runs its queries
+    cache = db.animal_cache
+    db.animal_cache = TTLCache(maxsize=0, ttl=0)
+    try:
+        yield
+    finally:
+        db.animal_cache = cache
+
+
+def _cache_variants(name: str) -> list[tuple[str, object]]:
+    if not name.startswith(ANIMAL_CACHE_SCENARIOS):
+        return [(name, nullcontext)]
+    return [(f"{name} cached", nullcontext), (f"{name} uncached", _without_animal_cache)]
+
+
+async def run_size(db_url: str, size: int, args) -> list[dict]:
+    user_id = seed(db_url, size)
+    engine = create_engine(db_url)
+    async_engine = create_async_engine(adb.get_db_url(db_url))
+
+    def _get_session_override():
+        with Session(engine) as session:
+            yield session
+
+    async def _get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides[db.get_session] = _get_session_override
+    app.dependency_overrides[adb.get_session] = _get_async_session_override
+    # `POST /auth/token` is measured for bcrypt, one username from one client
+    app.dependency_overrides[limit_login] = _no_limit
+
+    results = []
+    try:
+        async with asgi_client(app) as client:
+            response = await client.post(
+                "/auth/token",
+                data={"username": f"user{user_id}", "password": "password"},
+            )
+            token = response.raise_for_status().json()["access_token"]
+
+            for scenario, method, url, kwargs in scenarios(user_id, token):
+                # password hashing is deliberately slow, so sample it less
+                total = args.requests // 10 if scenario == "POST /auth/token" else args.requests
+                for name, cache_context in _cache_variants(scenario):
+                    with cache_context():
+                        result = await measure(
+                            client,
+                            method,
+                            url,
+                            concurrency=args.concurrency,
+                            total=max(total, 1),
+                            warmup=args.warmup,
+                            **kwargs,
+                        )
+                    result.update(scenario=name, size=size, db=engine.dialect.name)
+                    results.append(result)
+                    print(
+                        f"{engine.dialect.name:<10} {size:>8} {name:<50}"
+                        f" {result['rps']:>9.1f} {result['p50_ms']:>9.2f}"
+                        f" {result['p99_ms']:>9.2f}"
+                    )
+    finally:
+        app.dependency_overrides.clear()
+        await async_engine.dispose()
+        engine.dispose()
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args):
+    db_urls = args.db_url or [f"sqlite:///{tempfile.mkdtemp()}/bench.db"]
+    commit = git_commit()
+
+    print(f"{'db':<10} {'size':>8} {'scenario':<50} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    results = []
+    for db_url in db_urls:
+        for size in args.sizes:
+            results.extend(asyncio.run(run_size(db_url, size, args)))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "meta": {
+                    "commit": commit,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "concurrency": args.concurrency,
+                    "requests": args.requests,
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nwrote {output}")
+
+
+def compare(args) -> int:
+    """Print p50 changes between two result files; fail on regressions."""
+
+    def _load(path):
+        with open(path) as f:
+            return {
+                (result["db"], result["size"], result["scenario"]): result
+                for result in json.load(f)["results"]
+            }
+
+    before, after = _load(args.before), _load(args.after)
+    regressions = 0
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key]["p50_ms"], after[key]["p50_ms"]
+        change = (new - old) / old * 100 if old else 0.0
+        flag = ""
+        if change > args.threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{key[0]:<10} {key[1]:>8} {key[2]:<50} {old:>9.2f} -> {new:>9.2f} ms ({change:+.1f}%){flag}")
+
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=10.0,
+        help="p50 increase, in percent, reported as a regression",
+    )
+
+    parser.add_argument(
+        "--db-url", action="append",
+        help="database to benchmark, repeatable; defaults to a temp SQLite file",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--output", help="result file, defaults to benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        sys.exit(compare(args))
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Compare sync and async endpoints under increasing concurrency.
+
+    python -m benchmarks.async_load --animals 5000 --requests 1000
+    python -m benchmarks.async_load --db-url postgresql://user:pw@localhost/bench
+
+Both endpoints serve the same `GET /animals` page query: one as a sync
+`def` on `database.get_session` (run in the threadpool), the other as an
+`async def` on `async_database.get_session`. Requests are driven in
+process through the ASGI interface, so only the app is measured.
+"""
+
+import argparse
+import asyncio
+import tempfile
+
+from fastapi import Depends, FastAPI, Response
+from sqlalchemy import AsyncAdaptedQueuePool, QueuePool, create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import async_database as adb
+from backend import database as db
+from backend.entities import Animal, Metadata
+from backend.seed_database import seed_synthetic_database
+from backend.serialization import dump_collection
+from benchmarks.harness import asgi_client, measure
+
+
+def build_app(db_url: str, async_db_url: str, pool_size: int) -> FastAPI:
+    engine = create_engine(
+        db_url,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+        connect_args={"check_same_thread": False} if db_url.startswith("sqlite") else {},
+    )
+    async_engine = create_async_engine(
+        async_db_url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+    )
+    app = FastAPI()
+
+    def get_session():
+        with Session(engine) as session:
+            yield session
+
+    async def get_async_session():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
+    @app.get("/sync")
+    def get_animals_sync(session: Session = Depends(get_session)):
+        animals, _ = db.get_animals_page(session, sort="intake_date", limit=20)
+        return _page_response(db.count_animals(session), animals)
+
+    @app.get("/async")
+    async def get_animals_async(session: AsyncSession = Depends(get_async_session)):
+        animals, _ = await adb.get_animals_page(session, sort="intake_date", limit=20)
+        return _page_response(await adb.count_animals(session), animals)
+
+    return app
+
+
+def _page_response(count: int, animals) -> Response:
+    # pages are rows, serialized as the animals router does
+    content = dump_collection(Metadata(count=count), "animals", Animal, animals)
+    return Response(content=content, media_type="application/json")
+
+
+async def run(app: FastAPI, path: str, concurrency: int, total: int) -> dict:
+    async with asgi_client(app) as client:
+        return await measure(client, "GET", path, concurrency=concurrency, total=total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", help="database to use, defaults to a temp SQLite file")
+    parser.add_argument("--animals", type=int, default=5_000)
+    parser.add_argument("--requests", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--pool-size", type=int, default=20)
+    args = parser.parse_args()
+
+    db_url = args.db_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine = create_engine(db_url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    seed_synthetic_database(
+        users=max(1, args.animals // 10),
+        animals=args.animals,
+        bind=engine,
+    )
+    engine.dispose()
+
+    app = build_app(db_url, adb.get_db_url(db_url), args.pool_size)
+    asyncio.run(report(app, args.concurrency, args.requests))
+
+
+async def report(app: FastAPI, concurrency_levels: list[int], total: int):
+    # a single event loop, so pooled async connections stay usable
+    print(f"{'mode':<6} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for concurrency in concurrency_levels:
+        for mode in ["sync", "async"]:
+            result = await run(app, f"/{mode}", concurrency, total)
+            print(
+                f"{mode:<6} {concurrency:>5} {result['rps']:>9.1f}"
+                f" {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
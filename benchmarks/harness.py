@@ -0,0 +1,66 @@
+"""Shared helpers for driving the app in process and summarizing latency."""
+
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+async def measure(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    *,
+    concurrency: int,
+    total: int,
+    warmup: int = 0,
+    **request_kwargs,
+) -> dict:
+    """
+    Send `total` requests from `concurrency` concurrent workers.
+
+    :return: throughput and latency percentiles
+    """
+
+    for _ in range(warmup):
+        (await client.request(method, url, **request_kwargs)).raise_for_status()
+
+    latencies = []
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.request(method, url, **request_kwargs)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def asgi_client(app) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://bench",
+    )
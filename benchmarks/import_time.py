@@ -0,0 +1,156 @@
+"""
+Report what importing the Lambda handler costs, module by module.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module backend.create_indexes --top 40
+    python -m benchmarks.import_time compare before.json after.json
+
+The module is imported `--runs` times in fresh interpreters with
+`python -X importtime`, and the fastest time of every module is kept to
+smooth out noise. Results are written as JSON, by default to
+`benchmarks/results/import-time-<commit>.json`, next to the API results.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from benchmarks.api import RESULTS_DIR, git_commit
+
+
+def import_times(module: str) -> dict[str, dict]:
+    """
+    Import `module` in a fresh interpreter.
+
+    :return: self and cumulative microseconds per imported module
+    """
+
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+        # keep the report free of any Lambda startup work
+        env={
+            key: value
+            for key, value in os.environ.items()
+            if key != "AWS_LAMBDA_FUNCTION_NAME"
+        },
+    )
+
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = {
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        }
+    return times
+
+
+def run(args):
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    modules = {
+        name: {
+            key: min(times[name][key] for times in runs if name in times)
+            for key in ("self_us", "cumulative_us")
+        }
+        for name in runs[0]
+    }
+    packages = defaultdict(int)
+    for name, times in modules.items():
+        packages[name.split(".")[0]] += times["self_us"]
+
+    total_ms = modules[args.module]["cumulative_us"] / 1000
+    print(f"import {args.module}: {total_ms:.1f} ms\n")
+    print(f"{'package':<30} {'self ms':>9}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<30} {self_us / 1000:>9.1f}")
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"import-time-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "meta": {
+                    "commit": commit,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "python": sys.version.split()[0],
+                    "module": args.module,
+                    "runs": args.runs,
+                },
+                "total_ms": total_ms,
+                "packages_ms": {
+                    package: self_us / 1000 for package, self_us in packages.items()
+                },
+                "modules": modules,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nwrote {output}")
+
+
+def compare(args) -> int:
+    """Print import time changes per package; fail if the total regressed."""
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    packages = before["packages_ms"].keys() | after["packages_ms"].keys()
+    changes = sorted(
+        (
+            after["packages_ms"].get(package, 0.0) - before["packages_ms"].get(package, 0.0),
+            package,
+        )
+        for package in packages
+    )
+    for change, package in [*changes[:args.top // 2], *changes[-args.top // 2:]]:
+        if change:
+            print(f"{package:<30} {change:>+9.1f} ms")
+
+    old, new = before["total_ms"], after["total_ms"]
+    change = (new - old) / old * 100 if old else 0.0
+    regression = change > args.threshold
+    print(
+        f"\ntotal {old:.1f} -> {new:.1f} ms ({change:+.1f}%)"
+        + ("  REGRESSION" if regression else "")
+    )
+    return 1 if regression else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=10.0,
+        help="total import time increase, in percent, reported as a regression",
+    )
+    compare_parser.add_argument("--top", type=int, default=20)
+
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", help="result file, defaults to benchmarks/results/import-time-<commit>.json")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        sys.exit(compare(args))
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
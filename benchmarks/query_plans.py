@@ -0,0 +1,97 @@
+"""
+Compare query plans and latency before and after `create_missing_indexes`.
+
+    python -m benchmarks.query_plans --animals 50000
+    python -m benchmarks.query_plans --db-url postgresql://user:pw@localhost/bench
+
+The tables are created, the secondary indexes are dropped to mimic a
+database created before they were declared, and every access path is
+explained and timed. Then the indexes are added back and it is repeated.
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, text
+from sqlmodel import SQLModel
+
+from backend import database as db
+from backend.seed_database import seed_synthetic_database
+
+QUERIES = {
+    "list by intake date": (
+        "SELECT * FROM animals WHERE intake_date >= :after"
+        " ORDER BY intake_date, id LIMIT 101"
+    ),
+    "list by kind": "SELECT * FROM animals WHERE kind = :kind ORDER BY name, id LIMIT 101",
+    "user pets": "SELECT * FROM animals WHERE adopter_id = :user_id",
+    "email duplicate check": "SELECT id FROM users WHERE email = :email",
+    "fosters of animal": "SELECT * FROM fosters WHERE animal_id = :animal_id",
+}
+PARAMS = {
+    "after": date(2023, 6, 1),
+    "kind": "turtle",
+    "user_id": 7,
+    "email": "user7@cool.email",
+    "animal_id": 42,
+}
+def drop_secondary_indexes(engine):
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                if not index.unique:
+                    index.drop(connection)
+
+
+def explain(connection, sql: str) -> str:
+    if connection.dialect.name == "sqlite":
+        rows = connection.execute(text("EXPLAIN QUERY PLAN " + sql), PARAMS)
+        return "; ".join(row[-1] for row in rows)
+    rows = connection.execute(text("EXPLAIN " + sql), PARAMS)
+    return "; ".join(row[0].strip() for row in rows)
+
+
+def measure(engine, repeat: int) -> dict[str, tuple[str, float]]:
+    results = {}
+    with engine.connect() as connection:
+        for name, sql in QUERIES.items():
+            plan = explain(connection, sql)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(text(sql), PARAMS).all()
+            elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+            results[name] = (plan, elapsed_ms)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", help="database to use, defaults to a temp SQLite file")
+    parser.add_argument("--animals", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    db_url = args.db_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine = create_engine(db_url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    drop_secondary_indexes(engine)
+    seed_synthetic_database(users=args.users, animals=args.animals, bind=engine)
+
+    before = measure(engine, args.repeat)
+    created = db.create_missing_indexes(engine)
+    after = measure(engine, args.repeat)
+
+    print(f"created indexes: {', '.join(created)}\n")
+    for name in QUERIES:
+        (plan_before, ms_before), (plan_after, ms_after) = before[name], after[name]
+        print(f"{name}: {ms_before:.3f} ms -> {ms_after:.3f} ms")
+        print(f"    before: {plan_before}")
+        print(f"    after:  {plan_after}")
+
+
+if __name__ == "__main__":
+    main()
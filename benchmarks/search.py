@@ -0,0 +1,66 @@
+"""
+Time `/animals/search` queries, page and facets, on a large table.
+
+    python -m benchmarks.search --animals 1000000
+    python -m benchmarks.search --db-url postgresql://user:pw@localhost/bench
+
+Every search runs `database.search_animals` directly, so the times are
+those of the queries without the response cache in front of them.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlmodel import Session, SQLModel
+
+from backend import database as db
+from backend.entities import AnimalSearch
+from backend.seed_database import seed_synthetic_database
+
+SEARCHES = {
+    "word prefix": AnimalSearch(q="pick"),
+    "word prefix and kind": AnimalSearch(q="pick", kind="turtle"),
+    "two words": AnimalSearch(q="pick noodle"),
+    "rare word": AnimalSearch(q="zzz"),
+    "kind and age": AnimalSearch(kind="bird", min_age=3, max_age=4),
+    "prefix, filters, unadopted": AnimalSearch(
+        q="mo", fixed=True, vaccinated=False, min_age=10, adopted=False
+    ),
+    "everything": AnimalSearch(),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", help="database to use, defaults to a temp SQLite file")
+    parser.add_argument("--animals", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    db_url = args.db_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine = create_engine(db_url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+
+    start = time.perf_counter()
+    seed_synthetic_database(users=1_000, animals=args.animals, bind=engine)
+    print(f"seeded {args.animals} animals in {time.perf_counter() - start:.1f} s\n")
+
+    print(f"{'search':<28} {'matches':>8} {'median ms':>10} {'max ms':>8}")
+    with Session(engine) as session:
+        for name, search in SEARCHES.items():
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                _animals, _cursor, count, _facets = db.search_animals(session, search)
+                times.append((time.perf_counter() - start) * 1000)
+            print(f"{name:<28} {count:>8} {statistics.median(times):>10.2f} {max(times):>8.2f}")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
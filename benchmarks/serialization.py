@@ -0,0 +1,104 @@
+"""
+Compare the per-row cost of serializing `GET /animals` pages.
+
+    python -m benchmarks.serialization --rows 100 1000 10000
+
+"orm" is the previous path: ORM instances, validated into the response
+model, then through FastAPI's `response_model` handling and `JSONResponse`.
+"rows" selects plain rows and dumps them with `dump_collection`. Both are
+timed with and without the query, and their output is checked to match.
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine
+from sqlmodel import Session, SQLModel, select
+
+from backend import database as db
+from backend.entities import Animal, AnimalCollection, AnimalInDB, PageMetadata
+from backend.seed_database import seed_synthetic_database
+from backend.serialization import dump_collection
+
+RESPONSE_FIELD = create_response_field(
+    name="Response_get_animals",
+    type_=AnimalCollection,
+    mode="serialization",
+)
+LOOP = asyncio.new_event_loop()
+
+
+def serialize_orm(animals: list[AnimalInDB], meta: PageMetadata) -> bytes:
+    collection = AnimalCollection(meta=meta, animals=animals)
+    content = LOOP.run_until_complete(
+        serialize_response(
+            field=RESPONSE_FIELD,
+            response_content=collection,
+            is_coroutine=True,
+        )
+    )
+    return JSONResponse(content).body
+
+
+def serialize_rows(rows, meta: PageMetadata) -> bytes:
+    return dump_collection(meta, "animals", Animal, rows)
+
+
+def best_of(repeat: int, function, *args):
+    """Fastest of `repeat` calls, in seconds, with the result of the last."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def run(args):
+    engine = create_engine(f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    SQLModel.metadata.create_all(engine)
+    seed_synthetic_database(users=100, animals=max(args.rows), bind=engine)
+
+    print(f"{'rows':>7} {'path':<5} {'query+dump us/row':>18} {'dump us/row':>12}")
+    with Session(engine) as session:
+        for count in args.rows:
+            meta = PageMetadata(count=count, limit=count, next_cursor=None)
+
+            def query_orm():
+                session.expunge_all()
+                return session.exec(select(AnimalInDB).order_by(AnimalInDB.id).limit(count)).all()
+
+            def query_rows():
+                return session.exec(select(*db.ANIMAL_COLUMNS).order_by(AnimalInDB.id).limit(count)).all()
+
+            animals, rows = query_orm(), query_rows()
+            orm_dump, orm_body = best_of(args.repeat, serialize_orm, animals, meta)
+            rows_dump, rows_body = best_of(args.repeat, serialize_rows, rows, meta)
+            assert orm_body == rows_body, "wire format differs"
+
+            orm_total, _ = best_of(args.repeat, lambda: serialize_orm(query_orm(), meta))
+            rows_total, _ = best_of(args.repeat, lambda: serialize_rows(query_rows(), meta))
+
+            for path, total, dump in [("orm", orm_total, orm_dump), ("rows", rows_total, rows_dump)]:
+                print(
+                    f"{count:>7} {path:<5} {total / count * 1e6:>18.2f}"
+                    f" {dump / count * 1e6:>12.2f}"
+                )
+
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
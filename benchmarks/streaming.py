@@ -0,0 +1,121 @@
+"""
+Compare time to first byte and peak memory of JSON and NDJSON lists.
+
+    python -m benchmarks.streaming --sizes 1000 10000 100000
+
+Each size seeds `size` users and `size` animals, then requests the full
+`GET /users` collection as JSON and as NDJSON, and every animal as NDJSON.
+The app is driven directly over ASGI, since test clients buffer the whole
+body, and Python allocations are traced while each request runs.
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import async_database as adb
+from backend.main import app
+from backend.seed_database import seed_synthetic_database
+from benchmarks.harness import async_db_url
+
+SCENARIOS = [
+    ("GET /users json", "/users", b"application/json"),
+    ("GET /users ndjson", "/users", b"application/x-ndjson"),
+    ("GET /animals ndjson", "/animals", b"application/x-ndjson"),
+]
+
+
+async def request(path: str, accept: bytes) -> dict:
+    """Send one GET over ASGI and time its first and last body chunk."""
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"accept", accept)],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    timings = {"bytes": 0}
+    received = asyncio.Event()
+
+    async def receive():
+        # streaming responses keep listening for a disconnect, which never comes
+        if received.is_set():
+            await asyncio.Event().wait()
+        received.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            timings.setdefault("first_byte", time.perf_counter())
+            timings["bytes"] += len(message.get("body", b""))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    end = time.perf_counter()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ttfb_ms": (timings["first_byte"] - start) * 1000,
+        "total_ms": (end - start) * 1000,
+        "peak_mb": peak / 2**20,
+        "mb": timings["bytes"] / 2**20,
+    }
+
+
+async def run_size(db_url: str, size: int):
+    engine = create_engine(db_url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    seed_synthetic_database(users=size, animals=size, bind=engine)
+    engine.dispose()
+
+    async_engine = create_async_engine(async_db_url(db_url))
+
+    async def _get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides[adb.get_session] = _get_async_session_override
+    try:
+        for name, path, accept in SCENARIOS:
+            result = await request(path, accept)
+            print(
+                f"{size:>8} {name:<22} {result['ttfb_ms']:>9.1f} {result['total_ms']:>9.1f}"
+                f" {result['peak_mb']:>9.1f} {result['mb']:>9.1f}"
+            )
+    finally:
+        app.dependency_overrides.clear()
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", help="database to benchmark, defaults to a temp SQLite file")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    db_url = args.db_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    print(f"{'size':>8} {'scenario':<22} {'ttfb ms':>9} {'total ms':>9} {'peak MB':>9} {'body MB':>9}")
+    for size in args.sizes:
+        asyncio.run(run_size(db_url, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Time single animal updates and deletes, and the round trips they take.
+
+    python -m benchmarks.writes --animals 100000 --histories 0 100 10000
+    python -m benchmarks.writes --db-url postgresql://user:pw@localhost/bench
+
+`database.update_animal` and `database.delete_animal` are timed next to
+the ORM load, mutate, commit and refresh they replaced, kept here as the
+baseline. Statements are counted on the engine, so the round trips of
+each write are reported along with its latency.
+
+`database.delete_user` is then timed for users with a history of
+`--histories` pets and foster periods each, next to the ORM delete that
+loaded all of them first.
+"""
+
+import argparse
+import itertools
+import statistics
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, SQLModel
+
+from backend import database as db
+from backend.entities import AnimalInDB, AnimalUpdate, FosterInDB, UserInDB
+from backend.seed_database import seed_synthetic_database
+
+
+def _update_loaded(session: Session, animal_id: int, animal_update: AnimalUpdate):
+    animal = db.get_animal_by_id(session, animal_id)
+    for attr, value in animal_update.model_dump(exclude_unset=True).items():
+        setattr(animal, attr, value)
+    session.add(animal)
+    db.bump_table_versions(session, "animals")
+    session.commit()
+    session.refresh(animal)
+
+
+def _delete_loaded(session: Session, animal_id: int):
+    session.delete(db.get_animal_by_id(session, animal_id))
+    db.bump_table_versions(session, "animals", "fosters")
+    session.commit()
+
+
+def _update_if_match(
+    session: Session,
+    animal_id: int,
+    animal_update: AnimalUpdate,
+    known_versions: dict[int, int],
+):
+    # like a client sending the ETag of its previous write as `If-Match`
+    if animal_id not in known_versions:
+        known_versions[animal_id] = session.scalar(
+            select(AnimalInDB.version).where(AnimalInDB.id == animal_id)
+        )
+    animal = db.update_animal(
+        session, animal_id, animal_update, versions=[known_versions[animal_id]]
+    )
+    known_versions[animal_id] = animal.version
+
+
+def _delete_user_loaded(session: Session, user_id: int):
+    # as the ORM did before `database.CASCADES`: every pet and foster
+    # period is loaded, then updated or deleted one by one
+    user = session.get(
+        UserInDB,
+        user_id,
+        options=[selectinload(UserInDB.pets), selectinload(UserInDB.foster_animals)],
+    )
+    session.delete(user)
+    db.bump_table_versions(session, "users", "animals", "fosters")
+    session.commit()
+
+
+def add_user_with_history(engine, username: str, history: int) -> int:
+    """Add a user who adopted and fostered `history` animals, return their id."""
+
+    with engine.begin() as connection:
+        user_id = connection.scalar(
+            insert(UserInDB)
+            .values(username=username, email=f"{username}@bench", hashed_password="-")
+            .returning(UserInDB.id)
+        )
+        if not history:
+            return user_id
+
+        animal = {
+            "name": "pickles",
+            "age": 1,
+            "kind": "cat",
+            "fixed": False,
+            "vaccinated": False,
+            "intake_date": date(2024, 1, 1),
+            "adopter_id": user_id,
+            "adoption_date": date(2024, 2, 1),
+        }
+        animal_ids = connection.execute(
+            insert(AnimalInDB).returning(AnimalInDB.id), [animal] * history
+        ).scalars().all()
+        connection.execute(insert(FosterInDB), [
+            {
+                "user_id": user_id,
+                "animal_id": animal_id,
+                "start_date": date(2024, 1, 1),
+                "end_date": date(2024, 2, 1),
+            }
+            for animal_id in animal_ids
+        ])
+    return user_id
+
+
+def scenarios(animal_id: int, ids: itertools.count):
+    """(name, write) for every measured write; deletes take a new id each time."""
+
+    # a new age every time, so that the ORM never skips an unchanged row
+    ages = itertools.cycle(range(1, 20))
+    known_versions = {}
+    return [
+        (
+            "update, load and refresh",
+            lambda session: _update_loaded(session, animal_id, AnimalUpdate(age=next(ages))),
+        ),
+        (
+            "update returning",
+            lambda session: db.update_animal(session, animal_id, AnimalUpdate(age=next(ages))),
+        ),
+        (
+            "update if version matches",
+            lambda session: _update_if_match(
+                session, animal_id, AnimalUpdate(age=next(ages)), known_versions
+            ),
+        ),
+        ("delete, load", lambda session: _delete_loaded(session, next(ids))),
+        ("delete returning", lambda session: db.delete_animal(session, next(ids))),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", help="database to use, defaults to a temp SQLite file")
+    parser.add_argument("--animals", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--histories", type=int, nargs="+", default=[0, 100, 1_000, 10_000])
+    parser.add_argument("--history-repeat", type=int, default=5)
+    args = parser.parse_args()
+    if args.animals <= 2 * args.repeat:
+        parser.error("--animals must be more than twice --repeat, for the deletes")
+
+    db_url = args.db_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine = create_engine(db_url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    seed_synthetic_database(users=1_000, animals=args.animals, bind=engine)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args))
+
+    with Session(engine) as session:
+        first_id = session.scalar(select(func.min(AnimalInDB.id)))
+    ids = itertools.count(first_id + 1)
+
+    print(f"{'write':<28} {'statements':>10} {'median ms':>10} {'p99 ms':>8}")
+    for name, write in scenarios(first_id, ids):
+        times = []
+        statements.clear()
+        for _ in range(args.repeat):
+            # a new session for every write, as for every request
+            with Session(engine, expire_on_commit=False) as session:
+                start = time.perf_counter()
+                write(session)
+                times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        print(
+            f"{name:<28} {len(statements) / args.repeat:>10.1f}"
+            f" {statistics.median(times):>10.3f} {times[int(len(times) * 0.99) - 1]:>8.3f}"
+        )
+
+    print(f"\n{'delete user':<28} {'history':>8} {'statements':>10} {'median ms':>10}")
+    usernames = (f"bench {i}" for i in itertools.count())
+    deletes = [("delete, load history", _delete_user_loaded), ("delete returning", db.delete_user)]
+    for history in args.histories:
+        for name, delete_user in deletes:
+            times, counts = [], []
+            for _ in range(args.history_repeat):
+                user_id = add_user_with_history(engine, next(usernames), history)
+                statements.clear()
+                with Session(engine, expire_on_commit=False) as session:
+                    start = time.perf_counter()
+                    delete_user(session, user_id)
+                    times.append((time.perf_counter() - start) * 1000)
+                counts.append(len(statements))
+            print(
+                f"{name:<28} {history:>8} {statistics.fmean(counts):>10.1f}"
+                f" {statistics.median(times):>10.3f}"
+            )
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -31,16 +31,31 @@ function Link({ animal }) {
   );
 }
 
+// `GET /animals` returns a page at a time, so follow `next_cursor` to the end
+const getAllAnimals = async (api) => {
+  const animals = [];
+  let cursor = null;
+  do {
+    const query = new URLSearchParams({ limit: 1000 });
+    if (cursor) {
+      query.set("cursor", cursor);
+    }
+    const page = await api.get(`/animals?${query}`)
+      .then((response) => response.json());
+    animals.push(...page.animals);
+    cursor = page.meta.next_cursor;
+  } while (cursor);
+
+  return { animals };
+};
+
 function LeftNav() {
   const [search, setSearch] = useState("");
   const api = useApi();
 
   const { data } = useQuery({
     queryKey: ["animals"],
-    queryFn: () => (
-      api.get("/animals")
-        .then((response) => response.json())
-    ),
+    queryFn: () => getAllAnimals(api),
   });
 
   const regex = new RegExp(search.split("").join(".*"));
@@ -0,0 +1,26 @@
+import pytest
+
+from backend import async_database as adb
+
+
+@pytest.mark.parametrize(
+    "location, expected_prefix",
+    [
+        (None, "sqlite+aiosqlite:///"),
+        ("efs", "sqlite+aiosqlite:////mnt/efs/"),
+        ("rds", "postgresql+asyncpg://"),
+    ],
+)
+def test_get_db_url(monkeypatch, location, expected_prefix):
+    if location is None:
+        monkeypatch.delenv("DB_LOCATION", raising=False)
+    else:
+        monkeypatch.setenv("DB_LOCATION", location)
+
+    assert adb.get_db_url().startswith(expected_prefix)
+
+
+
+def test_get_db_url_of_given_url():
+    assert adb.get_db_url("sqlite:///bench.db") == "sqlite+aiosqlite:///bench.db"
+    assert adb.get_db_url("postgresql://u:pw@host/db") == "postgresql+asyncpg://u:pw@host/db"
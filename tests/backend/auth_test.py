@@ -0,0 +1,249 @@
+import subprocess
+import sys
+
+import pytest
+from jose import jwt
+from passlib.context import CryptContext
+from sqlalchemy import event
+from sqlmodel import select
+
+from backend import auth
+from backend import database as db
+from backend.entities import RefreshTokenInDB, UserUpdate
+
+
+def _get_token(client, user_fixture) -> str:
+    user_fixture(username="juniper", password="password")
+    response = client.post(
+        "/auth/token",
+        data={"username": "juniper", "password": "password"},
+    )
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+
+def test_get_current_user_is_cached(client, user_fixture, monkeypatch):
+    token = _get_token(client, user_fixture)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("token should not be decoded again")
+
+    monkeypatch.setattr(jwt, "decode", _fail)
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["user"]["username"] == "juniper"
+    assert db.user_cache.hits == 1
+
+    # tagged with a string, as a cache shared between processes needs
+    db.user_cache.invalidate_tag(f"user:{response.json()['user']['id']}")
+    assert len(db.user_cache) == 0
+
+
+def test_get_current_user_cache_invalidated_on_delete(
+    client, session, user_fixture
+):
+    token = _get_token(client, user_fixture)
+    headers = {"Authorization": f"Bearer {token}"}
+    user = user_fixture(username="juniper")
+
+    assert client.get("/users/me", headers=headers).status_code == 200
+    db.delete_user(session, user.id)
+
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"]["error_description"] == "invalid bearer token"
+
+
+def test_get_current_user_invalid_token(client):
+    response = client.get(
+        "/users/me",
+        headers={"Authorization": "Bearer not-a-token"},
+    )
+    assert response.status_code == 401
+    assert len(db.user_cache) == 0
+
+
+def test_get_access_token_invalid_password(client, user_fixture):
+    user_fixture(username="juniper", password="password")
+    response = client.post(
+        "/auth/token",
+        data={"username": "juniper", "password": "wrong password"},
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"]["error_description"] == (
+        "invalid username or password"
+    )
+
+
+def test_get_access_token_rehashes_outdated_hash(client, session, user_fixture):
+    user = user_fixture(username="juniper", password="password")
+    outdated_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    user.hashed_password = outdated_context.hash("password")
+    session.add(user)
+    session.commit()
+
+    _get_token(client, user_fixture)
+
+    session.refresh(user)
+    assert not auth.pwd_context.needs_update(user.hashed_password)
+    assert auth.pwd_context.verify("password", user.hashed_password)
+
+
+def test_hash_password_errors_propagate(monkeypatch):
+    class _BrokenContext:
+        def hash(self, password):
+            raise ValueError("no bcrypt backend")
+
+    monkeypatch.setattr(auth, "get_pwd_context", _BrokenContext)
+    # a hashing failure is not an authentication error
+    with pytest.raises(ValueError):
+        auth._hash_password("password")
+
+
+def test_crypto_libraries_imported_on_first_use():
+    # in a fresh interpreter, as the test session has already imported them
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, backend.main;"
+            "print(sorted({'jose', 'passlib'} & sys.modules.keys()))",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    assert completed.stdout.strip() == "[]"
+
+
+def test_register_new_user(client, async_engine):
+    statements = []
+    event.listen(
+        async_engine.sync_engine,
+        "before_cursor_execute",
+        lambda _conn, _cursor, statement, *args: statements.append(statement),
+    )
+
+    registration = {"username": "juniper", "email": "juniper@cool.email", "password": "pw"}
+    response = client.post("/auth/registration", json=registration)
+    assert response.status_code == 200
+    assert response.json()["username"] == "juniper"
+    assert response.json()["created_at"] is not None
+    # the user and the table version
+    assert len(statements) == 2
+    assert statements[0].startswith("INSERT INTO users")
+
+    response = client.post(
+        "/auth/token",
+        data={"username": "juniper", "password": "pw"},
+    )
+    assert response.status_code == 200
+
+
+def test_register_new_user_duplicates(client, user_fixture):
+    user_fixture(username="juniper")
+
+    for field, registration in [
+        ("username", {"username": "juniper", "email": "other@cool.email"}),
+        ("email", {"username": "other", "email": "juniper@cool.email"}),
+    ]:
+        response = client.post("/auth/registration", json={**registration, "password": "pw"})
+        assert response.status_code == 422
+        assert response.json() == {
+            "detail": {
+                "type": "duplicate_value",
+                "entity_name": "User",
+                "entity_field": field,
+                "entity_field_value": registration[field],
+            },
+        }
+
+
+def _login(client, user_fixture) -> dict:
+    user_fixture(username="juniper", password="password")
+    response = client.post(
+        "/auth/token",
+        data={"username": "juniper", "password": "password"},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def _refresh(client, refresh_token: str):
+    return client.post("/auth/refresh", data={"refresh_token": refresh_token})
+
+
+def test_refresh_access_token(client, session, user_fixture, monkeypatch):
+    tokens = _login(client, user_fixture)
+
+    async def _fail(*args, **kwargs):
+        raise AssertionError("a refresh should not verify a password")
+
+    monkeypatch.setattr(auth, "verify_password", _fail)
+    response = _refresh(client, tokens["refresh_token"])
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["expires_in"] == auth.access_token_duration
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+
+    headers = {"Authorization": f"Bearer {refreshed['access_token']}"}
+    assert client.get("/users/me", headers=headers).json()["user"]["username"] == "juniper"
+
+    # one row per session, holding only hashes of the tokens
+    (row,) = session.exec(select(RefreshTokenInDB)).all()
+    assert row.token_hash == auth._hash_refresh_token(refreshed["refresh_token"])
+    assert refreshed["refresh_token"] not in (row.token_hash, row.previous_hash)
+
+
+def test_refresh_access_token_reused(client, user_fixture):
+    tokens = _login(client, user_fixture)
+    refreshed = _refresh(client, tokens["refresh_token"]).json()
+
+    response = _refresh(client, tokens["refresh_token"])
+    assert response.status_code == 401
+    assert response.json()["detail"]["error"] == "invalid_grant"
+
+    # the reuse of a replaced token revoked the session it belonged to
+    assert _refresh(client, refreshed["refresh_token"]).status_code == 401
+
+
+def test_refresh_access_token_invalid(client, user_fixture, monkeypatch):
+    assert _refresh(client, "not-a-token").status_code == 401
+
+    monkeypatch.setattr(auth, "refresh_token_duration", -1)
+    tokens = _login(client, user_fixture)
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_refresh_tokens_revoked_on_password_change(client, session, user_fixture):
+    tokens = _login(client, user_fixture)
+    user = user_fixture(username="juniper")
+
+    db.update_user(session, user.id, UserUpdate(email="new@cool.email"))
+    refreshed = _refresh(client, tokens["refresh_token"]).json()
+
+    db.update_user(session, user.id, UserUpdate(), hashed_password="new hash")
+    assert _refresh(client, refreshed["refresh_token"]).status_code == 401
+
+
+def test_refresh_tokens_revoked_on_delete(client, session, user_fixture):
+    tokens = _login(client, user_fixture)
+    user = user_fixture(username="juniper")
+
+    db.delete_user(session, user.id)
+    assert session.exec(select(RefreshTokenInDB)).all() == []
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_expired_refresh_tokens_deleted_on_login(client, session, user_fixture, monkeypatch):
+    monkeypatch.setattr(auth, "refresh_token_duration", -1)
+    _login(client, user_fixture)
+    monkeypatch.undo()
+    tokens = _login(client, user_fixture)
+
+    (row,) = session.exec(select(RefreshTokenInDB)).all()
+    assert row.token_hash == auth._hash_refresh_token(tokens["refresh_token"])
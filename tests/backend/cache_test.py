@@ -0,0 +1,57 @@
+import time
+
+from backend.cache import TTLCache, load_cache_backend
+
+
+def test_get_and_set():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_entries_expire():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=0.01)
+    cache.set("b", 2, ttl=-1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert len(cache) == 0
+
+
+def test_invalidate_tag():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1, tags=["x"])
+    cache.set("b", 2, tags=["x", "y"])
+    cache.set("c", 3, tags=["y"])
+    cache.invalidate_tag("x")
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_load_cache_backend():
+    cache = load_cache_backend(None, maxsize=3, ttl=10)
+    assert isinstance(cache, TTLCache)
+    assert (cache.maxsize, cache.ttl) == (3, 10)
+
+    cache = load_cache_backend("backend.cache:TTLCache", maxsize=5, ttl=20)
+    assert isinstance(cache, TTLCache)
+    assert (cache.maxsize, cache.ttl) == (5, 20)
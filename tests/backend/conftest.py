@@ -2,52 +2,84 @@ from datetime import date, datetime
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, StaticPool, create_engine, select
+from sqlalchemy import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from backend import auth
+from backend import ratelimit
 from backend.main import app
+from backend import async_database as adb
 from backend import database as db
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    db.user_cache.clear()
+    db.animal_cache.clear()
+    ratelimit.rate_limits.clear()
+
+
 @pytest.fixture
-def session():
+def engine(tmp_path):
+    # a file, so the sync fixtures and the async app share one database
     engine = create_engine(
-        "sqlite://",
+        f"sqlite:///{tmp_path / 'buddy_system.db'}",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
     )
     SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def async_engine(tmp_path, engine):
+    # NullPool since every TestClient request runs in a new event loop
+    return create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'buddy_system.db'}",
+        poolclass=NullPool,
+    )
+
+
+@pytest.fixture
+def session(engine):
     with Session(engine) as session:
         yield session
 
 
 @pytest.fixture
-def client(session):
+def override_sessions(session, async_engine):
     def _get_session_override():
         return session
 
+    async def _get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[db.get_session] = _get_session_override
+    app.dependency_overrides[adb.get_session] = _get_async_session_override
 
-    yield TestClient(app)
+    yield
 
     app.dependency_overrides.clear()
 
 
 @pytest.fixture
-def logged_in_client(session, user_fixture):
-    def _get_session_override():
-        return session
+def client(override_sessions):
+    yield TestClient(app)
 
+
+@pytest.fixture
+def logged_in_client(override_sessions, user_fixture):
     def _get_current_user_override():
         return user_fixture(username="juniper")
 
-    app.dependency_overrides[db.get_session] = _get_session_override
     app.dependency_overrides[auth.get_current_user] = _get_current_user_override
 
     yield TestClient(app)
 
-    app.dependency_overrides.clear()
-
 
 @pytest.fixture
 def animal_fixture(session):
@@ -79,13 +111,6 @@ def animal_fixture(session):
 
 @pytest.fixture
 def user_fixture(session):
-    def _find_user(attr: str, value: str) -> db.UserInDB | None:
-        return session.exec(
-            select(db.UserInDB).where(
-                getattr(db.UserInDB, attr) == value
-            ),
-        ).first()
-
     def _build_user(
         username: str = "juniper",
         password: str = "password",
@@ -96,14 +121,15 @@ def user_fixture(session):
         if user is not None:
             return user
 
-        return auth.register_new_user(
-            auth.UserRegistration(
-                username=username,
-                email=f"{username}@cool.email",
-                password=password,
-            ),
-            session,
+        user = db.UserInDB(
+            username=username,
+            email=f"{username}@cool.email",
+            hashed_password=auth.pwd_context.hash(password),
         )
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        return user
 
     return _build_user
 
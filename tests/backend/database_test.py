@@ -1,5 +1,10 @@
 from datetime import date
 
+import pytest
+from sqlalchemy import event, inspect, text
+from sqlmodel import Session, SQLModel, StaticPool, create_engine, select
+
+from backend import database as db
 from backend.entities import *
 
 
@@ -26,3 +31,339 @@ def test_relationships(session):
 
     assert nibbles.adopter == juniper
     assert nibbles in juniper.pets
+
+
+def test_create_missing_indexes():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_animals_intake_date_id"))
+        connection.execute(text("DROP INDEX ix_users_email"))
+
+    assert sorted(db.create_missing_indexes(engine)) == [
+        "ix_animals_intake_date_id",
+        "ix_users_email",
+    ]
+    assert db.create_missing_indexes(engine) == []
+
+    index_names = {index["name"] for index in inspect(engine).get_indexes("animals")}
+    assert "ix_animals_intake_date_id" in index_names
+
+
+def test_create_missing_columns():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    # as in a database created before animals had a version
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO animals (name, age, kind, fixed, vaccinated, version)"
+            " VALUES ('nibbles', 2, 'cat', 0, 0, 1)"
+        ))
+        connection.execute(text("DROP TRIGGER users_cascade"))
+        connection.execute(text("ALTER TABLE animals DROP COLUMN version"))
+
+    assert db.create_missing_columns(engine) == ["animals.version"]
+    assert db.create_missing_columns(engine) == []
+
+    with Session(engine) as session:
+        assert session.get(AnimalInDB, 1).version == 1
+
+
+def test_create_missing_unique_index():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    # as in a database created before emails were unique
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_users_email"))
+        connection.execute(text("CREATE INDEX ix_users_email ON users (email)"))
+
+    assert db.create_missing_indexes(engine) == ["ix_users_email"]
+    assert db.create_missing_indexes(engine) == []
+
+    with Session(engine) as session:
+        db.create_user(session, username="juniper", email="j@cool.email", hashed_password="-")
+        with pytest.raises(db.UniqueViolationException) as raised:
+            db.create_user(session, username="perseus", email="j@cool.email", hashed_password="-")
+        assert (raised.value.field, raised.value.value) == ("email", "j@cool.email")
+
+
+def test_create_missing_search_index():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    # as in a database created before animals could be searched
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE animals_fts"))
+        for trigger in ["insert", "update", "delete"]:
+            connection.execute(text(f"DROP TRIGGER animals_fts_{trigger}"))
+        connection.execute(text(
+            "INSERT INTO animals (name, age, kind, fixed, vaccinated)"
+            " VALUES ('pickles', 3, 'cat', 1, 1)"
+        ))
+
+    assert db.create_missing_indexes(engine) == ["animals_fts"]
+
+    # the new index is filled from the existing animals
+    with engine.connect() as connection:
+        assert connection.scalar(
+            text("SELECT rowid FROM animals_fts WHERE animals_fts MATCH 'pick*'")
+        ) == 1
+    with Session(engine) as session:
+        count, facets = db.get_animal_facets(session, AnimalSearch())
+        assert count == 1
+        assert facets.kind == {"cat": 1}
+
+
+def test_create_missing_cascades():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    # as in a database whose deletes left fosters and adopters dangling
+    with engine.begin() as connection:
+        for table_name in ["users", "animals"]:
+            connection.execute(text(f"DROP TRIGGER {table_name}_cascade"))
+        connection.execute(text(
+            "INSERT INTO animals (name, age, kind, fixed, vaccinated, adopter_id)"
+            " VALUES ('pickles', 3, 'cat', 1, 1, 7)"
+        ))
+        connection.execute(text(
+            "INSERT INTO fosters (user_id, animal_id, start_date, end_date)"
+            " VALUES (7, 1, '2024-01-01', '2024-02-01')"
+        ))
+
+    assert db.create_missing_indexes(engine) == ["animals_cascade"]
+
+    with Session(engine) as session:
+        assert session.exec(select(FosterInDB)).all() == []
+        assert session.get(AnimalInDB, 1).adopter_id is None
+
+
+# the tables as first released, before any index, column or trigger was added
+BASELINE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR NOT NULL,"
+    " email VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL, created_at DATETIME,"
+    " PRIMARY KEY (id))",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    "CREATE TABLE animals (id INTEGER NOT NULL, name VARCHAR NOT NULL, age INTEGER NOT NULL,"
+    " kind VARCHAR NOT NULL, fixed BOOLEAN NOT NULL, vaccinated BOOLEAN NOT NULL,"
+    " intake_date DATE, adopter_id INTEGER, adoption_date DATE, PRIMARY KEY (id),"
+    " FOREIGN KEY(adopter_id) REFERENCES users (id))",
+    "CREATE TABLE fosters (user_id INTEGER NOT NULL, animal_id INTEGER NOT NULL,"
+    " start_date DATE NOT NULL, end_date DATE NOT NULL, PRIMARY KEY (user_id, animal_id),"
+    " FOREIGN KEY(user_id) REFERENCES users (id),"
+    " FOREIGN KEY(animal_id) REFERENCES animals (id))",
+]
+
+
+def test_create_db_and_tables_upgrades_baseline_schema():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text(
+            "INSERT INTO users (username, email, hashed_password)"
+            " VALUES ('juniper', 'j@cool.email', '-')"
+        ))
+        connection.execute(text(
+            "INSERT INTO animals (name, age, kind, fixed, vaccinated, adopter_id)"
+            " VALUES ('pickles', 3, 'cat', 1, 1, 1)"
+        ))
+        connection.execute(text(
+            "INSERT INTO fosters (user_id, animal_id, start_date, end_date)"
+            " VALUES (1, 1, '2024-01-01', '2024-02-01')"
+        ))
+
+    # the cascades update `animals.version`, so it is added before they are created
+    assert db.create_db_and_tables(engine)
+
+    with Session(engine) as session:
+        db.delete_user(session, 1)
+        assert session.exec(select(FosterInDB)).all() == []
+        animal = session.get(AnimalInDB, 1)
+        assert (animal.adopter_id, animal.version) == (None, 2)
+
+
+def test_create_derived_objects_replaces_cascades():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    # as in a database created before users had refresh tokens
+    with engine.begin() as connection:
+        connection.execute(text("DROP TRIGGER users_cascade"))
+        connection.execute(text(
+            "CREATE TRIGGER users_cascade BEFORE DELETE ON users"
+            " BEGIN DELETE FROM fosters WHERE user_id = old.id; END"
+        ))
+    db.create_missing_indexes(engine)
+
+    with Session(engine) as session:
+        user = db.create_user(session, username="juniper", email="j@cool.email", hashed_password="-")
+        db.create_refresh_token(session, user.id, "token hash", ttl=60)
+        db.delete_user(session, user.id)
+        assert session.exec(select(RefreshTokenInDB)).all() == []
+
+
+def test_animal_facet_counts_follow_writes(session, animal_fixture, user_fixture):
+    user = user_fixture(username="juniper")
+    animals = [animal_fixture(kind=kind, age=age) for kind, age in [("cat", 1), ("dog", 2), ("dog", 3)]]
+    db.update_animal(session, animals[0].id, AnimalUpdate(kind="dog", adopter_id=user.id))
+    db.update_animal(session, animals[1].id, AnimalUpdate(adopter_id=user.id))
+    db.delete_animal(session, animals[2].id)
+
+    count, facets = db.get_animal_facets(session, AnimalSearch())
+    assert count == 2
+    assert facets.kind == {"dog": 2}
+    assert facets.adopted == {True: 2}
+
+    count, _facets = db.get_animal_facets(session, AnimalSearch(min_age=2))
+    assert count == 1
+
+    # deleting the adopter clears the adoption of their pets
+    db.delete_user(session, user.id)
+    count, facets = db.get_animal_facets(session, AnimalSearch(adopted=False))
+    assert count == 2
+    assert facets.adopted == {False: 2}
+
+
+def test_create_db_and_tables_skips_current_schema():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+
+    assert db.create_db_and_tables(engine)
+    assert not db.create_db_and_tables(engine)
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_users_email"))
+        connection.execute(text("UPDATE schema_version SET version = 'outdated'"))
+
+    assert db.create_db_and_tables(engine)
+    assert "ix_users_email" in {index["name"] for index in inspect(engine).get_indexes("users")}
+    with engine.connect() as connection:
+        assert connection.scalar(text("SELECT version FROM schema_version")) == (
+            db.get_schema_version(engine.dialect)
+        )
+
+
+def test_bump_table_versions(session):
+    assert db.get_table_versions(session, "animals", "users") == {"animals": 0, "users": 0}
+
+    db.bump_table_versions(session, "animals")
+    db.bump_table_versions(session, "animals", "users")
+    session.commit()
+
+    assert db.get_table_versions(session, "animals", "users") == {"animals": 2, "users": 1}
+
+
+def test_update_animal_if_version_matches(session, animal_fixture):
+    animal = animal_fixture(name="chompers")
+
+    updated = db.update_animal(session, animal.id, AnimalUpdate(age=3), versions=[1])
+    assert (updated.age, updated.version) == (3, 2)
+
+    with pytest.raises(db.VersionMismatchException):
+        db.update_animal(session, animal.id, AnimalUpdate(age=4), versions=[1])
+    with pytest.raises(db.VersionMismatchException):
+        db.delete_animal(session, animal.id, versions=[1])
+    with pytest.raises(db.EntityNotFoundException):
+        db.update_animal(session, 999, AnimalUpdate(age=4), versions=[1])
+
+    db.delete_animal(session, animal.id, versions=[1, 2])
+    assert session.get(AnimalInDB, animal.id) is None
+
+
+def test_delete_user_keeps_pets(
+    session, user_fixture, animal_fixture, add_foster_relation, add_adoption_relation
+):
+    user = user_fixture()
+    pet = animal_fixture()
+    add_foster_relation(user, pet)
+    add_adoption_relation(user, pet)
+    user_id, pet_id, version = user.id, pet.id, pet.version
+
+    db.delete_user(session, user_id)
+    session.expunge_all()
+
+    pet = session.get(AnimalInDB, pet_id)
+    assert pet.adopter_id is None
+    assert pet.version == version + 1
+    assert session.exec(select(FosterInDB)).all() == []
+    with pytest.raises(db.EntityNotFoundException):
+        db.delete_user(session, user_id)
+
+
+def test_delete_user_statements_independent_of_history(
+    engine, session, user_fixture, animal_fixture, add_foster_relation, add_adoption_relation
+):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args))
+
+    counts = []
+    for history in [0, 20]:
+        user = user_fixture(username=f"user {history}")
+        for _ in range(history):
+            animal = animal_fixture()
+            add_foster_relation(user, animal)
+            add_adoption_relation(user, animal)
+
+        user_id = user.id
+        statements.clear()
+        db.delete_user(session, user_id)
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
+    assert session.exec(select(FosterInDB)).all() == []
+
+
+def test_raw_deletes_cascade(session, user_fixture, animal_fixture, add_foster_relation):
+    user = user_fixture()
+    animals = [animal_fixture() for _ in range(2)]
+    for animal in animals:
+        add_foster_relation(user, animal)
+
+    session.exec(text("DELETE FROM animals WHERE id = :id").bindparams(id=animals[0].id))
+    assert [foster.animal_id for foster in session.exec(select(FosterInDB))] == [animals[1].id]
+    session.exec(text("DELETE FROM users WHERE id = :id").bindparams(id=user.id))
+    assert session.exec(select(FosterInDB)).all() == []
+
+
+def test_get_foster_count(session, user_fixture, animal_fixture, add_foster_relation):
+    juniper = user_fixture(username="juniper")
+    perseus = user_fixture(username="perseus")
+    for _ in range(2):
+        add_foster_relation(juniper, animal_fixture())
+
+    assert db.get_foster_count(session, juniper.id) == 2
+    assert db.get_foster_count(session, perseus.id) == 0
+
+
+def test_summaries_match_rebuild(
+    session,
+    user_fixture,
+    animal_fixture,
+    add_foster_relation,
+    add_adoption_relation,
+):
+    juniper = user_fixture(username="juniper")
+    perseus = user_fixture(username="perseus")
+    animals = [
+        animal_fixture(kind=kind, intake_date=date(2024, 1, 1))
+        for kind in ["cat", "cat", "dog"]
+    ]
+    for animal in animals:
+        add_foster_relation(juniper, animal)
+    add_foster_relation(perseus, animals[0], start_date=date(2024, 3, 1), end_date=date(2024, 3, 9))
+    add_adoption_relation(juniper, animals[0], adoption_date=date(2024, 1, 3))
+    add_adoption_relation(perseus, animals[1], adoption_date=date(2024, 1, 7))
+    db.update_animal(session, animals[1].id, AnimalUpdate(kind="dog", adopter_id=juniper.id))
+    db.delete_animal(session, animals[2].id)
+    db.delete_user(session, perseus.id)
+
+    stats = db.get_stats(session)
+    assert stats.animals.adopted == 2
+    assert [(user.username, user.fosters, user.adoptions) for user in stats.users] == [
+        ("juniper", 2, 2),
+    ]
+    facets = db.get_animal_facets(session, AnimalSearch())
+
+    connection = session.connection()
+    for _name, _statements, fill in db.DERIVED_OBJECTS[connection.dialect.name]:
+        for statement in fill:
+            connection.exec_driver_sql(statement)
+    assert db.get_stats(session) == stats
+    assert db.get_animal_facets(session, AnimalSearch()) == facets
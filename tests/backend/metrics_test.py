@@ -0,0 +1,82 @@
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_requests_counted_by_route_template(client, animal_fixture):
+    animal = animal_fixture()
+    labels = {"method": "GET", "route": "/animals/{animal_id}"}
+    before = _sample("http_requests_total", **labels, status="200")
+    before_missing = _sample("http_requests_total", **labels, status="404")
+    before_duration = _sample("http_request_duration_seconds_count", **labels)
+
+    assert client.get(f"/animals/{animal.id}").status_code == 200
+    assert client.get("/animals/999").status_code == 404
+
+    assert _sample("http_requests_total", **labels, status="200") == before + 1
+    assert _sample("http_requests_total", **labels, status="404") == before_missing + 1
+    assert _sample("http_request_duration_seconds_count", **labels) == before_duration + 2
+
+
+def test_unmatched_routes_share_a_label(client):
+    labels = {"method": "GET", "route": "unmatched", "status": "404"}
+    before = _sample("http_requests_total", **labels)
+
+    client.get("/no-such-page")
+    client.get("/another-missing-page")
+
+    assert _sample("http_requests_total", **labels) == before + 2
+    assert _sample("http_requests_in_progress", method="GET") == 0
+
+
+def test_auth_failures_counted_by_exception(client, user_fixture):
+    user_fixture(username="juniper", password="password")
+    before_credentials = _sample("auth_failures_total", exception="InvalidCredentials")
+    before_token = _sample("auth_failures_total", exception="InvalidToken")
+    before_verify = _sample("password_hash_duration_seconds_count", operation="verify")
+
+    response = client.post(
+        "/auth/token",
+        data={"username": "juniper", "password": "wrong password"},
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"]["error"] == "invalid_client"
+    response = client.get("/users/me", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+    assert _sample("auth_failures_total", exception="InvalidCredentials") == before_credentials + 1
+    assert _sample("auth_failures_total", exception="InvalidToken") == before_token + 1
+    assert _sample("password_hash_duration_seconds_count", operation="verify") == before_verify + 1
+
+
+def test_metrics_endpoint(client):
+    client.get("/greet")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    families = {
+        family.name: family
+        for family in text_string_to_metric_families(response.text)
+    }
+    assert {
+        "http_requests",
+        "http_request_duration_seconds",
+        "http_requests_in_progress",
+        "auth_failures",
+        "password_hash_duration_seconds",
+        "db_pool_checkouts",
+        "db_pool_exhausted",
+        "cache_hits",
+        "cache_misses",
+    } <= families.keys()
+    assert {
+        sample.labels["engine"] for sample in families["db_pool_checkouts"].samples
+    } == {"sync", "async"}
+    assert {
+        sample.labels["cache"] for sample in families["cache_hits"].samples
+    } == {"user", "animals"}
@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from backend.pool import (
+    InstrumentedNullPool,
+    InstrumentedQueuePool,
+    get_pool_options,
+    get_pool_status,
+)
+
+
+def test_get_pool_options(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "2")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "true")
+
+    options = get_pool_options()
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["pool_size"] == 2
+    assert options["pool_pre_ping"] is True
+
+
+def test_get_pool_options_null_pool(monkeypatch):
+    monkeypatch.setenv("DB_POOL", "null")
+    assert get_pool_options() == {"poolclass": InstrumentedNullPool}
+
+
+def test_pool_records_checkouts_and_exhaustion(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        status = get_pool_status(engine.pool)
+        assert status["checked_out"] == 1
+
+    status = get_pool_status(engine.pool)
+    assert status["pool"] == "InstrumentedQueuePool"
+    assert status["checked_out"] == 0
+    assert status["checkouts"] == 1
+    assert status["exhausted"] == 1
+
+    engine.dispose()
+    assert get_pool_status(engine.pool)["checkouts"] == 1
@@ -0,0 +1,94 @@
+"""
+The Postgres DDL of `database.DERIVED_OBJECTS`, run on a real server.
+
+Set `TEST_POSTGRES_URL` to a throwaway database to run these, eg
+`postgresql://postgres@localhost/buddy_test`; its tables are dropped.
+The tests imported from `database_test` and `seed_database_test` run again
+here, against it.
+"""
+
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import SQLModel, create_engine, select
+
+from backend import database as db
+from backend.entities import AnimalSearch, FosterInDB, UserInDB
+from tests.backend.database_test import (  # noqa: F401
+    test_animal_facet_counts_follow_writes,
+    test_delete_user_keeps_pets,
+    test_raw_deletes_cascade,
+    test_summaries_match_rebuild,
+)
+from tests.backend.seed_database_test import test_insert_after_seed  # noqa: F401
+
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+
+
+@pytest.fixture
+def engine():
+    # overrides the SQLite engine of `conftest`, and so every fixture on it
+    engine = create_engine(POSTGRES_URL)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    SQLModel.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def test_derived_objects_created(engine):
+    with engine.connect() as connection:
+        for name, _statements, _fill in db.DERIVED_OBJECTS["postgresql"]:
+            assert db._schema_object_exists(connection, name), name
+
+
+def test_derived_objects_created_again(engine):
+    # as by `create_missing_indexes` on an existing database
+    with engine.begin() as connection:
+        assert db.create_derived_objects(connection) == []
+
+
+def test_search_animals(session, animal_fixture):
+    for name in ["pickles", "pickle rick", "noodle"]:
+        animal_fixture(name=name)
+
+    animals, _cursor, count, facets = db.search_animals(session, AnimalSearch(q="pick"))
+    assert count == 2
+    assert [animal.name for animal in animals] == ["pickle rick", "pickles"]
+    assert facets.kind == {"cat": 2}
+
+
+def test_create_missing_cascades(engine, session, user_fixture, animal_fixture):
+    user_id, animal_id = user_fixture().id, animal_fixture().id
+    # so the session holds no lock the DDL would wait for
+    session.commit()
+    with engine.begin() as connection:
+        for table_name in ["users", "animals"]:
+            connection.execute(text(f"DROP TRIGGER {table_name}_cascade ON {table_name}"))
+        # as left dangling by deletes made before `CASCADES` existed
+        connection.execute(text("ALTER TABLE fosters DROP CONSTRAINT fosters_user_id_fkey"))
+        connection.execute(
+            text(
+                "INSERT INTO fosters (user_id, animal_id, start_date, end_date)"
+                " VALUES (:user_id, :animal_id, '2024-01-01', '2024-02-01')"
+            ),
+            {"user_id": user_id + 1, "animal_id": animal_id},
+        )
+
+    assert db.create_missing_indexes(engine) == ["animals_cascade"]
+    assert session.exec(select(FosterInDB)).all() == []
+
+    db.delete_user(session, user_id)
+    assert session.get(UserInDB, user_id) is None
+
+
+def test_summary_stay_days(session, user_fixture, animal_fixture, add_adoption_relation):
+    user = user_fixture()
+    animal = animal_fixture(kind="cat", intake_date=date(2024, 1, 1))
+    add_adoption_relation(user, animal, adoption_date=date(2024, 1, 11))
+
+    assert db.get_stats(session).animals.average_stay_days == 10.0
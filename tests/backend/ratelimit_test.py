@@ -0,0 +1,83 @@
+import pytest
+
+from backend import auth
+from backend import ratelimit
+from backend.ratelimit import TokenBuckets
+
+
+def test_take_up_to_burst():
+    buckets = TokenBuckets(maxsize=10)
+    assert [buckets.take("a", rate=1, burst=2) for _ in range(2)] == [0, 0]
+
+    wait = buckets.take("a", rate=1, burst=2)
+    assert 0 < wait <= 1
+    # a rejected request does not take a token
+    assert buckets.take("a", rate=1, burst=2) <= wait
+    assert buckets.take("b", rate=1, burst=2) == 0
+
+
+def test_buckets_refill(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now)
+    buckets = TokenBuckets(maxsize=10)
+    for _ in range(3):
+        buckets.take("a", rate=0.5, burst=3)
+    assert buckets.take("a", rate=0.5, burst=3) == pytest.approx(2)
+
+    now += 2
+    assert buckets.take("a", rate=0.5, burst=3) == 0
+    # never more than `burst` tokens, however long the bucket was idle
+    now += 3600
+    assert [buckets.take("a", rate=0.5, burst=3) for _ in range(4)][-1] > 0
+
+
+def test_least_recently_used_buckets_are_dropped():
+    buckets = TokenBuckets(maxsize=2)
+    for key in ["a", "b", "c"]:
+        buckets.take(key, rate=1, burst=1)
+
+    assert len(buckets) == 2
+    assert buckets.take("a", rate=1, burst=1) == 0
+    assert buckets.take("c", rate=1, burst=1) > 0
+
+
+def test_login_limited_per_username(client, user_fixture, monkeypatch):
+    user_fixture(username="juniper", password="password")
+    monkeypatch.setattr(ratelimit.username_limit, "burst", 2)
+    hashed = []
+    verify_password = auth.verify_password
+
+    async def _verify_password(*args):
+        hashed.append(args)
+        return await verify_password(*args)
+
+    monkeypatch.setattr(auth, "verify_password", _verify_password)
+
+    for password in ["wrong", "password"]:
+        response = client.post("/auth/token", data={"username": "juniper", "password": password})
+        assert response.status_code in (200, 401)
+
+    response = client.post("/auth/token", data={"username": "JUNIPER", "password": "password"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert response.json()["detail"]["limit"] == "username"
+    # rejected before any password is checked
+    assert len(hashed) == 2
+
+    # other usernames are still let through
+    response = client.post("/auth/token", data={"username": "perseus", "password": "password"})
+    assert response.status_code == 401
+
+
+def test_registration_limited_per_ip(client, monkeypatch):
+    monkeypatch.setattr(ratelimit.ip_limit, "burst", 1)
+
+    registration = {"username": "juniper", "email": "juniper@cool.email", "password": "pw"}
+    assert client.post("/auth/registration", json=registration).status_code == 200
+
+    response = client.post("/auth/registration", json={**registration, "username": "perseus"})
+    assert response.status_code == 429
+    assert response.json()["detail"]["limit"] == "ip"
+    # the limit covers logins from the same IP too
+    response = client.post("/auth/token", data={"username": "juniper", "password": "pw"})
+    assert response.status_code == 429
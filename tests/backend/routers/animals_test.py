@@ -1,9 +1,13 @@
+import base64
+import json
 from datetime import date
 
 import pytest
+from sqlalchemy import event
+from sqlmodel import select
 
 from backend import database as db
-from backend.entities import AnimalInDB
+from backend.entities import AnimalInDB, AnimalUpdate
 
 
 @pytest.fixture
@@ -137,6 +141,327 @@ def test_get_all_animals_between_dates(client, session, default_animals):
     assert [animal["name"] for animal in animals] == expected_names
 
 
+def test_get_all_animals_paginated(client, session, default_animals):
+    expected_pages = [["paperclip", "chompers"], ["bagels"]]  # sorted by intake date
+    session.add_all(default_animals)
+    session.commit()
+
+    response = client.get("/animals?sort=intake_date&limit=2")
+    assert response.status_code == 200
+
+    meta = response.json()["meta"]
+    animals = response.json()["animals"]
+
+    assert meta["count"] == len(default_animals)
+    assert meta["limit"] == 2
+    assert meta["next_cursor"] is not None
+    assert [animal["name"] for animal in animals] == expected_pages[0]
+
+    response = client.get(
+        f"/animals?sort=intake_date&limit=2&cursor={meta['next_cursor']}"
+    )
+    assert response.status_code == 200
+
+    meta = response.json()["meta"]
+    animals = response.json()["animals"]
+
+    assert meta["count"] == len(default_animals)
+    assert meta["next_cursor"] is None
+    assert [animal["name"] for animal in animals] == expected_pages[1]
+
+
+def test_get_all_animals_paginated_with_ties(client, animal_fixture):
+    db_animals = [animal_fixture(name="chompers") for _ in range(3)]
+
+    ids_seen = []
+    cursor = None
+    for _ in range(len(db_animals)):
+        url = "/animals?limit=1" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        ids_seen.extend(animal["id"] for animal in response.json()["animals"])
+        cursor = response.json()["meta"]["next_cursor"]
+
+    assert cursor is None
+    assert ids_seen == [animal.id for animal in db_animals]
+
+
+def test_get_all_animals_invalid_cursor(client):
+    response = client.get("/animals?cursor=not-a-cursor")
+    assert response.status_code == 422
+    assert response.json() == {
+        "detail": {
+            "type": "invalid_cursor",
+            "cursor": "not-a-cursor",
+        },
+    }
+
+
+@pytest.mark.parametrize(
+    "sort, payload",
+    [
+        ("name", [{"a": 1}, 1]),
+        ("name", [[1], 1]),
+        ("name", [1, 1]),
+        ("name", ["pickles", "1"]),
+        ("age", [True, 1]),
+        ("intake_date", ["2024-01-01", 1.5]),
+    ],
+)
+def test_get_all_animals_wrong_typed_cursor(client, animal_fixture, sort, payload):
+    animal_fixture()
+    cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+    response = client.get(f"/animals?sort={sort}&cursor={cursor}")
+    assert response.status_code == 422
+    assert response.json()["detail"]["type"] == "invalid_cursor"
+
+
+def test_get_all_animals_not_modified(client, animal_fixture):
+    animal = animal_fixture(name="chompers")
+
+    response = client.get("/animals?sort=age")
+    etag = response.headers["ETag"]
+
+    response = client.get("/animals?sort=age", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    # the ETag depends on the query
+    response = client.get("/animals?sort=name", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    client.put(f"/animals/{animal.id}", json={"name": "nibbles"})
+    response = client.get("/animals?sort=age", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["animals"][0]["name"] == "nibbles"
+
+
+def test_get_all_animals_etag_changes_on_writes(client, animal_fixture):
+    animal = animal_fixture(name="chompers")
+    etags = {client.get("/animals").headers["ETag"]}
+
+    client.post("/animals", json={"name": "bagels", "age": 2, "kind": "cat"})
+    etags.add(client.get("/animals").headers["ETag"])
+    client.post(
+        "/animals/bulk",
+        content='{"name": "mochi", "age": 1, "kind": "dog"}\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    etags.add(client.get("/animals").headers["ETag"])
+    client.delete(f"/animals/{animal.id}")
+    etags.add(client.get("/animals").headers["ETag"])
+
+    assert len(etags) == 4
+
+
+def test_get_all_animals_cached(client, session, async_engine, animal_fixture):
+    animal = animal_fixture(name="chompers")
+    statements = []
+    event.listen(
+        async_engine.sync_engine,
+        "before_cursor_execute",
+        lambda *args: statements.append(args),
+    )
+
+    first = client.get("/animals")
+    statements.clear()
+    second = client.get("/animals")
+
+    assert second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert len(statements) == 1  # only the table version
+    assert (db.animal_cache.hits, db.animal_cache.misses) == (1, 1)
+
+    db.update_animal(session, animal.id, AnimalUpdate(name="nibbles"))
+    assert len(db.animal_cache) == 0
+
+    response = client.get("/animals")
+    assert response.json()["animals"][0]["name"] == "nibbles"
+
+
+def test_get_animal_not_modified(client, animal_fixture):
+    animal = animal_fixture(name="chompers")
+
+    etag = client.get(f"/animals/{animal.id}").headers["ETag"]
+    for if_none_match in [etag, f"W/{etag}", f'"other", {etag}', "*"]:
+        response = client.get(
+            f"/animals/{animal.id}",
+            headers={"If-None-Match": if_none_match},
+        )
+        assert response.status_code == 304
+
+    response = client.get(f"/animals/{animal.id}", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_get_all_animals_ndjson(client, session, default_animals):
+    session.add_all(default_animals)
+    session.commit()
+    query = "sort=intake_date&intake_after=2020-01-01"
+
+    first_page = client.get(f"/animals?{query}&limit=1").json()
+    pages = client.get(f"/animals?{query}&limit=1000").json()["animals"]
+    headers = {"Accept": "application/x-ndjson, application/json;q=0.5"}
+
+    response = client.get(f"/animals?{query}", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["vary"] == "Accept"
+    assert [json.loads(line) for line in response.text.splitlines()] == pages
+
+    # streaming continues after a cursor
+    response = client.get(
+        f"/animals?{query}&cursor={first_page['meta']['next_cursor']}",
+        headers=headers,
+    )
+    assert [json.loads(line) for line in response.text.splitlines()] == pages[1:]
+
+
+def test_get_all_animals_ndjson_invalid_cursor(client):
+    response = client.get(
+        "/animals?cursor=not-a-cursor",
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"]["type"] == "invalid_cursor"
+
+
+def test_get_animals_by_ids(client, async_engine, animal_fixture):
+    animals = [animal_fixture(name=name) for name in ["chompers", "waffles", "bagels"]]
+    statements = []
+    event.listen(
+        async_engine.sync_engine,
+        "before_cursor_execute",
+        lambda *args: statements.append(args),
+    )
+
+    ids = [animals[2].id, 999, animals[0].id, animals[2].id]
+    response = client.get(f"/animals?ids={','.join(map(str, ids))}")
+    assert response.status_code == 200
+    assert response.json()["meta"] == {"count": 2, "missing": [999]}
+    assert [animal["name"] for animal in response.json()["animals"]] == [
+        "bagels",
+        "chompers",
+    ]
+    assert len(statements) == 2  # the table version and one `IN` query
+
+    etag = response.headers["ETag"]
+    # the ETag depends on the requested ids and their order
+    response = client.get(
+        f"/animals?ids={animals[0].id},{animals[2].id}",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    response = client.get(
+        f"/animals?ids={','.join(map(str, ids))}",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("ids", ["", "1,,2", "1,two", "-1", "1," + "9" * 19])
+def test_get_animals_by_invalid_ids(client, ids):
+    response = client.get(f"/animals?ids={ids}")
+    assert response.status_code == 422
+
+
+def test_get_animals_by_largest_ids(client):
+    largest = int("9" * 18)
+    response = client.get(f"/animals?ids={largest}")
+    assert response.status_code == 200
+    assert response.json()["meta"]["missing"] == [largest]
+
+
+def test_get_animals_by_too_many_ids(client):
+    response = client.get(f"/animals?ids={','.join(map(str, range(1001)))}")
+    assert response.status_code == 422
+    assert response.json() == {"detail": {"type": "too_many_ids", "limit": 1000}}
+
+
+def test_search_animals(client, session, default_animals):
+    session.add_all(default_animals)
+    session.commit()
+
+    response = client.get("/animals/search?q=CHOMP")
+    assert response.status_code == 200
+    assert [animal["name"] for animal in response.json()["animals"]] == ["chompers"]
+
+    response = client.get("/animals/search?q=pa&kind=dog&min_age=5&max_age=5")
+    assert [animal["name"] for animal in response.json()["animals"]] == ["paperclip"]
+
+    response = client.get("/animals/search?q=p&kind=cat")
+    assert response.json()["animals"] == []
+    assert response.json()["meta"]["count"] == 0
+
+
+def test_search_animals_facets(client, session, user_fixture, default_animals):
+    user = user_fixture(username="juniper")
+    default_animals[0].adopter_id = user.id
+    session.add_all(default_animals)
+    session.commit()
+
+    response = client.get("/animals/search?fixed=true&limit=1")
+    assert response.status_code == 200
+    assert response.json()["meta"] == {
+        "count": 2,
+        "limit": 1,
+        "next_cursor": response.json()["meta"]["next_cursor"],
+    }
+    assert [animal["name"] for animal in response.json()["animals"]] == ["bagels"]
+    # facets count every match, not just the page
+    assert response.json()["facets"] == {
+        "kind": {"cat": 1, "turtle": 1},
+        "fixed": {"true": 2},
+        "vaccinated": {"false": 1, "true": 1},
+        "adopted": {"false": 1, "true": 1},
+    }
+
+    cursor = response.json()["meta"]["next_cursor"]
+    response = client.get(f"/animals/search?fixed=true&limit=1&cursor={cursor}")
+    assert [animal["name"] for animal in response.json()["animals"]] == ["chompers"]
+    assert response.json()["meta"]["next_cursor"] is None
+
+    response = client.get("/animals/search?adopted=false&vaccinated=true")
+    assert [animal["name"] for animal in response.json()["animals"]] == ["bagels", "paperclip"]
+
+
+def test_search_animals_follows_writes(client, animal_fixture):
+    animal = animal_fixture(name="chompers")
+    client.post("/animals", json={"name": "mochi", "age": 1, "kind": "dog"})
+
+    response = client.get("/animals/search?q=mochi")
+    assert [animal["name"] for animal in response.json()["animals"]] == ["mochi"]
+
+    client.put(f"/animals/{animal.id}", json={"name": "nibbles"})
+    assert client.get("/animals/search?q=chomp").json()["animals"] == []
+    response = client.get("/animals/search?q=nib")
+    assert [animal["id"] for animal in response.json()["animals"]] == [animal.id]
+
+    client.delete(f"/animals/{animal.id}")
+    assert client.get("/animals/search?q=nib").json()["animals"] == []
+
+
+def test_search_animals_not_modified(client, animal_fixture):
+    animal_fixture(name="chompers")
+
+    response = client.get("/animals/search?q=chomp")
+    etag = response.headers["ETag"]
+    assert etag != client.get("/animals/search?q=chom").headers["ETag"]
+
+    response = client.get("/animals/search?q=chomp", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_search_animals_ignores_query_syntax(client, animal_fixture):
+    animal_fixture(name="chompers")
+
+    for q in ['"', "chomp*", "chomp OR", "!:&|", "NEAR(chomp)"]:
+        response = client.get("/animals/search", params={"q": q})
+        assert response.status_code == 200
+
+
 def test_create_animal(client, session):
     create_params = {
         "name": "karl barx",
@@ -225,6 +550,82 @@ def test_update_animal_invalid_id(client):
     }
 
 
+def test_update_animal_single_statement(client, async_engine, animal_fixture):
+    animal = animal_fixture(name="chompers")
+    statements = []
+    event.listen(
+        async_engine.sync_engine,
+        "before_cursor_execute",
+        lambda _conn, _cursor, statement, *args: statements.append(statement),
+    )
+
+    response = client.put(f"/animals/{animal.id}", json={"name": "nibbles"})
+    assert response.status_code == 200
+    assert response.json()["animal"]["name"] == "nibbles"
+    # the update itself, and the table version
+    assert len(statements) == 2
+    assert statements[0].startswith("UPDATE animals") and "RETURNING" in statements[0]
+
+
+def test_update_animal_if_match(client, animal_fixture):
+    animal = animal_fixture(name="chompers")
+    etag = client.get(f"/animals/{animal.id}").headers["ETag"]
+
+    response = client.put(
+        f"/animals/{animal.id}",
+        json={"name": "nibbles"},
+        headers={"If-Match": etag},
+    )
+    assert response.status_code == 200
+    new_etag = response.headers["ETag"]
+    assert new_etag != etag
+    assert client.get(f"/animals/{animal.id}").headers["ETag"] == new_etag
+
+    # a write based on the old version is rejected
+    for method in [client.put, client.delete]:
+        kwargs = {"json": {"name": "waffles"}} if method == client.put else {}
+        response = method(f"/animals/{animal.id}", headers={"If-Match": etag}, **kwargs)
+        assert response.status_code == 412
+        assert response.json() == {
+            "detail": {
+                "type": "version_mismatch",
+                "entity_name": "Animal",
+                "entity_id": animal.id,
+            },
+        }
+    assert client.get(f"/animals/{animal.id}").json()["animal"]["name"] == "nibbles"
+
+    # weak ETags never match
+    response = client.delete(f"/animals/{animal.id}", headers={"If-Match": f"W/{new_etag}"})
+    assert response.status_code == 412
+
+    response = client.delete(f"/animals/{animal.id}", headers={"If-Match": f"{etag}, {new_etag}"})
+    assert response.status_code == 204
+
+
+def test_animal_etag_not_reused(client, animal_fixture):
+    first, second = animal_fixture(), animal_fixture()
+    first_etag = client.get(f"/animals/{first.id}").headers["ETag"]
+    second_etag = client.get(f"/animals/{second.id}").headers["ETag"]
+    assert first_etag != second_etag
+
+    # another animal's ETag at the same version does not match
+    response = client.put(
+        f"/animals/{second.id}",
+        json={"name": "nibbles"},
+        headers={"If-Match": first_etag},
+    )
+    assert response.status_code == 412
+
+    # nor does that of a deleted animal, as its id is not given out again
+    client.delete(f"/animals/{second.id}")
+    response = client.post("/animals", json={"name": "waffles", "age": 1, "kind": "dog"})
+    new_id = response.json()["animal"]["id"]
+    assert new_id != second.id
+    response = client.get(f"/animals/{new_id}", headers={"If-None-Match": second_etag})
+    assert response.status_code == 200
+
+
 def test_delete_animal(client, session, default_animals):
     db_animal = default_animals[0]
     session.add(db_animal)
@@ -235,7 +636,9 @@ def test_delete_animal(client, session, default_animals):
     assert response.content == b""
 
     # test that the delete is persisted
-    assert session.get(AnimalInDB, db_animal.id) is None
+    animal_id = db_animal.id
+    session.expunge_all()
+    assert session.get(AnimalInDB, animal_id) is None
 
 
 def test_delete_animal_invalid_id(client):
@@ -249,3 +652,201 @@ def test_delete_animal_invalid_id(client):
             "entity_id": animal_id,
         },
     }
+
+
+def test_import_animals_ndjson(client, session):
+    body = "\n".join([
+        '{"name": "nibbles", "age": 2, "kind": "cat"}',
+        '{"name": "waffles", "age": "old", "kind": "dog"}',
+        "",
+        "not json",
+        '{"name": "bagels", "age": 99, "kind": "turtle", "fixed": true}',
+    ])
+    response = client.post(
+        "/animals/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["meta"] == {"inserted": 2, "failed": 2}
+    assert [error["line"] for error in data["errors"]] == [2, 4]
+    assert data["errors"][0]["errors"][0]["loc"] == ["age"]
+
+    animals = session.exec(select(AnimalInDB).order_by(AnimalInDB.id)).all()
+    assert [animal.name for animal in animals] == ["nibbles", "bagels"]
+    assert animals[1].fixed is True
+    assert animals[0].intake_date == date.today()
+
+
+def test_import_animals_bumps_version_once(client, session, monkeypatch):
+    monkeypatch.setattr("backend.routers.animals.BULK_CHUNK_SIZE", 1)
+    before = db.get_table_versions(session, "animals")["animals"]
+    cached = client.get("/animals")
+
+    body = "\n".join(f'{{"name": "pet{i}", "age": 1, "kind": "cat"}}' for i in range(3))
+    response = client.post(
+        "/animals/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.json()["meta"] == {"inserted": 3, "failed": 0}
+
+    assert db.get_table_versions(session, "animals")["animals"] == before + 1
+    response = client.get("/animals")
+    assert response.headers["ETag"] != cached.headers["ETag"]
+    assert len(response.json()["animals"]) == 3
+
+
+def test_import_animals_csv(client, session):
+    body = "name,age,kind,fixed\nnibbles,2,cat,\nwaffles,3\nbagels,99,turtle,true\n"
+    response = client.post(
+        "/animals/bulk",
+        content=body,
+        headers={"Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["meta"] == {"inserted": 2, "failed": 1}
+    assert data["errors"][0]["line"] == 3
+
+    animals = session.exec(select(AnimalInDB).order_by(AnimalInDB.id)).all()
+    assert [(animal.name, animal.fixed) for animal in animals] == [
+        ("nibbles", False),
+        ("bagels", True),
+    ]
+
+
+def test_import_animals_invalid_utf8(client, session):
+    body = b"".join([
+        '\ufeffname,age,kind\n'.encode(),
+        b"nibbles,2,cat\n",
+        b"w\xffffles,3,dog\n",
+        b"bagels,99,turtle\n",
+    ])
+    response = client.post(
+        "/animals/bulk",
+        content=body,
+        headers={"Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+
+    # the byte order mark is not part of the first column's name
+    data = response.json()
+    assert data["meta"] == {"inserted": 2, "failed": 1}
+    assert data["errors"][0]["line"] == 3
+    assert data["errors"][0]["errors"][0]["type"] == "unicode_invalid"
+
+    animals = session.exec(select(AnimalInDB).order_by(AnimalInDB.id)).all()
+    assert [animal.name for animal in animals] == ["nibbles", "bagels"]
+
+
+def test_import_animals_ndjson_invalid_utf8(client):
+    body = b'{"name": "nibbles", "age": 2, "kind": "cat"}\n{"name": "\xff"}\n'
+    response = client.post(
+        "/animals/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.json()["meta"] == {"inserted": 1, "failed": 1}
+    assert response.json()["errors"][0]["line"] == 2
+
+
+def test_import_animals_reports_first_errors(client, monkeypatch):
+    monkeypatch.setattr("backend.routers.animals.MAX_REPORTED_ERRORS", 2)
+    body = "\n".join(["not json"] * 5 + ['{"name": "nibbles", "age": 2, "kind": "cat"}'])
+    response = client.post(
+        "/animals/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    data = response.json()
+    assert data["meta"] == {"inserted": 1, "failed": 5}
+    assert [error["line"] for error in data["errors"]] == [1, 2]
+
+
+@pytest.mark.parametrize("newline", [True, False])
+def test_import_animals_line_too_long(client, session, monkeypatch, newline):
+    monkeypatch.setattr("backend.routers.animals.MAX_LINE_BYTES", 100)
+
+    def _body():
+        yield b'{"name": "nibbles", "age": 2, "kind": "cat"}\n'
+        for _ in range(10):
+            yield b"x" * 20
+        if newline:
+            yield b"\n"
+
+    response = client.post(
+        "/animals/bulk",
+        content=_body(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 413
+    assert response.json()["detail"]["type"] == "line_too_long"
+    assert session.exec(select(AnimalInDB)).all() == []
+
+
+def test_import_animals_lines_across_chunks(client, session):
+    def _body():
+        yield b'{"name": "nib'
+        yield b'bles", "age": 2, "kind": "cat"}\n{"name": "bagels",'
+        yield b' "age": 9, "kind": "turtle"}'
+
+    response = client.post(
+        "/animals/bulk",
+        content=_body(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.json()["meta"] == {"inserted": 2, "failed": 0}
+
+    animals = session.exec(select(AnimalInDB).order_by(AnimalInDB.id)).all()
+    assert [animal.name for animal in animals] == ["nibbles", "bagels"]
+
+
+def test_import_animals_unsupported_media_type(client):
+    response = client.post("/animals/bulk", json=[{"name": "nibbles"}])
+    assert response.status_code == 415
+
+
+def test_export_animals_ndjson(client, session, default_animals):
+    session.add_all(default_animals)
+    session.commit()
+
+    for animal in default_animals:
+        session.refresh(animal)
+
+    response = client.get("/animals/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = response.text.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        animal.model_dump(mode="json", exclude={"version"}) for animal in default_animals
+    ]
+
+
+def test_export_animals_csv_round_trip(client, session, default_animals):
+    session.add_all(default_animals)
+    session.commit()
+
+    response = client.get("/animals/export?format=csv")
+    assert response.status_code == 200
+    assert response.text.splitlines()[0] == (
+        "id,name,age,kind,fixed,vaccinated,intake_date,adopter_id,adoption_date"
+    )
+
+    response = client.post(
+        "/animals/bulk",
+        content=response.text,
+        headers={"Content-Type": "text/csv"},
+    )
+    assert response.json()["meta"] == {"inserted": 3, "failed": 0}
+
+    animals = session.exec(select(AnimalInDB).order_by(AnimalInDB.id)).all()
+    fields = ["name", "age", "kind", "fixed", "vaccinated", "intake_date"]
+    assert [animal.model_dump(include=set(fields)) for animal in animals[3:]] == [
+        animal.model_dump(include=set(fields)) for animal in animals[:3]
+    ]
@@ -0,0 +1,70 @@
+from datetime import date
+
+from backend import database as db
+
+
+def test_get_stats(
+    client,
+    user_fixture,
+    animal_fixture,
+    add_foster_relation,
+    add_adoption_relation,
+):
+    juniper = user_fixture(username="juniper")
+    perseus = user_fixture(username="perseus")
+    user_fixture(username="idle")
+    cats = [animal_fixture(kind="cat", intake_date=date(2024, 1, 1)) for _ in range(3)]
+    dog = animal_fixture(kind="dog", intake_date=date(2024, 1, 1))
+
+    for cat in cats:
+        add_foster_relation(perseus, cat)
+    add_foster_relation(juniper, dog)
+    add_adoption_relation(juniper, cats[0], adoption_date=date(2024, 1, 11))
+    add_adoption_relation(juniper, dog, adoption_date=date(2024, 1, 31))
+
+    response = client.get("/stats")
+    assert response.status_code == 200
+    assert response.json() == {
+        "animals": {
+            "in_care": 2,
+            "adopted": 2,
+            "average_stay_days": 20.0,
+            "kinds": [
+                {"kind": "cat", "in_care": 2, "adopted": 1, "average_stay_days": 10.0},
+                {"kind": "dog", "in_care": 0, "adopted": 1, "average_stay_days": 30.0},
+            ],
+        },
+        "users": [
+            {"user_id": juniper.id, "username": "juniper", "fosters": 1, "adoptions": 2},
+            {"user_id": perseus.id, "username": "perseus", "fosters": 3, "adoptions": 0},
+        ],
+    }
+
+    response = client.get("/stats?user_limit=1")
+    assert [user["username"] for user in response.json()["users"]] == ["juniper"]
+
+
+def test_get_stats_empty(client):
+    response = client.get("/stats")
+    assert response.status_code == 200
+    assert response.json() == {
+        "animals": {"in_care": 0, "adopted": 0, "average_stay_days": None, "kinds": []},
+        "users": [],
+    }
+
+
+def test_get_stats_cached(client, session, animal_fixture):
+    animal = animal_fixture(kind="cat")
+
+    first = client.get("/stats")
+    etag = first.headers["ETag"]
+    assert client.get("/stats").content == first.content
+    assert (db.animal_cache.hits, db.animal_cache.misses) == (1, 1)
+
+    response = client.get("/stats", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    db.delete_animal(session, animal.id)
+    response = client.get("/stats", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["animals"]["kinds"] == []
@@ -1,6 +1,10 @@
+import json
+
 import pytest
+from sqlalchemy import event
 
 from backend import database as db
+from backend.entities import UserUpdate
 
 
 def test_get_all_users(client, session, user_fixture):
@@ -21,6 +25,40 @@ def test_get_all_users(client, session, user_fixture):
     }
 
 
+def test_get_users_by_ids(client, user_fixture):
+    juniper = user_fixture(username="juniper")
+    reginald = user_fixture(username="reginald")
+    user_fixture(username="bagels")
+
+    response = client.get(f"/users?ids={reginald.id},{juniper.id},999")
+    assert response.status_code == 200
+    assert response.json()["meta"] == {"count": 2, "missing": [999]}
+    assert [user["username"] for user in response.json()["users"]] == [
+        "reginald",
+        "juniper",
+    ]
+
+    response = client.get("/users?ids=juniper")
+    assert response.status_code == 422
+
+
+def test_get_users_by_ids_etag(client, session, user_fixture):
+    juniper = user_fixture(username="juniper")
+    url = f"/users?ids={juniper.id},999"
+    etag = client.get(url).headers["ETag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    # the ETag depends on the requested ids
+    response = client.get(f"/users?ids={juniper.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    db.update_user(session, juniper.id, UserUpdate(email="juniper@new.email"))
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["users"][0]["email"] == "juniper@new.email"
+
+
 def test_get_current_user(logged_in_client):
     response = logged_in_client.get("/users/me")
     assert response.status_code == 200
@@ -34,96 +72,186 @@ def test_get_current_user_not_logged_in(client):
     assert response.json() == {"detail": "Not authenticated"}
 
 
-#class TestGetUser:
-#   """
-#   Test class for `GET /user/{user_id}.
-
-
-
-
-
-#   """
-
-#   @classmethod
-#   def convert_to_json(self, entity):
-#       return {
-#           key: value
-#           for key, value in entity.model_dump(mode="json").items()
-#           if key != "hashed_password"
-#           and value is not None
-#       }
-
-#   @pytest.fixture(autouse=True)
-#   def user(self, user_fixture):
-#       return user_fixture()
-
-#   @pytest.fixture
-#   def user_json(self, session, user):
-#       session.refresh(user)
-#       return {
-#           key: value
-#           for key, value in user.model_dump(mode="json").items()
-#           if key != "hashed_password"
-#       }
-
-#   @pytest.fixture(autouse=True)
-#   def fosters(self, user, animal_fixture, add_foster_relation):
-#       animals = [animal_fixture(name=name) for name in ["chompers", "waffle party"]]
-#       for animal in animals:
-#           add_foster_relation(user, animal)
-#       return animals
-
-#   @pytest.fixture(autouse=True)
-#   def pets(self, user, animal_fixture, add_adoption_relation):
-#       animals = [animal_fixture(name=name) for name in ["bagels", "paperclip"]]
-#       for animal in animals:
-#           add_adoption_relation(user, animal)
-#       return animals
-
-#   @pytest.fixture(autouse=True)
-#   def other_animals(
-#       self, user_fixture, animal_fixture, add_foster_relation, add_adoption_relation
-#   ):
-#       other_user = user_fixture("other user")
-#       add_foster_relation(other_user, animal_fixture("other foster"))
-#       add_adoption_relation(other_user, animal_fixture("other pet"))
-
-#   def test_get_user(self, client, user, user_json):
-#       response = client.get(f"/users/{user.id}")
-#       assert response.status_code == 200
-#       assert response.json() == {"user": user_json}
-
-#   def test_get_user_with_fosters(self, client, session, user, user_json, fosters):
-#       for foster in fosters:
-#           session.refresh(foster)
-#       session.refresh(user)
-
-#       response = client.get(f"/users/{user.id}?include=fosters")
-#       assert response.status_code == 200
-#       assert response.json() == {
-#           "user": user_json,
-#           "fosters": [foster.model_dump(mode="json") for foster in fosters],
-#       }
-
-#   def test_get_user_with_pets(self, client, session, user, user_json, pets):
-#       for pet in pets:
-#           session.refresh(pet)
-
-#       response = client.get(f"/users/{user.id}?include=pets")
-#       assert response.status_code == 200
-#       assert response.json() == {
-#           "user": user_json,
-#           "pets": [pet.model_dump(mode="json") for pet in pets],
-#       }
-
-#   def test_get_user_with_fosters_and_pets(self, client, session, user, user_json, fosters, pets):
-#       for animal in [*fosters, *pets]:
-#           session.refresh(animal)
-
-#       response = client.get(f"/users/{user.id}?include=pets&include=fosters")
-#       assert response.status_code == 200
-#       assert response.json() == {
-#           "user": user_json,
-#           "pets": [pet.model_dump(mode="json") for pet in pets],
-#           "fosters": [foster.model_dump(mode="json") for foster in fosters],
-#       }
+def test_get_user_pets(client, user_fixture, animal_fixture, add_adoption_relation):
+    user = user_fixture()
+    pet = animal_fixture(name="bagels")
+    animal_fixture(name="chompers")
+    add_adoption_relation(user, pet)
+
+    response = client.get(f"/users/{user.id}/pets")
+    assert response.status_code == 200
+    assert [animal["name"] for animal in response.json()["animals"]] == ["bagels"]
+
+
+def test_get_all_users_ndjson(client, user_fixture):
+    for username in ["juniper", "reginald", "bagels"]:
+        user_fixture(username=username)
+
+    users = client.get("/users").json()["users"]
+    response = client.get("/users", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == users
+
+
+def test_get_user_fosters_ndjson(
+    client, user_fixture, animal_fixture, add_foster_relation
+):
+    user = user_fixture()
+    for name in ["chompers", "waffles"]:
+        add_foster_relation(user, animal_fixture(name=name))
+    add_foster_relation(user_fixture("other user"), animal_fixture(name="bagels"))
+
+    fosters = client.get(f"/users/{user.id}/fosters").json()["fosters"]
+    response = client.get(
+        f"/users/{user.id}/fosters",
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 2
+    assert sorted(lines, key=lambda foster: foster["animal"]["id"]) == sorted(
+        fosters, key=lambda foster: foster["animal"]["id"]
+    )
+
+
+def test_get_user_fosters_ndjson_invalid_user(client):
+    response = client.get("/users/999/fosters", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 404
+
+
+class TestGetUser:
+    """Test class for `GET /users/{user_id}`."""
+
+    @classmethod
+    def convert_to_json(self, entity):
+        return {
+            key: value
+            for key, value in entity.model_dump(mode="json").items()
+            if key != "hashed_password"
+            and value is not None
+        }
+
+    @pytest.fixture(autouse=True)
+    def user(self, user_fixture):
+        return user_fixture()
+
+    @pytest.fixture
+    def user_json(self, session, user):
+        session.refresh(user)
+        return {
+            key: value
+            for key, value in user.model_dump(mode="json").items()
+            if key != "hashed_password"
+        }
+
+    @pytest.fixture(autouse=True)
+    def fosters(self, user, animal_fixture, add_foster_relation):
+        animals = [animal_fixture(name=name) for name in ["chompers", "waffle party"]]
+        for animal in animals:
+            add_foster_relation(user, animal)
+        return animals
+
+    @pytest.fixture(autouse=True)
+    def pets(self, user, animal_fixture, add_adoption_relation):
+        animals = [animal_fixture(name=name) for name in ["bagels", "paperclip"]]
+        for animal in animals:
+            add_adoption_relation(user, animal)
+        return animals
+
+    @pytest.fixture(autouse=True)
+    def other_animals(
+        self, user_fixture, animal_fixture, add_foster_relation, add_adoption_relation
+    ):
+        other_user = user_fixture("other user")
+        add_foster_relation(other_user, animal_fixture("other foster"))
+        add_adoption_relation(other_user, animal_fixture("other pet"))
+
+    def test_get_user(self, client, user, user_json):
+        response = client.get(f"/users/{user.id}")
+        assert response.status_code == 200
+        assert response.json() == {"user": user_json}
+
+    def test_get_user_with_fosters(self, client, session, user, user_json, fosters):
+        for foster in fosters:
+            session.refresh(foster)
+        session.refresh(user)
+
+        response = client.get(f"/users/{user.id}?include=fosters")
+        assert response.status_code == 200
+        assert response.json() == {
+            "user": user_json,
+            "fosters": [foster.model_dump(mode="json", exclude={"version"}) for foster in fosters],
+        }
+
+    def test_get_user_with_pets(self, client, session, user, user_json, pets):
+        for pet in pets:
+            session.refresh(pet)
+
+        response = client.get(f"/users/{user.id}?include=pets")
+        assert response.status_code == 200
+        assert response.json() == {
+            "user": user_json,
+            "pets": [pet.model_dump(mode="json", exclude={"version"}) for pet in pets],
+        }
+
+    def test_get_user_with_fosters_and_pets(self, client, session, user, user_json, fosters, pets):
+        for animal in [*fosters, *pets]:
+            session.refresh(animal)
+
+        response = client.get(f"/users/{user.id}?include=pets&include=fosters")
+        assert response.status_code == 200
+        assert response.json() == {
+            "user": user_json,
+            "pets": [pet.model_dump(mode="json", exclude={"version"}) for pet in pets],
+            "fosters": [foster.model_dump(mode="json", exclude={"version"}) for foster in fosters],
+        }
+
+    def test_get_user_with_comma_separated_include(self, client, user, fosters, pets):
+        response = client.get(f"/users/{user.id}?include=pets,fosters")
+        assert response.status_code == 200
+        assert set(response.json()) == {"user", "pets", "fosters"}
+
+    def test_get_user_with_invalid_include(self, client, user):
+        response = client.get(f"/users/{user.id}?include=pets,friends")
+        assert response.status_code == 422
+        assert response.json() == {
+            "detail": {"type": "invalid_include", "include": ["friends"]},
+        }
+
+    def test_get_user_not_modified(self, client, user, animal_fixture):
+        url = f"/users/{user.id}?include=pets"
+        etag = client.get(url).headers["ETag"]
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        response = client.get(f"/users/{user.id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+
+        pet = animal_fixture(name="waffles")
+        client.put(f"/animals/{pet.id}", json={"adopter_id": user.id})
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert "waffles" in {pet["name"] for pet in response.json()["pets"]}
+
+    def test_get_user_query_count_is_constant(
+        self, client, async_engine, user, animal_fixture, add_adoption_relation
+    ):
+        statements = []
+
+        def _count(*args):
+            statements.append(args)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", _count)
+        client.get(f"/users/{user.id}?include=pets,fosters")
+        query_count = len(statements)
+
+        for name in ["waffles", "pancake", "crepe"]:
+            add_adoption_relation(user, animal_fixture(name=name))
+
+        statements.clear()
+        response = client.get(f"/users/{user.id}?include=pets,fosters")
+        assert len(response.json()["pets"]) == 5
+        # table versions, user, pets and fosters
+        assert len(statements) == query_count == 4
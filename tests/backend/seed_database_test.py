@@ -0,0 +1,52 @@
+from sqlmodel import func, select
+
+from backend import database as db
+from backend import seed_database
+from backend.entities import AnimalCreate, AnimalInDB, FosterInDB, UserInDB
+
+
+def test_generate_animals_is_deterministic():
+    def _generate(seed):
+        return list(seed_database.generate_animals(50, user_ids=range(1, 6), seed=seed))
+
+    assert _generate(seed=1) == _generate(seed=1)
+    assert _generate(seed=1) != _generate(seed=2)
+
+
+def test_generated_fosters_end_before_adoption():
+    for animal, fosters in seed_database.generate_animals(200, user_ids=range(1, 6)):
+        assert len({foster["user_id"] for foster in fosters}) == len(fosters)
+        if animal["adoption_date"] is not None and fosters:
+            assert fosters[-1]["end_date"] < animal["adoption_date"]
+
+
+def test_seed_synthetic_database(engine, session):
+    result = seed_database.seed_synthetic_database(
+        users=20,
+        animals=300,
+        chunk_size=64,
+        bind=engine,
+    )
+
+    assert result["user_count"] == 20
+    assert result["animal_count"] == 300
+    assert session.exec(select(func.count()).select_from(UserInDB)).one() == 20
+    assert session.exec(select(func.count()).select_from(AnimalInDB)).one() == 300
+    assert (
+        session.exec(select(func.count()).select_from(FosterInDB)).one()
+        == result["foster_count"]
+    )
+
+    # a second run continues the ids instead of colliding with them
+    seed_database.seed_synthetic_database(users=5, animals=10, seed=1, bind=engine)
+    assert session.exec(select(func.max(UserInDB.id))).one() == 25
+    assert session.exec(select(func.max(AnimalInDB.id))).one() == 310
+
+
+def test_insert_after_seed(engine, session):
+    seed_database.seed_synthetic_database(users=3, animals=5, bind=engine)
+
+    # ids are assigned by the database again after the seeded ones
+    animal = db.create_animal(session, AnimalCreate(name="mochi", age=2, kind="cat"))
+    user = db.create_user(session, username="new", email="new@cool.email", hashed_password="x")
+    assert (animal.id, user.id) == (6, 4)
@@ -0,0 +1,60 @@
+import json
+
+from sqlmodel import select
+
+from backend import database as db
+from backend.entities import (
+    Animal,
+    AnimalCollection,
+    AnimalInDB,
+    Metadata,
+    PageMetadata,
+    User,
+    UserCollection,
+    UserInDB,
+)
+from backend.serialization import dump_collection
+
+
+def _encode_like_fastapi(response) -> bytes:
+    # what FastAPI sends for a `response_model`, see `JSONResponse.render`
+    return json.dumps(
+        response.model_dump(mode="json"),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode()
+
+
+def test_dump_animal_collection(session, animal_fixture, user_fixture, add_adoption_relation):
+    animal_fixture(name="chömpers \"the\" cat")
+    add_adoption_relation(user_fixture(), animal_fixture(name="bagels 🥯"))
+    animal_fixture(name="line\nbreak ")
+
+    meta = PageMetadata(count=3, limit=100, next_cursor="abc")
+    rows = session.exec(select(*db.ANIMAL_COLUMNS)).all()
+    instances = session.exec(select(AnimalInDB)).all()
+
+    assert dump_collection(meta, "animals", Animal, rows) == _encode_like_fastapi(
+        AnimalCollection(meta=meta, animals=instances)
+    )
+
+
+def test_dump_user_collection(session, user_fixture):
+    user_fixture(username="juniper")
+    user_fixture(username="rëginald")
+
+    meta = Metadata(count=2)
+    rows = session.exec(select(*db.USER_COLUMNS)).all()
+    instances = session.exec(select(UserInDB)).all()
+
+    assert dump_collection(meta, "users", User, rows) == _encode_like_fastapi(
+        UserCollection(meta=meta, users=instances)
+    )
+
+
+def test_dump_empty_collection():
+    assert dump_collection(Metadata(count=0), "users", User, []) == (
+        b'{"meta":{"count":0},"users":[]}'
+    )
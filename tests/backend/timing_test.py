@@ -0,0 +1,68 @@
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.timing import TimingMiddleware
+
+
+def _parse_server_timing(header: str) -> dict[str, dict]:
+    metrics = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+@pytest.fixture
+def timed_client(override_sessions):
+    # as with `SERVER_TIMING=1`, which the app is imported without
+    return TestClient(TimingMiddleware(app, server_timing=True))
+
+
+def test_server_timing_off_by_default(client):
+    response = client.get("/animals")
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+
+def test_server_timing_counts_queries(timed_client, animal_fixture):
+    animal_fixture()
+
+    response = timed_client.get("/animals")
+    assert response.status_code == 200
+
+    metrics = _parse_server_timing(response.headers["Server-Timing"])
+    assert float(metrics["total"]["dur"]) >= float(metrics["db"]["dur"]) > 0
+    # table versions for the ETag, the page and the count
+    assert metrics["db"]["desc"] == '"3 queries"'
+
+
+def test_server_timing_on_error_response(timed_client):
+    response = timed_client.get("/animals/999")
+    assert response.status_code == 404
+    assert "Server-Timing" in response.headers
+
+
+@pytest.mark.parametrize("profile_rate, expected_profiles", [(0.0, 0), (1.0, 2)])
+def test_profiler_writes_sampled_requests(tmp_path, profile_rate, expected_profiles):
+    app = FastAPI()
+    app.add_middleware(
+        TimingMiddleware,
+        profile_rate=profile_rate,
+        profile_dir=str(tmp_path),
+    )
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+
+    profiles = sorted(path.name for path in tmp_path.iterdir())
+    assert len(profiles) == expected_profiles
+    assert all(re.fullmatch(r"\d{8}T\d+-GET-items_item_id.prof", name) for name in profiles)